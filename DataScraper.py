@@ -4,6 +4,7 @@ import pickle
 import sys
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
 import config
@@ -80,6 +81,111 @@ def get_column_value(row, possible_names):
     return ''
 
 
+def _row_values(df):
+    """Column name -> the values ``df.iterrows()`` rows would hold for it.
+
+    Rows share one dtype (``df.values``): in an all-numeric frame ints come
+    out as floats, just as they do from ``iterrows``.
+    """
+    values = df.values
+    return {name: values[:, j] for j, name in enumerate(df.columns)}
+
+
+def _text_column(columns, name):
+    """``str(row.get(name, ''))`` for every row."""
+    values = columns.get(name)
+    if values is None:
+        return None
+    return pd.Series(list(map(str, values)), dtype=object)
+
+
+def _stripped_column(columns, name):
+    """Stripped text of every row, ``''`` where :func:`clean_value` sees a blank."""
+    text = _text_column(columns, name)
+    if text is None:
+        return None
+    stripped = text.str.strip()
+    blank = pd.isna(columns[name]) | (stripped == '') | (text.str.lower() == 'nan')
+    return stripped.mask(blank, '')
+
+
+def _clean_column(columns, name):
+    """:func:`clean_value` applied to every row of a column."""
+    stripped = _stripped_column(columns, name)
+    if stripped is None:
+        return None
+    return stripped.mask(stripped.str.endswith('.0'), stripped.str[:-2])
+
+
+def _clean_miles_column(columns, name):
+    """:func:`clean_miles_value` applied to every row of a column."""
+    cleaned = _stripped_column(columns, name)
+    if cleaned is None:
+        return None
+    return cleaned.mask((cleaned == '') | (cleaned.str.lower() == 'nan'), '0.0')
+
+
+def _invoice_items(df):
+    """Build the invoice items for every row, one column operation per field.
+
+    Same result as calling :func:`clean_value`, :func:`clean_miles_value`
+    and :func:`get_column_value` row by row: rows whose date and Record ID
+    are both empty are skipped, missing columns give ``''`` (``'0.0'`` for
+    miles) and the NHS number comes from the first Passenger UPC alias
+    present.
+    """
+    columns = _row_values(df)
+    n_rows = len(df)
+
+    date = _text_column(columns, 'Start Date')
+    our_ref = _clean_column(columns, 'Record ID')
+
+    # Skip rows where both date and our_ref are 'nan' or empty
+    if date is None:
+        date = pd.Series([''] * n_rows, dtype=object)
+        date_is_nan = np.ones(n_rows, dtype=bool)
+    else:
+        date = date.str.strip()
+        date_is_nan = ((date.str.lower() == 'nan') | (date == '') | pd.isna(columns['Start Date'])).to_numpy()
+    if our_ref is None:
+        our_ref = pd.Series([''] * n_rows, dtype=object)
+        ref_is_nan = np.ones(n_rows, dtype=bool)
+    else:
+        ref_is_nan = ((our_ref.str.lower() == 'nan') | (our_ref == '') | pd.isna(columns['Record ID'])).to_numpy()
+    keep = np.flatnonzero(~(date_is_nan & ref_is_nan))
+
+    upc_column = next((name for name in ['Passenger UPC', 'PassengerUPC', 'Passenger UPC Code'] if name in columns), None)
+
+    def kept(values, default=''):
+        if values is None:
+            return [default] * len(keep)
+        return values.to_numpy()[keep].tolist()
+
+    fields = {
+        '_source_row_index': keep.tolist(),
+        'date': kept(date),
+        'our_ref': kept(our_ref),  # Already cleaned (removes .0 suffix)
+        'client_ref': kept(_clean_column(columns, 'Pas Number')),
+        'nhs_number': kept(_clean_column(columns, upc_column)),
+        'contract_hospital': kept(_text_column(columns, 'Contract Hospital Text')),
+        'booked_by': kept(_clean_column(columns, 'Caller')),
+        'from_location': kept(_text_column(columns, 'From Postcode')),
+        'to_location': kept(_text_column(columns, 'To Postcode')),
+        'status': kept(_text_column(columns, 'Jrny Status Text')),
+        'directions': kept(_text_column(columns, 'Direction Text')),
+        'mob': kept(_clean_column(columns, 'Mobility Abbreviation')),
+        'wait_pounds': kept(None),
+        'wait_notes': kept(_text_column(columns, 'Waiting Time Reason')),
+        'miles': kept(_clean_miles_column(columns, 'Actual Mileage'), '0.0'),
+        'charged': kept(None),
+        'miles_pounds': kept(None),
+        'job_pounds': kept(None),
+        'total': kept(None),
+    }
+    names = list(fields)
+    return [dict(zip(names, row)) for row in zip(*fields.values())]
+
+
 def transform_dataframe_to_invoice_data(df):
     """
     Transform the cleaned DataFrame into the invoice data structure.
@@ -108,41 +214,7 @@ def transform_dataframe_to_invoice_data(df):
     patient_postcode = str(first_row.get('Patient Postcode', '')).strip()
     
     # Transform each row into an invoice item
-    invoice_items = []
-    for row_idx, (_, row) in enumerate(df.iterrows()):
-        # Get date and our_ref, cleaning them
-        date_value = str(row.get('Start Date', '')).strip()
-        our_ref_value = clean_value(row.get('Record ID', ''))
-        
-        # Check if both date and our_ref are 'nan' or empty - if so, skip this item
-        date_is_nan = (date_value.lower() == 'nan' or date_value == '' or pd.isna(row.get('Start Date', '')))
-        ref_is_nan = (our_ref_value.lower() == 'nan' or our_ref_value == '' or pd.isna(row.get('Record ID', '')))
-        
-        if date_is_nan and ref_is_nan:
-            continue  # Skip this item
-        
-        item = {
-            '_source_row_index': row_idx,
-            'date': date_value,
-            'our_ref': our_ref_value,  # Already cleaned (removes .0 suffix)
-            'client_ref': clean_value(row.get('Pas Number', '')),
-            'nhs_number': clean_value(get_column_value(row, ['Passenger UPC', 'PassengerUPC', 'Passenger UPC Code'])),
-            'contract_hospital': str(row.get('Contract Hospital Text', '')),
-            'booked_by': clean_value(row.get('Caller', '')),
-            'from_location': str(row.get('From Postcode', '')),
-            'to_location': str(row.get('To Postcode', '')),
-            'status': str(row.get('Jrny Status Text', '')),
-            'directions': str(row.get('Direction Text', '')),
-            'mob': clean_value(row.get('Mobility Abbreviation', '')),
-            'wait_pounds': '',
-            'wait_notes': str(row.get('Waiting Time Reason', '')),
-            'miles': clean_miles_value(row.get('Actual Mileage', '')),
-            'charged': '',
-            'miles_pounds': '',
-            'job_pounds': '',
-            'total': ''
-        }
-        invoice_items.append(item)
+    invoice_items = _invoice_items(df)
     
     # Create the invoice data structure
     invoice_data = {
@@ -4,8 +4,10 @@ Creates the FastAPI app, registers middleware, mounts static files,
 includes all route modules, and provides the exception handler.
 """
 
+import asyncio
 import logging
 import os
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request, HTTPException, status
 
@@ -20,14 +22,54 @@ from fastapi.responses import JSONResponse, RedirectResponse, Response
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.sessions import SessionMiddleware
 
+import columnar_cache
 import config
-from routes import auth, stage1, stage2, stage3, invoice, summary
+import executors
+import jobs
+import session_manager
+import session_reaper
+from routes import auth, stage1, stage2, stage3, invoice, summary, system, jobs as job_routes
+
+# ---------------------------------------------------------------------------
+# Ensure required directories exist
+# ---------------------------------------------------------------------------
+
+for _dir in (config.UPLOADS_DIR, config.INVOICE_HTML_DIR, config.TEMP_DIR, config.STATIC_DIR):
+    os.makedirs(_dir, exist_ok=True)
+
+# ---------------------------------------------------------------------------
+# Lifespan
+# ---------------------------------------------------------------------------
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Rebuild the session registry from disk, start the executors, the temp-directory reaper and the job runner.
+
+    On shutdown the reaper is cancelled, running jobs go back to the queue and
+    the executors and the columnar sidecar builder are stopped.
+    """
+    session_manager.rebuild_registry()
+    executors.start()
+    reaper_task = session_reaper.start()
+    jobs.start()
+    yield
+    if reaper_task is not None:
+        reaper_task.cancel()
+        try:
+            await reaper_task
+        except asyncio.CancelledError:
+            pass
+    await jobs.stop()
+    executors.shutdown()
+    columnar_cache.shutdown()
+
 
 # ---------------------------------------------------------------------------
 # App instance
 # ---------------------------------------------------------------------------
 
-app = FastAPI(title="Batch Invoicer", description="Convert XLSX to CSV and generate invoices")
+app = FastAPI(title="Batch Invoicer", description="Convert XLSX to CSV and generate invoices", lifespan=lifespan)
 
 # ---------------------------------------------------------------------------
 # Middleware
@@ -39,13 +81,7 @@ app.add_middleware(
     same_site=config.COOKIE_SAMESITE,
     https_only=config.SESSION_HTTPS_ONLY,
 )
-
-# ---------------------------------------------------------------------------
-# Ensure required directories exist
-# ---------------------------------------------------------------------------
-
-for _dir in (config.UPLOADS_DIR, config.INVOICE_HTML_DIR, config.TEMP_DIR, config.STATIC_DIR):
-    os.makedirs(_dir, exist_ok=True)
+app.add_middleware(session_manager.SessionLeaseMiddleware)
 
 # ---------------------------------------------------------------------------
 # Static files
@@ -64,6 +100,8 @@ app.include_router(stage2.router)
 app.include_router(stage3.router)
 app.include_router(invoice.router)
 app.include_router(summary.router)
+app.include_router(system.router)
+app.include_router(job_routes.router)
 
 # ---------------------------------------------------------------------------
 # Global handlers
@@ -0,0 +1,103 @@
+"""
+Benchmark: creating a batch of invoices, sequential vs the batch pipeline.
+
+Splits a Cleric-style export (``--rows`` rows over ``--codes`` budget codes)
+into per-code CSVs, then builds a batch from them the way
+``/api/get-conversion-files`` used to — ``process_csv_to_invoice`` one file
+after another — and with ``csv_service.build_invoice_batch`` at increasing
+CPU worker counts (up to the CPU count).  Pools are warmed up before timing,
+and every run must produce the same invoices in the same order.
+
+    python benchmarks/batch_build.py [--rows 200000] [--codes 200]
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+WORK = tempfile.mkdtemp(prefix="batch_build_")
+os.environ["TEMP_DIR"] = os.path.join(WORK, "temp")
+
+import config  # noqa: E402
+import divider  # noqa: E402
+import executors  # noqa: E402
+import session_manager  # noqa: E402
+from csv_ingest import write_export  # noqa: E402
+from pipeline import add_budget_codes  # noqa: E402
+from services import csv_service  # noqa: E402
+
+
+def comparable(invoices: list[dict]) -> list:
+    return [(i['filename'], i['invoice_data'], i['source_headers'], i['index']) for i in invoices]
+
+
+def sequential(csv_files: list) -> list[dict]:
+    _batch_id, batch_dir = session_manager.create_session_dir("batch_")
+    return [
+        csv_service.process_csv_to_invoice(path, batch_dir, index, sha256)
+        for index, (path, sha256) in enumerate(csv_files)
+    ]
+
+
+def pipelined(csv_files: list, workers: int) -> tuple[float, list[dict]]:
+    config.CPU_WORKERS = workers
+    executors.shutdown()
+
+    async def build(files):
+        _batch_id, batch_dir = session_manager.create_session_dir("batch_")
+        invoices, failures = await csv_service.build_invoice_batch(batch_dir, files)
+        assert not failures, failures
+        return invoices
+
+    async def timed():
+        await build(csv_files[:workers])  # warm-up: start every worker
+        start = time.perf_counter()
+        invoices = await build(csv_files)
+        return time.perf_counter() - start, invoices
+
+    try:
+        return asyncio.run(timed())
+    finally:
+        executors.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--codes", type=int, default=200)
+    args = parser.parse_args()
+
+    try:
+        session_manager.rebuild_registry()
+        csv_path = os.path.join(WORK, "cleric.csv")
+        write_export(csv_path, args.rows, 40)
+        add_budget_codes(csv_path, args.codes)
+        split_dir = os.path.join(WORK, "split")
+        os.makedirs(split_dir)
+        csv_files = [(path, None) for path, _rows in divider.split_csv_by_budget_code(csv_path, split_dir)]
+        print(f"batch: {len(csv_files)} CSVs from {args.rows:,} rows, {os.cpu_count()} CPU(s)")
+
+        start = time.perf_counter()
+        expected = comparable(sequential(csv_files))
+        baseline = time.perf_counter() - start
+        print(f"  {'sequential':>10}: {baseline:6.2f}s")
+
+        workers = 1
+        while workers <= (os.cpu_count() or 1):
+            elapsed, invoices = pipelined(csv_files, workers)
+            print(f"  {workers:>2} worker{'s' if workers > 1 else ' '}: {elapsed:6.2f}s  {baseline / elapsed:4.1f}x")
+            assert comparable(invoices) == expected, f"{workers} workers: invoices differ"
+            workers *= 2
+        print("  invoices identical, same order")
+    finally:
+        shutil.rmtree(WORK, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
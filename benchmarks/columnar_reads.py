@@ -0,0 +1,78 @@
+"""
+Benchmark: stage-2 reads of a stage-1 CSV, from the CSV vs its Arrow sidecar.
+
+Writes a budget-code CSV the way stage 1 leaves it (``--rows`` rows x
+``--cols`` columns), builds its sidecar, and times what later stages do with
+it: ``csv_to_dataframe`` (19 columns, identifiers as text), the header read
+when an invoice is created, and the full read behind every summary build.
+Each read must return exactly the frame the CSV parse returns.
+
+    python benchmarks/columnar_reads.py [--rows 20000] [--cols 120] [--repeat 5]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import columnar_cache  # noqa: E402
+import config  # noqa: E402
+import csv_cleaner  # noqa: E402
+from csv_ingest import write_export  # noqa: E402
+
+
+def best_of(repeat: int, fn, *args):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--cols", type=int, default=120)
+    parser.add_argument("--repeat", type=int, default=5, help="best of N runs")
+    args = parser.parse_args()
+
+    if not columnar_cache.available():
+        sys.exit("pyarrow is not installed (pip install pyarrow)")
+
+    work = tempfile.mkdtemp(prefix="columnar_reads_")
+    try:
+        csv_path = os.path.join(work, "BARTS_HDU.csv")
+        write_export(csv_path, args.rows, args.cols)
+        start = time.perf_counter()
+        assert columnar_cache.write_sidecar(csv_path), "sidecar not written"
+        print(f"{args.rows:,} rows x {args.cols} cols: CSV {os.path.getsize(csv_path) / 1e6:.1f} MB, "
+              f"sidecar {os.path.getsize(columnar_cache.sidecar_path(csv_path)) / 1e6:.1f} MB "
+              f"(built in {time.perf_counter() - start:.2f}s)")
+
+        reads = [
+            ("csv_to_dataframe", csv_cleaner.csv_to_dataframe),
+            ("header", columnar_cache.read_header),
+            ("full frame (summary)", columnar_cache.read_csv),
+        ]
+        for label, fn in reads:
+            config.COLUMNAR_CACHE = False
+            parsed_time, parsed = best_of(args.repeat, fn, csv_path)
+            config.COLUMNAR_CACHE = True
+            cached_time, cached = best_of(args.repeat, fn, csv_path)
+            if label == "header":
+                assert cached == parsed, label
+            else:
+                assert columnar_cache._same_frame(cached, parsed), f"{label}: frames differ"
+            print(f"  {label:>22}: CSV {parsed_time * 1000:8.1f} ms, sidecar {cached_time * 1000:7.1f} ms "
+                  f"({parsed_time / cached_time:.0f}x)")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Benchmark: csv_cleaner.csv_to_dataframe, projected/typed read vs full read.
+
+Writes a Cleric-style export with ``--cols`` columns (the 19 the invoice
+needs plus filler) and loads it with the previous path — read every column,
+infer types, keep 19 — and with the current one, which reads the header,
+parses only the kept columns and reads identifiers as text.  Each runs in a
+fresh subprocess reporting parse time and peak RSS.  The values the invoice
+builder takes from the frame (identifiers through ``clean_value``, other
+columns through ``str``) must be the same either way, bar the identifiers
+with leading zeros the old path lost.
+
+    python benchmarks/csv_ingest.py [--rows 200000] [--cols 120]
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+
+def write_export(path: str, n_rows: int, n_cols: int) -> None:
+    import csv_cleaner
+
+    rnd = random.Random(3)
+    filler = [f"Field {i}" for i in range(n_cols - len(csv_cleaner.COLUMNS_TO_KEEP))]
+    header = filler[: len(filler) // 2] + csv_cleaner.COLUMNS_TO_KEEP + filler[len(filler) // 2:]
+    with open(path, "w", newline="") as f:
+        f.write(",".join(f'"{name}"' for name in header) + "\n")
+        for i in range(n_rows):
+            values = {
+                "Start Date": f"{1 + i % 28:02d}/07/2025",
+                "Record ID": "" if i % 97 == 0 else str(5_000_000 + i),  # blanks: float column before
+                "Pas Number": f"{i % 100000:06d}" if i % 10 == 0 else str(700000 + i % 90000),
+                "Passenger UPC": "" if i % 13 == 0 else str(4000000000 + i),
+                "Contract Hospital Text": "Barts Health",
+                "Caller": f"Ward {i % 30}",
+                "From Postcode": "E1 1BB",
+                "To Postcode": "SE3 9BY",
+                "Direction Text": "Outbound" if i % 2 else "Return",
+                "Jrny Status Text": "Completed",
+                "Actual Mileage": "" if i % 11 == 0 else f"{rnd.uniform(1, 30):.1f}",
+                "Mobility Abbreviation": rnd.choice(["WC", "AMB", "S1", "2"]),
+                "Waiting Time Reason": "" if i % 5 else "Late discharge",
+                "Forename": "Ann",
+                "Surname": f"Smith{i % 300}",
+                "Patient Road": f"{i % 200} High Street",
+                "Patient Town": "London",
+                "Patient Postcode": "E2 7QX",
+                "Start Date range": "Jul 2025",
+            }
+            row = [values.get(name, str(rnd.randrange(1000)) if j % 3 else "lorem ipsum")
+                   for j, name in enumerate(header)]
+            f.write(",".join(row) + "\n")
+
+
+def legacy_csv_to_dataframe(csv_file_path):
+    """The full-read-then-filter loader this benchmark compares against."""
+    import pandas as pd
+    import csv_cleaner
+
+    df = pd.read_csv(csv_file_path)
+    return df[[col for col in csv_cleaner.COLUMNS_TO_KEEP if col in df.columns]]
+
+
+def legacy_clean_value(value):
+    import pandas as pd
+
+    if pd.isna(value) or value is None or str(value).strip() == '' or str(value).lower() == 'nan':
+        return ''
+    value_str = str(value).strip()
+    if value_str.endswith('.0'):
+        value_str = value_str[:-2]
+    return value_str
+
+
+def child(path_kind: str, csv_path: str, out_path: str) -> None:
+    import csv_cleaner
+    import DataScraper
+
+    loader = legacy_csv_to_dataframe if path_kind == "legacy" else csv_cleaner.csv_to_dataframe
+    clean = legacy_clean_value if path_kind == "legacy" else DataScraper.clean_value
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    df = loader(csv_path)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # The values transform_dataframe_to_invoice_data would take from each column
+    values = {
+        col: [clean(v) for v in df[col]] if col in csv_cleaner.IDENTIFIER_COLUMNS
+        else [DataScraper.clean_miles_value(v) for v in df[col]] if col == "Actual Mileage"
+        else [str(v) for v in df[col]]
+        for col in df.columns
+    }
+    with open(out_path, "w") as f:
+        json.dump(values, f)
+    print(json.dumps({"elapsed": elapsed, "baseline_kb": baseline, "peak_kb": peak}))
+
+
+def run(path_kind: str, csv_path: str, out_path: str) -> dict:
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", path_kind, csv_path, out_path],
+        check=True, capture_output=True, text=True, cwd=ROOT,
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--cols", type=int, default=120)
+    parser.add_argument("--child", nargs=3, metavar=("PATH", "CSV", "OUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    work = tempfile.mkdtemp(prefix="csv_ingest_")
+    try:
+        csv_path = os.path.join(work, "cleric.csv")
+        write_export(csv_path, args.rows, args.cols)
+        print(f"export: {args.rows:,} rows x {args.cols} cols, {os.path.getsize(csv_path) / 1e6:.0f} MB")
+
+        results = {}
+        for kind in ("legacy", "projected"):
+            r = results[kind] = run(kind, csv_path, os.path.join(work, f"{kind}.json"))
+            print(f"{kind:>10}: {r['elapsed']:6.2f}s  peak RSS {r['peak_kb'] / 1024:6.0f} MB  "
+                  f"(+{(r['peak_kb'] - r['baseline_kb']) / 1024:.0f} MB over imports)")
+        print(f"  {results['legacy']['elapsed'] / results['projected']['elapsed']:.1f}x faster")
+
+        with open(os.path.join(work, "legacy.json")) as f:
+            legacy = json.load(f)
+        with open(os.path.join(work, "projected.json")) as f:
+            projected = json.load(f)
+        assert list(legacy) == list(projected), "columns differ"
+        for col in legacy:
+            diffs = [(a, b) for a, b in zip(legacy[col], projected[col]) if a != b]
+            # Only zero-padded references may change, and only by keeping their zeros
+            assert all(b.lstrip("0") == a.lstrip("0") for a, b in diffs), f"{col}: {diffs[:3]}"
+            if diffs:
+                print(f"  {col}: {len(diffs):,} values keep leading zeros the old path dropped ({diffs[0]})")
+        print("  all other values identical")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark: download-all ZIP, render-then-zip vs the streaming batch renderer.
+
+Builds a batch of ``--invoices`` invoices of ``--items`` journeys and
+produces its download-all ZIP the way ``/api/download-all-invoices`` used
+to — render each invoice to a file, one after another, then write the ZIP
+and send it — and with ``export_service.stream_invoices_zip``, timing when
+the first bytes are ready and when the ZIP is complete.  Pools are warmed up
+before timing, and both ZIPs must hold the same members in the same order.
+
+    python benchmarks/download_all.py [--invoices 300] [--items 20]
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+WORK = tempfile.mkdtemp(prefix="download_all_")
+os.environ["JINJA_BYTECODE_DIR"] = os.path.join(WORK, "bytecode")
+
+import csv_cleaner  # noqa: E402
+import executors  # noqa: E402
+from csv_ingest import write_export  # noqa: E402
+from DataScraper import transform_dataframe_to_invoice_data  # noqa: E402
+from services.export_service import stream_invoices_zip  # noqa: E402
+from services.invoice_service import render_invoice_html  # noqa: E402
+from session_store import InvoiceState  # noqa: E402
+
+
+def write_html(path: str, html: str) -> str:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(html)
+    return path
+
+
+async def previous(batch_dir: str, states: list[InvoiceState]) -> tuple[float, float, bytes]:
+    """The previous behaviour: every render, then the whole ZIP, then the response."""
+    start = time.perf_counter()
+    html_dir = os.path.join(batch_dir, "previous")
+    os.makedirs(html_dir, exist_ok=True)
+    html_files = []
+    for state in states:
+        html = await executors.run_cpu(render_invoice_html, state.invoice_data)
+        html_files.append(await executors.run_io(write_html, os.path.join(html_dir, f"{state.stem}_invoice.html"), html))
+    zip_path = os.path.join(batch_dir, "previous.zip")
+
+    def build_zip():
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            for html_file in html_files:
+                zipf.write(html_file, Path(html_file).name)
+
+    await executors.run_io(build_zip)
+    with open(zip_path, "rb") as f:
+        data = f.read()
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed, data
+
+
+async def streamed(batch_dir: str, states: list[InvoiceState]) -> tuple[float, float, bytes]:
+    start = time.perf_counter()
+    first = None
+    chunks = []
+    async for chunk in stream_invoices_zip(batch_dir, states):
+        if chunk and first is None:
+            first = time.perf_counter() - start
+        chunks.append(chunk)
+    return first, time.perf_counter() - start, b"".join(chunks)
+
+
+def members(data: bytes) -> list[tuple[str, bytes]]:
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        return [(name, zf.read(name)) for name in zf.namelist()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--invoices", type=int, default=300)
+    parser.add_argument("--items", type=int, default=20)
+    args = parser.parse_args()
+
+    try:
+        csv_path = os.path.join(WORK, "invoice.csv")
+        write_export(csv_path, args.items, 40)
+        invoice_data = transform_dataframe_to_invoice_data(csv_cleaner.csv_to_dataframe(csv_path))
+        states = [
+            InvoiceState(invoice_id=f"inv{i:04d}", invoice_data=invoice_data, source_filename=f"code_{i:04d}.csv")
+            for i in range(args.invoices)
+        ]
+        batch_dir = os.path.join(WORK, "batch")
+        os.makedirs(batch_dir)
+        print(f"batch: {args.invoices} invoices of {len(invoice_data['invoice']['items'])} items, "
+              f"{executors.cpu_workers()} CPU worker(s)")
+
+        async def run():
+            await streamed(batch_dir, states[:2 * executors.cpu_workers()])  # warm-up
+            return await previous(batch_dir, states), await streamed(batch_dir, states)
+
+        try:
+            before, after = asyncio.run(run())
+        finally:
+            executors.shutdown()
+        for label, (first, total, data) in (("previous", before), ("streamed", after)):
+            print(f"  {label:>9}: first bytes {first * 1000:8.1f} ms, complete {total:6.2f}s, "
+                  f"{len(data) / 1e6:6.1f} MB")
+        assert members(before[2]) == members(after[2]), "ZIP members differ"
+        print("  ZIP members identical, same order")
+    finally:
+        shutil.rmtree(WORK, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark: how long other requests wait while a batch download runs.
+
+Builds a batch from a Cleric-style export (``--rows`` rows over ``--codes``
+budget codes) through ``/api/convert-to-invoices``, then posts
+``/api/download-all-invoices`` while a probe requests a cheap endpoint
+(``/api/system/executors``) every 10 ms.  The longest gap between probe
+replies is how long a login or preview could have waited.  Two runs:
+
+* inline — ``executors.run_io``/``run_cpu`` call the function directly on the
+  event loop, as the routes did before;
+* executors — the I/O thread pool and CPU process pool.
+
+Both downloads must hold the same files with the same contents.
+
+    python benchmarks/event_loop.py [--rows 20000] [--codes 40]
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+WORK = tempfile.mkdtemp(prefix="event_loop_")
+for _name in ("TEMP_DIR", "INVOICE_HTML_DIR", "UPLOADS_DIR"):
+    os.environ[_name] = os.path.join(WORK, _name.lower())
+
+import httpx  # noqa: E402
+
+import app as app_module  # noqa: E402
+import executors  # noqa: E402
+from csv_ingest import write_export  # noqa: E402
+from dependencies import require_auth  # noqa: E402
+from pipeline import add_budget_codes  # noqa: E402
+
+
+async def _inline(fn, *args, **kwargs):
+    return fn(*args, **kwargs)
+
+
+async def download_with_probe(client: httpx.AsyncClient, batch_session_id: str) -> tuple[bytes, float, list]:
+    """Download the batch ZIP; return ``(body, seconds, probe reply times)``."""
+    replies = []
+    download = asyncio.create_task(
+        client.post("/api/download-all-invoices", data={"batch_session_id": batch_session_id})
+    )
+    start = time.perf_counter()
+    while not download.done():
+        await client.get("/api/system/executors")
+        replies.append(time.perf_counter())
+        await asyncio.sleep(0.01)
+    response = await download
+    elapsed = time.perf_counter() - start
+    assert response.status_code == 200, response.text
+    return response.content, elapsed, [start] + replies + [time.perf_counter()]
+
+
+async def run(csv_path: str) -> dict:
+    app = app_module.app
+    app.dependency_overrides[require_auth] = lambda: "bench"
+    results = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            with open(csv_path, "rb") as f:
+                response = await client.post("/api/convert-to-invoices", files={"file": ("cleric.csv", f, "text/csv")})
+            assert response.status_code == 200, response.text
+            batch = response.json()
+            print(f"batch: {batch['total_count']} invoices")
+            await download_with_probe(client, batch["batch_session_id"])  # warm the CPU pool and caches
+
+            run_io, run_cpu = executors.run_io, executors.run_cpu
+            for label in ("inline", "executors"):
+                if label == "inline":
+                    executors.run_io = executors.run_cpu = _inline
+                else:
+                    executors.run_io, executors.run_cpu = run_io, run_cpu
+                body, elapsed, replies = await download_with_probe(client, batch["batch_session_id"])
+                results[label] = body
+                worst = max(b - a for a, b in zip(replies, replies[1:]))
+                print(f"  {label:>9}: download {elapsed:6.2f}s  {len(replies) - 2:4d} probes answered, "
+                      f"longest wait {worst * 1000:8.1f} ms")
+            executors.run_io, executors.run_cpu = run_io, run_cpu
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--codes", type=int, default=40)
+    args = parser.parse_args()
+
+    try:
+        csv_path = os.path.join(WORK, "cleric.csv")
+        write_export(csv_path, args.rows, 40)
+        add_budget_codes(csv_path, args.codes)
+        results = asyncio.run(run(csv_path))
+
+        inline, pooled = (zipfile.ZipFile(io.BytesIO(results[k])) for k in ("inline", "executors"))
+        assert inline.namelist() == pooled.namelist(), "ZIP members differ"
+        for name in inline.namelist():
+            assert inline.read(name) == pooled.read(name), f"{name} differs"
+        print(f"  both ZIPs identical ({len(inline.namelist())} files)")
+    finally:
+        shutil.rmtree(WORK, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Benchmark: invoice images, re-encoded per render vs cached, embedded vs linked.
+
+Renders ``--invoices`` paid invoices of ``--items`` journeys the previous
+way — read and base64-encode the logo and PAID stamp on every render and
+splice them in with a ``str.replace`` pass over the whole document each —
+and with the cached data URIs the template writes in directly; both must
+produce the same HTML (the render cache is disabled).  Then builds the
+download-all ZIP of the batch with ``build_invoices_zip`` in embedded and
+linked-asset mode and compares the HTML carried and the ZIP size.
+
+    python benchmarks/invoice_assets.py [--invoices 200] [--items 20]
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+WORK = tempfile.mkdtemp(prefix="invoice_assets_")
+os.environ["JINJA_BYTECODE_DIR"] = os.path.join(WORK, "bytecode")
+os.environ["RENDER_CACHE_DIR"] = ""
+
+import config  # noqa: E402
+import csv_cleaner  # noqa: E402
+import executors  # noqa: E402
+from csv_ingest import write_export  # noqa: E402
+from DataScraper import transform_dataframe_to_invoice_data  # noqa: E402
+from services import invoice_service  # noqa: E402
+from services.export_service import build_invoices_zip  # noqa: E402
+from session_store import InvoiceState  # noqa: E402
+
+
+def render_previous(invoice_data: dict, stem: str) -> str:
+    """The previous behaviour: encode both images per render, one replace pass each."""
+    html = invoice_service.render_invoice_html(invoice_data, embed_image=False)
+    logo = config.BASE_DIR / config.STATIC_DIR / config.LOGO_FILENAME
+    with open(logo, "rb") as f:
+        html = html.replace(f"/static/{config.LOGO_FILENAME}",
+                            f"data:image/jpeg;base64,{base64.b64encode(f.read()).decode('utf-8')}")
+    stamp = config.BASE_DIR / config.STATIC_DIR / config.PAID_STAMP_FILENAME
+    with open(stamp, "rb") as f:
+        html = html.replace(f"/static/{config.PAID_STAMP_FILENAME}",
+                            f"data:image/png;base64,{base64.b64encode(f.read()).decode('utf-8')}")
+    return html
+
+
+def render_cached(invoice_data: dict, stem: str) -> str:
+    return invoice_service.render_invoice_html(invoice_data)
+
+
+def time_batch(render, states: list[InvoiceState]) -> tuple[list[float], list[str]]:
+    times, pages = [], []
+    for state in states:
+        start = time.perf_counter()
+        pages.append(render(state.invoice_data, state.stem))
+        times.append(time.perf_counter() - start)
+    return times, pages
+
+
+def zip_stats(zip_path: str) -> tuple[int, int, int]:
+    """(HTML bytes, all bytes uncompressed, ZIP file size)."""
+    with zipfile.ZipFile(zip_path) as zf:
+        infos = zf.infolist()
+    html = sum(i.file_size for i in infos if i.filename.endswith(".html"))
+    return html, sum(i.file_size for i in infos), os.path.getsize(zip_path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--invoices", type=int, default=200)
+    parser.add_argument("--items", type=int, default=20)
+    args = parser.parse_args()
+
+    try:
+        csv_path = os.path.join(WORK, "invoice.csv")
+        write_export(csv_path, args.items, 40)
+        invoice_data = transform_dataframe_to_invoice_data(csv_cleaner.csv_to_dataframe(csv_path))
+        invoice_data["paid"] = True
+        states = [
+            InvoiceState(invoice_id=f"inv{i:04d}", invoice_data=invoice_data, source_filename=f"code_{i:04d}.csv")
+            for i in range(args.invoices)
+        ]
+        print(f"batch: {args.invoices} paid invoices of {len(invoice_data['invoice']['items'])} items")
+
+        render_cached(invoice_data, "warmup")
+        before, pages_before = time_batch(render_previous, states)
+        after, pages_after = time_batch(render_cached, states)
+        for label, times in (("per render", before), ("cached", after)):
+            print(f"  {label:>10}: median {statistics.median(times) * 1000:6.2f} ms per invoice, "
+                  f"{sum(times):6.2f}s for the batch")
+        print(f"  {statistics.median(before) / statistics.median(after):.1f}x faster")
+        assert pages_before == pages_after, "embedded HTML differs"
+        print("  embedded HTML identical")
+
+        batch_dir = os.path.join(WORK, "batch")
+        os.makedirs(batch_dir)
+
+        async def build(linked: bool) -> tuple[int, int, int]:
+            path = await build_invoices_zip(batch_dir, "embedded" if not linked else "linked", states, linked=linked)
+            return zip_stats(path)
+
+        try:
+            for linked in (False, True):
+                html, total, size = asyncio.run(build(linked))
+                print(f"  {'linked' if linked else 'embedded':>10} ZIP: {html / 1e6:6.1f} MB of HTML, "
+                      f"{total / 1e6:6.1f} MB uncompressed, {size / 1e6:6.1f} MB on disk")
+        finally:
+            executors.shutdown()
+
+        with zipfile.ZipFile(os.path.join(batch_dir, "invoices_linked.zip")) as zf:
+            names = set(zf.namelist())
+            page = zf.read(f"{states[0].stem}_invoice.html").decode("utf-8")
+        assert "data:image" not in page
+        for name in (config.LOGO_FILENAME, config.PAID_STAMP_FILENAME):
+            assert f"{config.EXPORT_ASSETS_DIR}/{name}" in names, name
+        print(f"  linked ZIP: each image stored once under {config.EXPORT_ASSETS_DIR}/")
+    finally:
+        shutil.rmtree(WORK, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark: invoice_codec vs pickle for stored invoice data.
+
+Compares encoded size and encode/decode time for invoices with 10, 1,000
+and 50,000 line items, and checks that every document round-trips.
+
+    python benchmarks/invoice_format.py [--repeat N]
+"""
+
+import argparse
+import os
+import pickle
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import invoice_codec  # noqa: E402
+
+SIZES = (10, 1_000, 50_000)
+
+
+def make_invoice(n_items: int) -> dict:
+    """Build an invoice shaped like ``transform_dataframe_to_invoice_data`` output."""
+    items = []
+    for i in range(n_items):
+        items.append({
+            "_source_row_index": i,
+            "date": f"2025-07-{1 + i % 28:02d}",
+            "our_ref": str(100000 + i),
+            "client_ref": f"P{i:06d}",
+            "nhs_number": str(9000000000 + i),
+            "contract_hospital": "Barts Health NHS Trust",
+            "booked_by": "Ward Nurse",
+            "from_location": "E1 1BB",
+            "to_location": "SE3 9BY",
+            "status": "Completed",
+            "directions": "Outbound" if i % 2 else "Return",
+            "mob": "WC",
+            "wait_pounds": "",
+            "wait_notes": "",
+            "miles": f"{(i * 7) % 40 + 0.5:.1f}",
+            "charged": "",
+            "miles_pounds": "",
+            "job_pounds": "",
+            "total": "",
+        })
+    return {
+        "patient": {"name": "Ann Smith", "address": "1 Road, London", "postcode": "E1 1AA"},
+        "invoice": {
+            "number": "INV-0001", "date": "2025-07-31", "account_ref": "", "ref": "",
+            "po_number": "", "payment_terms": "30 days", "period": "July 2025", "items": items,
+        },
+        "financial": {"subtotal": "", "vat_percentage": "20", "vat_amount": "", "total": ""},
+        "bank": {"name": "Bank", "account_name": "Acct", "account_number": "12345678", "sort_code": "00-00-00"},
+        "paid": False,
+        "style": "style1",
+        "item_name": "",
+    }
+
+
+def best_of(repeat: int, fn) -> float:
+    """Return the fastest of *repeat* runs of *fn*, in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'items':>7} {'format':<8} {'bytes':>12} {'encode ms':>10} {'decode ms':>10}")
+    for n in SIZES:
+        doc = make_invoice(n)
+        formats = {
+            "pickle": (pickle.dumps, pickle.loads),
+            "codec": (invoice_codec.encode, invoice_codec.decode),
+        }
+        sizes = {}
+        for name, (encode, decode) in formats.items():
+            blob = encode(doc)
+            assert decode(blob) == doc, f"{name} round trip differs at {n} items"
+            sizes[name] = len(blob)
+            enc_ms = best_of(args.repeat, lambda: encode(doc))
+            dec_ms = best_of(args.repeat, lambda: decode(blob))
+            print(f"{n:>7} {name:<8} {len(blob):>12,} {enc_ms:>10.2f} {dec_ms:>10.2f}")
+        print(f"{'':>7} codec size is {sizes['codec'] / sizes['pickle']:.0%} of pickle")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark: the ``update-invoice`` preview response, via a file vs in memory.
+
+Each edit is a render-cache miss, so the cache is disabled here.  For
+invoices of 20, 200 and 2,000 journeys, times the previous response path —
+render, write ``<stem>_invoice.html`` to a directory, then reopen it to
+send — against rendering in memory with
+``render_invoice_html``; both must send the same bytes.
+
+    python benchmarks/invoice_preview.py [--renders 30]
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+WORK = tempfile.mkdtemp(prefix="invoice_preview_")
+os.environ["JINJA_BYTECODE_DIR"] = os.path.join(WORK, "bytecode")
+os.environ["RENDER_CACHE_DIR"] = ""
+
+import csv_cleaner  # noqa: E402
+from csv_ingest import write_export  # noqa: E402
+from DataScraper import transform_dataframe_to_invoice_data  # noqa: E402
+from services.invoice_service import render_invoice_html  # noqa: E402
+
+
+def via_file(invoice_data: dict) -> bytes:
+    path = os.path.join(WORK, "preview_invoice.html")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(render_invoice_html(invoice_data))
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def in_memory(invoice_data: dict) -> bytes:
+    return render_invoice_html(invoice_data).encode("utf-8")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--renders", type=int, default=30)
+    args = parser.parse_args()
+
+    try:
+        for items in (20, 200, 2000):
+            csv_path = os.path.join(WORK, f"invoice_{items}.csv")
+            write_export(csv_path, items, 40)
+            invoice_data = transform_dataframe_to_invoice_data(csv_cleaner.csv_to_dataframe(csv_path))
+            in_memory(invoice_data)  # compile the template
+            results = {}
+            for label, respond in (("via file", via_file), ("in memory", in_memory)):
+                times = []
+                for _ in range(args.renders):
+                    start = time.perf_counter()
+                    body = respond(invoice_data)
+                    times.append(time.perf_counter() - start)
+                results[label] = (statistics.median(times), body)
+            (before, body_before), (after, body_after) = results.values()
+            print(f"  {items:>5} items: via file {before * 1000:7.2f} ms, in memory {after * 1000:7.2f} ms "
+                  f"({(after - before) * 1000:+6.2f} ms, {len(body_after) / 1e6:.2f} MB)")
+            assert body_before == body_after, f"{items} items: response differs"
+        print("  responses identical")
+    finally:
+        shutil.rmtree(WORK, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
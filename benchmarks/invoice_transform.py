@@ -0,0 +1,137 @@
+"""
+Benchmark: DataScraper.transform_dataframe_to_invoice_data, column
+operations vs the previous ``iterrows`` loop.
+
+Builds synthetic Cleric exports full of awkward values (blank and "nan"
+cells, padding, rows without date or Record ID, the Passenger UPC aliases,
+missing columns, an all-numeric frame) and checks that the current function
+returns exactly the items the row-by-row loop returned for each of them,
+then times both at ``--rows`` rows.
+
+    python benchmarks/invoice_transform.py [--rows 10000] [--repeat 3]
+"""
+
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import csv_cleaner  # noqa: E402
+import DataScraper  # noqa: E402
+from DataScraper import clean_miles_value, clean_value, get_column_value  # noqa: E402
+
+
+def legacy_items(df):
+    """The ``iterrows`` loop this benchmark compares against."""
+    invoice_items = []
+    for row_idx, (_, row) in enumerate(df.iterrows()):
+        date_value = str(row.get('Start Date', '')).strip()
+        our_ref_value = clean_value(row.get('Record ID', ''))
+        date_is_nan = (date_value.lower() == 'nan' or date_value == '' or pd.isna(row.get('Start Date', '')))
+        ref_is_nan = (our_ref_value.lower() == 'nan' or our_ref_value == '' or pd.isna(row.get('Record ID', '')))
+        if date_is_nan and ref_is_nan:
+            continue
+        invoice_items.append({
+            '_source_row_index': row_idx,
+            'date': date_value,
+            'our_ref': our_ref_value,
+            'client_ref': clean_value(row.get('Pas Number', '')),
+            'nhs_number': clean_value(get_column_value(row, ['Passenger UPC', 'PassengerUPC', 'Passenger UPC Code'])),
+            'contract_hospital': str(row.get('Contract Hospital Text', '')),
+            'booked_by': clean_value(row.get('Caller', '')),
+            'from_location': str(row.get('From Postcode', '')),
+            'to_location': str(row.get('To Postcode', '')),
+            'status': str(row.get('Jrny Status Text', '')),
+            'directions': str(row.get('Direction Text', '')),
+            'mob': clean_value(row.get('Mobility Abbreviation', '')),
+            'wait_pounds': '',
+            'wait_notes': str(row.get('Waiting Time Reason', '')),
+            'miles': clean_miles_value(row.get('Actual Mileage', '')),
+            'charged': '',
+            'miles_pounds': '',
+            'job_pounds': '',
+            'total': ''
+        })
+    return invoice_items
+
+
+def export_csv(n_rows: int, seed: int, upc_column: str = "Passenger UPC") -> str:
+    rnd = random.Random(seed)
+    header = [upc_column if c == "Passenger UPC" else c for c in csv_cleaner.COLUMNS_TO_KEEP]
+    odd = ["", " ", "nan", " nan ", "NaN", "None", "1005.0", " 42 ", "x.0", "N/A"]
+
+    def messy(value):
+        return rnd.choice(odd) if rnd.random() < 0.15 else value
+
+    lines = [",".join(header)]
+    for i in range(n_rows):
+        values = {
+            "Start Date": messy(f"{1 + i % 28:02d}/07/2025"),
+            "Record ID": messy(str(5_000_000 + i)),
+            "Pas Number": messy(f"{i % 1000:06d}"),
+            upc_column: messy(str(4000000000 + i)),
+            "Caller": messy(f"Ward {i % 30}"),
+            "Actual Mileage": messy(f"{rnd.uniform(0, 30):.1f}"),
+            "Mobility Abbreviation": messy(rnd.choice(["WC", "AMB", "2"])),
+        }
+        lines.append(",".join(values.get(c, messy(f"{c} {i % 7}")) for c in header))
+    return "\n".join(lines) + "\n"
+
+
+def frames(n_rows: int):
+    """(label, DataFrame) pairs covering the shapes the transform meets."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), f".invoice_transform_{os.getpid()}.csv")
+    try:
+        with open(path, "w") as f:
+            f.write(export_csv(n_rows, 1))
+        yield "csv_to_dataframe", csv_cleaner.csv_to_dataframe(path)
+    finally:
+        os.remove(path)
+    yield "read_csv, inferred types", pd.read_csv(io.StringIO(export_csv(n_rows, 2)))
+    yield "PassengerUPC alias", pd.read_csv(io.StringIO(export_csv(n_rows, 3, "PassengerUPC")))
+    df = pd.read_csv(io.StringIO(export_csv(n_rows, 4)))
+    yield "no Start Date", df.drop(columns=["Start Date"])
+    yield "no Record ID", df.drop(columns=["Record ID"])
+    yield "all numeric", pd.DataFrame({
+        "Record ID": range(n_rows), "Actual Mileage": [float(i % 9) if i % 4 else None for i in range(n_rows)],
+    })
+    yield "one row", df.head(1)
+
+
+def best_of(repeat: int, fn, *args) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=3, help="best of N runs")
+    args = parser.parse_args()
+
+    for label, df in frames(2000):
+        expected = legacy_items(df)
+        actual = DataScraper.transform_dataframe_to_invoice_data(df)["invoice"]["items"]
+        assert actual == expected, f"{label}: items differ"
+        assert all(type(a) is type(b) for x, y in zip(actual, expected) for a, b in zip(x.values(), y.values()))
+        print(f"  identical: {label} ({len(df):,} rows, {len(actual):,} items)")
+
+    source = pd.read_csv(io.StringIO(export_csv(args.rows, 5)))
+    legacy = best_of(args.repeat, legacy_items, source)
+    current = best_of(args.repeat, DataScraper.transform_dataframe_to_invoice_data, source)
+    print(f"{args.rows:,} rows: iterrows {legacy * 1000:8.1f} ms, columns {current * 1000:7.1f} ms "
+          f"({legacy / current:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark: export -> invoices, through split CSVs on disk vs in memory.
+
+Writes a Cleric-style export (``--rows`` rows x ``--cols`` columns, spread
+over ``--codes`` budget codes) and builds the invoice data for every budget
+code the way ``/api/convert-csv`` + ``/api/get-conversion-files`` do (split
+into CSVs, then read each back with ``csv_to_dataframe``) and the way
+``/api/convert-to-invoices`` does (split in memory, ``frame_to_dataframe``).
+Both must produce the same invoices, in the same order.  Sidecars are off,
+as the three-step flow would build them while recording the split.
+
+    python benchmarks/pipeline.py [--rows 200000] [--cols 120] [--codes 40]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import config  # noqa: E402
+import csv_cleaner  # noqa: E402
+import divider  # noqa: E402
+from csv_ingest import write_export  # noqa: E402
+from DataScraper import transform_dataframe_to_invoice_data  # noqa: E402
+
+
+def add_budget_codes(path: str, n_codes: int) -> None:
+    rnd = random.Random(7)
+    codes = ["BARTS HDU", "BARTS BHOC HDU", ""] + [f"Ward {i} / Trust {i % 9}" for i in range(n_codes - 3)]
+    tmp_path = f"{path}.tmp"
+    with open(path, newline="") as src, open(tmp_path, "w", newline="") as dest:
+        dest.write(src.readline().rstrip("\n") + ',"BudgetCodeText"\n')
+        for line in src:
+            dest.write(f"{line.rstrip(chr(10))},{rnd.choice(codes)}\n")
+    os.replace(tmp_path, path)
+
+
+def three_step(csv_path: str, work: str) -> list:
+    output_dir = tempfile.mkdtemp(dir=work)
+    invoices = []
+    for path, _rows in divider.split_csv_by_budget_code(csv_path, output_dir):
+        invoices.append((os.path.basename(path), transform_dataframe_to_invoice_data(csv_cleaner.csv_to_dataframe(path))))
+    return invoices
+
+
+def in_memory(csv_path: str, _work: str) -> list:
+    return [
+        (filename, transform_dataframe_to_invoice_data(csv_cleaner.frame_to_dataframe(part)))
+        for filename, part in divider.budget_code_frames(csv_path, csv_cleaner.COLUMNS_TO_KEEP)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--cols", type=int, default=120)
+    parser.add_argument("--codes", type=int, default=40)
+    args = parser.parse_args()
+
+    config.COLUMNAR_CACHE = False
+    work = tempfile.mkdtemp(prefix="pipeline_")
+    try:
+        csv_path = os.path.join(work, "cleric.csv")
+        write_export(csv_path, args.rows, args.cols - 1)
+        add_budget_codes(csv_path, args.codes)
+        print(f"export: {args.rows:,} rows x {args.cols} cols, {os.path.getsize(csv_path) / 1e6:.0f} MB")
+
+        results = {}
+        for label, build in (("three-step", three_step), ("in memory", in_memory)):
+            start = time.perf_counter()
+            results[label] = build(csv_path, work)
+            elapsed = results[f"{label} time"] = time.perf_counter() - start
+            print(f"{label:>11}: {elapsed:6.2f}s  ({len(results[label])} invoices)")
+        print(f"  {results['three-step time'] / results['in memory time']:.1f}x faster")
+
+        expected, actual = results["three-step"], results["in memory"]
+        assert [name for name, _ in expected] == [name for name, _ in actual], "invoice order differs"
+        for (name, a), (_name, b) in zip(expected, actual):
+            assert a == b, f"{name}: invoice data differs"
+        print("  invoice data identical")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
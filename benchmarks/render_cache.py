@@ -0,0 +1,127 @@
+"""
+Benchmark: rendering an unchanged invoice again, Jinja vs the render cache.
+
+Renders a paid invoice of ``--items`` journeys ``--renders`` times with
+``render_invoice_html`` with the cache disabled and then served from it,
+and checks that every cached page equals a fresh render.  It then checks
+invalidation — an edited invoice and an edited template (a copy of the
+templates directory) must each miss and render the new HTML — and that the
+cache stays within ``RENDER_CACHE_MAX_BYTES``, evicting the least recently
+used entries first.
+
+    python benchmarks/render_cache.py [--items 200] [--renders 50]
+"""
+
+import argparse
+import copy
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+WORK = tempfile.mkdtemp(prefix="render_cache_")
+os.environ["RENDER_CACHE_DIR"] = os.path.join(WORK, "render_cache")
+os.environ["JINJA_BYTECODE_DIR"] = os.path.join(WORK, "bytecode")
+os.environ["TEMPLATE_AUTO_RELOAD"] = "true"
+
+import config  # noqa: E402
+import csv_cleaner  # noqa: E402
+import render_cache  # noqa: E402
+from csv_ingest import write_export  # noqa: E402
+from DataScraper import transform_dataframe_to_invoice_data  # noqa: E402
+from services.invoice_service import render_invoice_html  # noqa: E402
+
+TEMPLATES = os.path.join(WORK, "templates")
+shutil.copytree(os.path.join(ROOT, config.TEMPLATES_DIR), TEMPLATES)
+config.TEMPLATES_DIR = TEMPLATES
+
+
+def uncached(invoice_data: dict) -> str:
+    saved, config.RENDER_CACHE_MAX_BYTES = config.RENDER_CACHE_MAX_BYTES, 0
+    try:
+        return render_invoice_html(invoice_data)
+    finally:
+        config.RENDER_CACHE_MAX_BYTES = saved
+
+
+def time_renders(render, invoice_data: dict, renders: int) -> tuple[list[float], list[str]]:
+    times, pages = [], []
+    for _ in range(renders):
+        start = time.perf_counter()
+        pages.append(render(invoice_data))
+        times.append(time.perf_counter() - start)
+    return times, pages
+
+
+def cache_files() -> list[str]:
+    return sorted(
+        name for _dirpath, _dirs, files in os.walk(config.RENDER_CACHE_DIR) for name in files
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--renders", type=int, default=50)
+    args = parser.parse_args()
+
+    try:
+        csv_path = os.path.join(WORK, "invoice.csv")
+        write_export(csv_path, args.items, 40)
+        invoice_data = transform_dataframe_to_invoice_data(csv_cleaner.csv_to_dataframe(csv_path))
+        invoice_data["paid"] = True
+        print(f"invoice: {len(invoice_data['invoice']['items'])} items, {args.renders} renders")
+
+        expected = uncached(invoice_data)
+        before, _pages = time_renders(uncached, invoice_data, args.renders)
+        render_invoice_html(invoice_data)  # fill the cache
+        after, pages = time_renders(render_invoice_html, invoice_data, args.renders)
+        for label, times in (("Jinja", before), ("cache hit", after)):
+            print(f"  {label:>10}: median {statistics.median(times) * 1000:7.2f} ms per invoice")
+        print(f"  {statistics.median(before) / statistics.median(after):.1f}x faster")
+        assert all(page == expected for page in pages), "cached HTML differs"
+        print("  cached HTML identical")
+
+        edited = copy.deepcopy(invoice_data)
+        edited["invoice"]["items"][0]["total"] = "999.99"
+        entries = len(cache_files())
+        assert render_invoice_html(edited) == uncached(edited) != expected
+        assert len(cache_files()) == entries + 1, "edited invoice did not miss"
+        template = os.path.join(TEMPLATES, config.INVOICE_TEMPLATE_STYLE1)
+        with open(template, "a", encoding="utf-8") as f:
+            f.write("\n<!-- edited -->\n")
+        page = render_invoice_html(invoice_data)
+        assert page == uncached(invoice_data) and page != expected and "<!-- edited -->" in page
+        assert len(cache_files()) == entries + 2, "edited template did not miss"
+        print("  edited invoice and edited template each miss and render the new HTML")
+
+        shutil.rmtree(config.RENDER_CACHE_DIR)
+        render_cache.trim()
+        config.RENDER_CACHE_MAX_BYTES = int(len(expected.encode("utf-8")) * 4.5)
+        variants = []
+        for n in range(10):
+            variant = copy.deepcopy(invoice_data)
+            variant["invoice"]["number"] = f"INV-{n}"
+            variants.append(variant)
+            render_invoice_html(variant)
+            time.sleep(0.01)
+            render_invoice_html(variants[0])  # keep the first one in use
+        _entries, total = render_cache._scan()
+        assert total <= config.RENDER_CACHE_MAX_BYTES, total
+        survivors = len(cache_files())
+        render_invoice_html(variants[0])
+        render_invoice_html(variants[-1])
+        assert len(cache_files()) == survivors, "recently used entries were evicted"
+        print(f"  limit {config.RENDER_CACHE_MAX_BYTES / 1e6:.1f} MB: {survivors} of 10 entries kept, "
+              f"most recently used first")
+    finally:
+        shutil.rmtree(WORK, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Benchmark: invoice line items, paginated in the template vs in Python.
+
+Renders ``Invoice 2.html`` for invoices of 50, 500 and 5,000 journeys the
+previous way — the template loops over the raw items, testing each for
+blanks, counting them towards page breaks and formatting every column — and
+with ``render_invoice_html``, which hands it pages of rows built once by
+``paginate_line_items``.  Both must show the same text in every line item
+column and parse back to the same invoice; the new page must repeat the
+column headings once per page after the first.
+
+    python benchmarks/render_pagination.py [--renders 20]
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+WORK = tempfile.mkdtemp(prefix="render_pagination_")
+os.environ["JINJA_BYTECODE_DIR"] = os.path.join(WORK, "bytecode")
+os.environ["RENDER_CACHE_DIR"] = ""
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+import config  # noqa: E402
+import csv_cleaner  # noqa: E402
+from csv_ingest import write_export  # noqa: E402
+from DataScraper import transform_dataframe_to_invoice_data  # noqa: E402
+from services.invoice_service import get_jinja_env, paginate_line_items, parse_html_invoice, render_invoice_html  # noqa: E402
+
+# The line items as the template laid them out before, counting and formatting each one.
+PREVIOUS_ITEMS = """\
+            <div class="invoice-items-container">
+            {% set valid_item_count = 0 %}
+            {% for item in data.invoice['items'] %}
+                {% set date_is_nan = (not item.date or item.date|lower == 'nan' or item.date|string|trim == '') %}
+                {% set ref_is_nan = (not item.our_ref or item.our_ref|lower == 'nan' or item.our_ref|string|trim == '') %}
+                {% if not (date_is_nan and ref_is_nan) %}
+                {% set valid_item_count = valid_item_count + 1 %}
+                {% if valid_item_count > 13 and (valid_item_count - 13) % 14 == 1 %}
+                <!-- Repeating header for new page (before item 14, 28, 42, etc.) -->
+                <div class="repeating-header-grid" style="page-break-before: always; break-before: page; margin-top: 1rem; margin-bottom: 1rem;">
+                    <hr class="border-t-2 border-gray-800">
+                    <div class="header-grid">
+                        <span class="col-span-2 font-bold">DATE</span>
+                        <span class="col-span-2 font-bold">OUR REF</span>
+                        <span class="col-span-2 font-bold">CLIENT REF</span>
+                        <span class="col-span-2 font-bold">NHS NUMBER</span>
+                        <span class="col-span-3 font-bold">CONTRACT HOSPITAL</span>
+                        <span class="col-span-4"></span>
+                        <span class="col-span-2 font-bold">BOOKED BY</span>
+                        <span class="col-span-2 font-bold">FROM</span>
+                        <span class="col-span-5 font-bold">TO</span>
+
+                        <span class="col-start-1 col-span-2 font-bold">STATUS</span>
+                        <span class="col-start-3 col-span-2 font-bold">DIRECTIONS</span>
+                        <span class="col-start-5 col-span-2 font-bold">MOB</span>
+                        <span class="col-start-7 col-span-2 font-bold">WAIT £</span>
+                        <span class="col-start-9 col-span-3 font-bold">WAIT NOTES</span>
+                        <span class="col-start-12 col-span-2 font-bold">MILES</span>
+                        <span class="col-start-14 col-span-2 font-bold">CHARGED</span>
+                        <span class="col-start-16 col-span-2 font-bold">MILES £</span>
+                        <span class="col-start-18 col-span-2 font-bold">JOB £</span>
+                        <span class="col-start-20 col-span-5 font-bold">TOTAL</span>
+                    </div>
+                    <hr class="border-t border-gray-300 mt-2">
+                </div>
+                {% endif %}
+                <div class="invoice-line-item">
+                    <div class="data-grid font-normal">
+                        <span class="col-span-2">{{ item.date | format_date_numeric }}</span>
+                        <span class="col-span-2">
+                            {% if item.our_ref|string|trim|length > 0 and item.our_ref|string|trim|lower != 'nan' %}
+                                {% set our_ref_str = item.our_ref|string|trim %}
+                                {% if our_ref_str|length >= 2 and our_ref_str[-2:] == '.0' %}
+                                    {{ our_ref_str[:-2] }}
+                                {% else %}
+                                    {{ our_ref_str }}
+                                {% endif %}
+                            {% endif %}
+                        </span>
+                        <span class="col-span-2">{{ item.client_ref }}</span>
+                        <span class="col-span-2">{{ item.nhs_number }}</span>
+                        <span class="col-span-3">{{ item.contract_hospital }}</span>
+                        <span class="col-span-4"></span>
+                        <span class="col-span-2">{{ item.booked_by }}</span>
+                        <span class="col-span-2">{{ item.from_location }}</span>
+                        <span class="col-span-5">{{ item.to_location }}</span>
+
+                        <span class="col-start-1 col-span-2">{{ item.status }}</span>
+                        <span class="col-start-3 col-span-2">{{ item.directions }}</span>
+                        <span class="col-start-5 col-span-2">{{ item.mob }}</span>
+                        <span class="col-start-7 col-span-2">{% if item.wait_pounds %}£{{ item.wait_pounds | format_currency }}{% endif %}</span>
+                        <span class="col-start-9 col-span-3">{{ item.wait_notes }}</span>
+                        <span class="col-start-12 col-span-2">{% if item.miles and item.miles|lower != 'nan' and item.miles|string|trim != '' %}{{ item.miles }}{% else %}0.0{% endif %}</span>
+                        <span class="col-start-14 col-span-2">{% if item.charged and item.charged|string|trim != '' and item.charged|lower != 'nan' %}{{ item.charged }}{% else %}0{% endif %}</span>
+                        <span class="col-start-16 col-span-2">{% if item.miles_pounds %}£{{ item.miles_pounds | format_currency }}{% endif %}</span>
+                        <span class="col-start-18 col-span-2">{% if item.job_pounds %}£{{ item.job_pounds | format_currency }}{% endif %}</span>
+                        <span class="col-start-20 col-span-5 font-bold text-gray-800">{% if item.total %}£{{ item.total | format_currency }}{% endif %}</span>
+                    </div>
+                    <hr class="dotted-line-bottom">
+                </div>
+                {% endif %}
+            {% endfor %}
+            </div>
+"""
+
+ITEMS_START = '            <div class="invoice-items-container">'
+ITEMS_END = '            {% endfor %}\n            </div>'
+
+
+def previous_template():
+    """``Invoice 2.html`` with its line items rendered the previous way."""
+    with open(os.path.join(ROOT, config.TEMPLATES_DIR, config.INVOICE_TEMPLATE_STYLE1), encoding="utf-8") as f:
+        source = f.read()
+    start = source.index(ITEMS_START)
+    end = source.index(ITEMS_END, start) + len(ITEMS_END)
+    return get_jinja_env().from_string(source[:start] + PREVIOUS_ITEMS.rstrip("\n") + source[end:])
+
+
+def line_item_texts(html: str) -> list[list[str]]:
+    soup = BeautifulSoup(html, "html.parser")
+    return [
+        [" ".join(span.get_text().split()) for span in item.find_all("span")]
+        for item in soup.select(".invoice-line-item")
+    ]
+
+
+def repeated_headings(html: str) -> int:
+    return len(BeautifulSoup(html, "html.parser").select(".repeating-header-grid"))
+
+
+def median_ms(render, renders: int) -> tuple[float, str]:
+    times = []
+    for _ in range(renders):
+        start = time.perf_counter()
+        html = render()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000, html
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--renders", type=int, default=20)
+    args = parser.parse_args()
+
+    try:
+        template = previous_template()
+        print(f"{config.INVOICE_FIRST_PAGE_ROWS} rows on the first page, {config.INVOICE_ROWS_PER_PAGE} on the next")
+        for items in (50, 500, 5000):
+            csv_path = os.path.join(WORK, f"invoice_{items}.csv")
+            write_export(csv_path, items, 40)
+            invoice_data = transform_dataframe_to_invoice_data(csv_cleaner.csv_to_dataframe(csv_path))
+            # rows the export left empty are skipped by both
+            invoice_data["invoice"]["items"][10:10] = [{"date": "", "our_ref": "nan"}, {"date": "nan", "our_ref": " "}]
+
+            before, html_before = median_ms(lambda: template.render(data=invoice_data), args.renders)
+            after, html_after = median_ms(lambda: render_invoice_html(invoice_data, embed_image=False), args.renders)
+            pages = len(paginate_line_items(invoice_data["invoice"]["items"]))
+            print(f"  {items:>5} items, {pages:>3} pages: template {before:8.2f} ms, "
+                  f"pre-paginated {after:8.2f} ms ({before / after:.1f}x)")
+
+            rows = line_item_texts(html_after)
+            assert len(rows) == items, f"{items} items: {len(rows)} line items rendered"
+            assert rows == line_item_texts(html_before), f"{items} items: line item text differs"
+            assert parse_html_invoice(html_after) == parse_html_invoice(html_before), f"{items} items: parses differently"
+            assert repeated_headings(html_after) == pages - 1, f"{items} items: headings not repeated per page"
+            print(f"         column headings repeated {repeated_headings(html_after)} times "
+                  f"(previously {repeated_headings(html_before)})")
+        print("  line item text and parsed invoices identical")
+    finally:
+        shutil.rmtree(WORK, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark: divider.split_csv_by_budget_code, single pass vs per-code masks.
+
+Generates a Cleric-style export (``--rows`` rows, ``--codes`` budget codes,
+including both codes of the BARTS_HDU combined group and rows without a
+code) and splits it with the previous implementation — one boolean mask per
+code — and with the current single-pass splitter.  Every file both write
+must be byte-identical.  The old splitter loses the rows without a budget
+code (it writes an empty No_BudgetCode.csv); the check confirms the new one
+puts exactly those rows there.
+
+    python benchmarks/split_budget_codes.py [--rows 500000] [--codes 250]
+"""
+
+import argparse
+import filecmp
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import divider  # noqa: E402
+
+
+def legacy_split(input_file, output_dir):
+    """The per-code mask splitter this benchmark compares against."""
+    combined_groups = {'BARTS_HDU': ['BARTS BHOC HDU', 'BARTS HDU']}
+    budget_code_to_group = {}
+    for group_name, codes in combined_groups.items():
+        for code in codes:
+            budget_code_to_group[code] = group_name
+    df = pd.read_csv(input_file)
+    os.makedirs(output_dir, exist_ok=True)
+    processed_groups = set()
+    written = []
+    for budget_code in df['BudgetCodeText'].unique():
+        if budget_code in budget_code_to_group:
+            group_name = budget_code_to_group[budget_code]
+            if group_name in processed_groups:
+                continue
+            processed_groups.add(group_name)
+            filtered_df = df[df['BudgetCodeText'].isin(combined_groups[group_name])]
+            filename = f"{divider.sanitize_filename(group_name)}.csv"
+        else:
+            filtered_df = df[df['BudgetCodeText'] == budget_code]
+            if pd.isna(budget_code) or budget_code == '':
+                filename = 'No_BudgetCode.csv'
+            else:
+                filename = f"{divider.sanitize_filename(str(budget_code))}.csv"
+        output_path = os.path.join(output_dir, filename)
+        filtered_df.to_csv(output_path, index=False)
+        written.append((output_path, len(filtered_df)))
+    return written
+
+
+def make_export(path: str, n_rows: int, n_codes: int) -> int:
+    """Write the synthetic export; return how many rows have no budget code."""
+    rnd = random.Random(7)
+    codes = ["BARTS HDU", "BARTS BHOC HDU"] + [f"Ward {i} / Trust {i % 17}" for i in range(n_codes - 2)]
+    budget = [rnd.choice(codes) if i % 50 else "" for i in range(n_rows)]
+    pd.DataFrame({
+        "Start Date": [f"2025-07-{1 + i % 28:02d}" for i in range(n_rows)],
+        "Record ID": [1000 + i if i % 9 else None for i in range(n_rows)],
+        "Pas Number": [f"P{i:06d}" for i in range(n_rows)],
+        "Passenger UPC": [9000000000 + i for i in range(n_rows)],
+        "From Postcode": "E1 1AA",
+        "To Postcode": "SE3 9BY",
+        "Actual Mileage": [round(rnd.uniform(1, 30), 1) if i % 7 else None for i in range(n_rows)],
+        "Forename": "Ann",
+        "Surname": [f"Smith{i % 300}" for i in range(n_rows)],
+        "BudgetCodeText": budget,
+    }).to_csv(path, index=False)
+    return budget.count("")
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--codes", type=int, default=250)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="split_bench_")
+    try:
+        export = os.path.join(work, "cleric.csv")
+        blanks = make_export(export, args.rows, args.codes)
+        print(f"{args.rows:,} rows, {args.codes} budget codes, {blanks:,} without a code, "
+              f"{os.path.getsize(export) / 1e6:.0f} MB")
+
+        legacy_time, legacy = timed(legacy_split, export, os.path.join(work, "legacy"))
+        new_time, new = timed(divider.split_csv_by_budget_code, export, os.path.join(work, "single_pass"))
+        print(f"  per-code masks: {legacy_time:6.2f}s  ({len(legacy)} files)")
+        print(f"  single pass   : {new_time:6.2f}s  ({len(new)} files, {legacy_time / new_time:.1f}x)")
+
+        new_rows = {os.path.basename(p): rows for p, rows in new}
+        assert sum(new_rows.values()) == args.rows, "rows lost"
+        assert new_rows[divider.NO_BUDGET_CODE_FILENAME] == blanks
+        assert [os.path.basename(p) for p, _ in legacy] == list(new_rows)
+        for (a, rows_a), (b, rows_b) in zip(legacy, new):
+            if os.path.basename(a) == divider.NO_BUDGET_CODE_FILENAME:
+                assert rows_a == 0  # the rows the old splitter dropped
+                continue
+            assert rows_a == rows_b and filecmp.cmp(a, b, shallow=False), f"{os.path.basename(a)} differs"
+        print("  all other files identical; No_BudgetCode.csv now holds the uncoded rows")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
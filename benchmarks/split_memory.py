@@ -0,0 +1,126 @@
+"""
+Benchmark: peak memory of splitting a Cleric export by budget code,
+in-memory vs streaming.
+
+Writes a year-to-date style export (``--rows`` rows) whose column types only
+settle late in the file — ints that later gain decimals or blanks, codes that
+turn into text, a column empty for the first half — and splits it in each
+mode in a fresh subprocess, which reports its peak RSS.  Streaming memory
+should follow ``--chunk-rows``, not the file size, and both modes must write
+byte-identical files.
+
+    python benchmarks/split_memory.py [--rows 2000000] [--chunk-rows 100000] [--keep DIR]
+"""
+
+import argparse
+import filecmp
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+HEADER = ["Start Date", "Record ID", "Pas Number", "Passenger UPC", "From Postcode", "To Postcode",
+          "Actual Mileage", "Wait Time", "Forename", "Surname", "Flag", "Notes", "Ref", "BudgetCodeText"]
+
+
+def write_export(path: str, n_rows: int) -> None:
+    rnd = random.Random(11)
+    codes = ["BARTS HDU", "BARTS BHOC HDU"] + [f"Ward {i} / Trust {i % 17}" for i in range(248)]
+    with open(path, "w", newline="") as f:
+        f.write(",".join(HEADER) + "\n")
+        for i in range(n_rows):
+            late = i > n_rows * 3 // 4
+            f.write(",".join([
+                f"2025-{1 + i % 12:02d}-{1 + i % 28:02d}",
+                str(1000 + i),
+                f"P{i:07d}",
+                str(9000000000 + i),
+                "E1 1AA",
+                '"SE3 9BY, London"',
+                f"{rnd.uniform(1, 30):.1f}" if late and i % 3 else str(i % 30),
+                "" if late and i % 7 == 0 else str(i % 45),
+                "Ann",
+                f"Smith{i % 300}",
+                "True" if i % 2 else "False",
+                "" if i < n_rows // 2 else "Return journey",
+                f"R{i}" if late else f"{i % 100000:05d}",
+                "" if i % 50 == 0 else rnd.choice(codes),
+            ]) + "\n")
+
+
+def child(mode: str, chunk_rows: int, csv_path: str, out_dir: str) -> None:
+    import warnings
+
+    import config
+    import divider
+
+    warnings.simplefilter("ignore")  # DtypeWarning for the mixed "Ref" column
+    config.SPLIT_CHUNK_ROWS = chunk_rows
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    written = divider.split_csv_by_budget_code(csv_path, out_dir, mode=mode)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "elapsed": elapsed,
+        "baseline_kb": baseline,
+        "peak_kb": peak,
+        "written": [(os.path.basename(p), rows) for p, rows in written],
+    }))
+
+
+def run_mode(mode: str, chunk_rows: int, csv_path: str, out_dir: str) -> dict:
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", mode, str(chunk_rows), csv_path, out_dir],
+        check=True, capture_output=True, text=True, cwd=ROOT,
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--chunk-rows", type=int, default=100_000)
+    parser.add_argument("--keep", help="write/split in this directory and keep the files")
+    parser.add_argument("--child", nargs=4, metavar=("MODE", "CHUNK_ROWS", "CSV", "OUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        mode, chunk_rows, csv_path, out_dir = args.child
+        child(mode, int(chunk_rows), csv_path, out_dir)
+        return
+
+    work = args.keep or tempfile.mkdtemp(prefix="split_memory_")
+    os.makedirs(work, exist_ok=True)
+    try:
+        csv_path = os.path.join(work, "cleric_ytd.csv")
+        write_export(csv_path, args.rows)
+        print(f"export: {args.rows:,} rows, {os.path.getsize(csv_path) / 1e6:.0f} MB")
+
+        results = {}
+        for mode in ("memory", "streaming"):
+            results[mode] = r = run_mode(mode, args.chunk_rows, csv_path, os.path.join(work, mode))
+            print(f"{mode:>10}: {r['elapsed']:7.1f}s  peak RSS {r['peak_kb'] / 1024:7.0f} MB  "
+                  f"(+{(r['peak_kb'] - r['baseline_kb']) / 1024:.0f} MB over imports)")
+
+        assert results["memory"]["written"] == results["streaming"]["written"], "row counts differ"
+        for name, _rows in results["memory"]["written"]:
+            a = os.path.join(work, "memory", name)
+            b = os.path.join(work, "streaming", name)
+            assert filecmp.cmp(a, b, shallow=False), f"{name} differs between modes"
+        print(f"  {len(results['memory']['written'])} files identical")
+    finally:
+        if not args.keep:
+            shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
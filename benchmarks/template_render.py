@@ -0,0 +1,105 @@
+"""
+Benchmark: per-invoice render latency, fresh Jinja environment vs cached.
+
+Builds invoice data for ``--items`` journeys and renders it ``--renders``
+times with ``render_invoice_html`` the previous way — a new Environment
+per call, so ``Invoice 2.html`` is compiled every time — and with the
+process-wide environment.  Then times the first template load of a new
+process (as after a restart, or in a new CPU executor worker) with an empty
+and with a primed bytecode cache.  Every render must return the same HTML;
+the render cache is disabled so each one really renders.
+
+    python benchmarks/template_render.py [--items 200] [--renders 50]
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+WORK = tempfile.mkdtemp(prefix="template_render_")
+os.environ["JINJA_BYTECODE_DIR"] = os.path.join(WORK, "bytecode")
+os.environ["RENDER_CACHE_DIR"] = ""
+
+import config  # noqa: E402
+import csv_cleaner  # noqa: E402
+from csv_ingest import write_export  # noqa: E402
+from DataScraper import transform_dataframe_to_invoice_data  # noqa: E402
+from services import invoice_service  # noqa: E402
+
+FIRST_LOAD = """
+import sys, time
+sys.path.insert(0, {root!r})
+from services.invoice_service import get_jinja_env
+start = time.perf_counter()
+get_jinja_env().get_template({template!r})
+print(time.perf_counter() - start)
+"""
+
+
+def fresh_env():
+    """The previous behaviour: a new environment (and no bytecode cache) per render."""
+    saved, config.JINJA_BYTECODE_DIR = config.JINJA_BYTECODE_DIR, ""
+    try:
+        return invoice_service._build_jinja_env()
+    finally:
+        config.JINJA_BYTECODE_DIR = saved
+
+
+def time_renders(invoice_data: dict, renders: int) -> tuple[list[float], str]:
+    times = []
+    for _ in range(renders):
+        start = time.perf_counter()
+        html = invoice_service.render_invoice_html(invoice_data)
+        times.append(time.perf_counter() - start)
+    return times, html
+
+
+def first_load() -> float:
+    code = FIRST_LOAD.format(root=ROOT, template=config.INVOICE_TEMPLATE_STYLE1)
+    out = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True, cwd=ROOT)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--renders", type=int, default=50)
+    args = parser.parse_args()
+
+    try:
+        csv_path = os.path.join(WORK, "invoice.csv")
+        write_export(csv_path, args.items, 40)
+        invoice_data = transform_dataframe_to_invoice_data(csv_cleaner.csv_to_dataframe(csv_path))
+        print(f"invoice: {len(invoice_data['invoice']['items'])} items, {args.renders} renders")
+
+        cached_env = invoice_service.get_jinja_env
+        invoice_service.get_jinja_env = fresh_env
+        before, html_before = time_renders(invoice_data, args.renders)
+        invoice_service.get_jinja_env = cached_env
+        after, html_after = time_renders(invoice_data, args.renders)
+        for label, times in (("fresh env", before), ("cached env", after)):
+            print(f"  {label:>10}: median {statistics.median(times) * 1000:7.2f} ms"
+                  f"  mean {statistics.mean(times) * 1000:7.2f} ms per invoice")
+        print(f"  {statistics.median(before) / statistics.median(after):.1f}x faster")
+        assert html_before == html_after, "rendered HTML differs"
+        print("  HTML identical")
+
+        shutil.rmtree(config.JINJA_BYTECODE_DIR, ignore_errors=True)
+        cold = first_load()
+        primed = first_load()
+        print(f"new process, first template load: empty bytecode cache {cold * 1000:.1f} ms, "
+              f"primed {primed * 1000:.1f} ms")
+    finally:
+        shutil.rmtree(WORK, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
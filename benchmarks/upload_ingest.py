@@ -0,0 +1,142 @@
+"""
+Benchmark: event-loop stalls while a large upload is received.
+
+Sends a ``--mb`` MB multipart upload through a minimal ASGI app, in 64 KB
+body messages as a server would deliver them, while a ticker task measures
+how late the event loop wakes it (every 5 ms).  Two handlers receive the
+same body:
+
+* ``UploadFile`` + hashing copy — the previous handlers: Starlette spools the
+  body, then the route hashes and copies it synchronously;
+* ``upload_form`` — :mod:`upload_ingest` streams it to the staging directory
+  and the route moves it into place.
+
+Both must end with the same bytes and SHA-256 on disk.
+
+    python benchmarks/upload_ingest.py [--mb 200]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+BOUNDARY = b"----benchboundary"
+CHUNK = 64 * 1024
+
+
+def legacy_ingest(stream, dest):
+    """The synchronous hash-and-copy the routes used to run."""
+    digest = hashlib.sha256()
+    with open(dest, "wb") as out:
+        for chunk in iter(lambda: stream.read(1024 * 1024), b""):
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest()
+
+
+def build_app(work: str):
+    from fastapi import Depends, FastAPI, File, UploadFile
+
+    import dependencies
+    from upload_ingest import UploadForm, upload_form
+
+    app = FastAPI()
+    app.dependency_overrides[dependencies.require_auth] = lambda: "bench"
+
+    @app.post("/legacy")
+    async def legacy(file: UploadFile = File(...)):
+        return {"sha256": legacy_ingest(file.file, os.path.join(work, "legacy.csv"))}
+
+    @app.post("/streamed")
+    async def streamed(form: UploadForm = Depends(upload_form)):
+        return {"sha256": form.file("file").move_to(os.path.join(work, "streamed.csv"))}
+
+    return app
+
+
+async def send(app, path: str, payload: bytes) -> tuple[float, float]:
+    """Post *payload* to *path*; return ``(seconds, worst loop lag in seconds)``."""
+    head = (b"--" + BOUNDARY + b'\r\nContent-Disposition: form-data; name="file"; filename="big.csv"\r\n'
+            b"Content-Type: text/csv\r\n\r\n")
+    tail = b"\r\n--" + BOUNDARY + b"--\r\n"
+    body = head + payload + tail
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"content-type", b"multipart/form-data; boundary=" + BOUNDARY),
+                    (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80),
+    }
+    offsets = iter(range(0, len(body), CHUNK))
+
+    async def receive():
+        offset = next(offsets, None)
+        if offset is None:
+            return {"type": "http.disconnect"}
+        await asyncio.sleep(0)  # the server yields between socket reads
+        return {"type": "http.request", "body": body[offset:offset + CHUNK], "more_body": offset + CHUNK < len(body)}
+
+    status = []
+
+    async def reply(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    worst = 0.0
+    done = asyncio.Event()
+
+    async def ticker():
+        nonlocal worst
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            worst = max(worst, time.perf_counter() - start - 0.005)
+
+    tick = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await app(scope, receive, reply)
+    elapsed = time.perf_counter() - start
+    done.set()
+    await tick
+    assert status == [200], f"{path}: HTTP {status}"
+    return elapsed, worst
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mb", type=int, default=200)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="upload_ingest_")
+    try:
+        import config
+
+        config.UPLOAD_STAGING_DIR = os.path.join(work, ".incoming")
+        config.BLOB_STORE_DIR = os.path.join(work, "blobs")
+        config.UPLOAD_MAX_FILE_MB = config.UPLOAD_MAX_REQUEST_MB = 0
+        payload = os.urandom(1024 * 1024) * args.mb
+        app = build_app(work)
+        print(f"upload: {args.mb} MB")
+        for label, path in (("UploadFile + copy", "/legacy"), ("upload_form", "/streamed")):
+            elapsed, worst = asyncio.run(send(app, path, payload))
+            print(f"  {label:>17}: {elapsed:6.2f}s  worst event-loop stall {worst * 1000:8.1f} ms")
+
+        expected = hashlib.sha256(payload).hexdigest()
+        for name in ("legacy.csv", "streamed.csv"):
+            with open(os.path.join(work, name), "rb") as f:
+                assert hashlib.sha256(f.read()).hexdigest() == expected, f"{name} differs"
+        assert not os.listdir(config.UPLOAD_STAGING_DIR), "staged files left behind"
+        print("  both files identical to the upload")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark: XLSX -> CSV conversion time per reader engine.
+
+Builds synthetic journey exports of increasing size and converts each with
+every installed engine (calamine, openpyxl) in both conversion modes.
+Speed-ups are relative to openpyxl + pandas, the original code path.  For
+each engine the streaming and pandas CSVs must be byte-identical; whether
+they also match openpyxl's output is reported.
+
+    python benchmarks/xlsx_engines.py [--sizes 1000,10000,50000] [--repeat N]
+"""
+
+import argparse
+import filecmp
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import xslx_to_csv  # noqa: E402
+
+HEADER = ["JobRef", "Date", "Patient", "NHSNumber", "BudgetCodeText", "From", "To",
+          "Status", "Miles", "Wait", "Total", "Notes"]
+
+
+def build_workbook(path: str, n_rows: int) -> None:
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Journeys")
+    sheet.append(HEADER)
+    base = datetime(2025, 1, 1, 8, 30)
+    for i in range(n_rows):
+        sheet.append([
+            100000 + i, base + timedelta(minutes=17 * i), f"Patient {i % 5000}", 9000000000 + i,
+            f"BC{i % 60:03d}", "E1 1BB", "SE3 9BY", "Completed" if i % 9 else "Aborted",
+            round((i * 7) % 40 + 0.5, 1), None if i % 4 else 12.5, round(i % 97 * 1.25, 2),
+            "" if i % 3 else "Return journey",
+        ])
+    summary = workbook.create_sheet("Summary")
+    summary.append(["BudgetCodeText", "Journeys"])
+    for code in range(60):
+        summary.append([f"BC{code:03d}", n_rows // 60])
+    workbook.save(path)
+
+
+def convert(xlsx_path: str, out_dir: str, mode: str, engine: str, repeat: int) -> tuple[float, list]:
+    best = float("inf")
+    for _ in range(repeat):
+        shutil.rmtree(out_dir, ignore_errors=True)
+        start = time.perf_counter()
+        written = xslx_to_csv.xlsx_to_csv(xlsx_path, out_dir, mode=mode, engine=engine)
+        best = min(best, time.perf_counter() - start)
+    return best, written
+
+
+def same_files(a: list, b: list) -> bool:
+    return [rows for _, rows in a] == [rows for _, rows in b] and all(
+        filecmp.cmp(pa, pb, shallow=False) for (pa, _), (pb, _) in zip(a, b)
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,50000", help="comma-separated row counts")
+    parser.add_argument("--repeat", type=int, default=3, help="best of N runs")
+    args = parser.parse_args()
+
+    engines = [engine for engine in xslx_to_csv.ENGINES if xslx_to_csv.engine_available(engine)]
+    missing = sorted(set(xslx_to_csv.ENGINES) - set(engines))
+    if missing:
+        print(f"not installed: {', '.join(missing)}")
+
+    work = tempfile.mkdtemp(prefix="xlsx_engines_")
+    try:
+        for n_rows in (int(size) for size in args.sizes.split(",")):
+            xlsx_path = os.path.join(work, f"export_{n_rows}.xlsx")
+            build_workbook(xlsx_path, n_rows)
+            print(f"\n{n_rows:,} rows ({os.path.getsize(xlsx_path) / 1e6:.1f} MB)")
+            reference = None
+            baseline = None
+            for engine in reversed(engines):
+                outputs = {}
+                for mode in ("pandas", "streaming"):
+                    out_dir = os.path.join(work, f"{engine}_{mode}_{n_rows}")
+                    elapsed, outputs[mode] = convert(xlsx_path, out_dir, mode, engine, args.repeat)
+                    baseline = baseline or elapsed
+                    print(f"  {engine:>9} {mode:>9}: {elapsed:7.3f}s  ({baseline / elapsed:4.1f}x)")
+                assert same_files(outputs["streaming"], outputs["pandas"]), f"{engine}: modes differ"
+                if reference is None:
+                    reference = outputs["streaming"]
+                elif not same_files(reference, outputs["streaming"]):
+                    print(f"  note: {engine} output differs from {engines[-1]}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Benchmark: peak memory of XLSX -> CSV conversion, pandas vs streaming.
+
+Builds a workbook with one large sheet (``--rows`` x 12 columns) and a
+"mixed" sheet full of values that stress type inference (ints turning into
+floats after a blank, dates gaining a time part late, NA markers, error
+cells, numeric strings, ragged and blank rows, ...).  Each mode converts it
+in a fresh subprocess, which reports its peak RSS; the CSVs of both modes
+must be byte-identical.  The default engine is the app's, ``"auto"``, which
+each mode resolves for itself.
+
+    python benchmarks/xlsx_memory.py [--rows N] [--engine auto|openpyxl|calamine] [--keep DIR]
+"""
+
+import argparse
+import filecmp
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, time as dt_time, timedelta
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+
+def _mixed_rows(n_rows: int, blank_row: bool = False):
+    """Rows whose column types only settle late in the sheet."""
+    base = datetime(2025, 7, 1)
+    yield [
+        "Int", "IntThenBlank", "Float", "Code", "TextThenNumber", "Date", "DateThenTime",
+        "Flag", "FlagText", "IntThenNA", "IntThenText", "Error", "BigInt", None, "Code",
+        "Time", "WholeFloat", "Padded", "Ragged",
+    ]
+    for i in range(n_rows):
+        late = i > n_rows * 3 // 4
+        if blank_row and i == n_rows // 2:
+            yield []  # blank row in the middle
+            continue
+        row = [
+            i,
+            None if late and i % 7 == 0 else i * 3,
+            i / 8 + 0.01,
+            f"{i % 1000:05d}",
+            "A12" if not late else str(i),
+            base + timedelta(days=i % 400),
+            base + timedelta(days=i % 30, hours=(i % 5) if late else 0, microseconds=(i % 3) * 1000 if late else 0),
+            i % 3 == 0,
+            "TRUE" if i % 2 else "False",
+            "NA" if late and i % 11 == 0 else i,
+            i if not late else f"x{i}",
+            "#N/A" if i % 13 == 0 else i,
+            2 ** 64 + i if late and i % 17 == 0 else i,
+            None,
+            f"B{i % 40}",
+            dt_time(i % 24, i % 60),
+            float(i % 9),
+            f" {i % 10} ",
+        ]
+        if i % 5:
+            row.append("tail")
+        yield row
+    yield []  # trailing blank rows are dropped by both modes
+    yield []
+
+
+def build_workbook(path: str, n_rows: int) -> None:
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    large = workbook.create_sheet("Journeys")
+    large.append(["JobRef", "Date", "Patient", "NHSNumber", "BudgetCodeText", "From", "To",
+                  "Status", "Miles", "Wait", "Total", "Notes"])
+    base = datetime(2025, 1, 1, 8, 30)
+    for i in range(n_rows):
+        large.append([
+            100000 + i, base + timedelta(minutes=17 * i), f"Patient {i % 5000}", 9000000000 + i,
+            f"BC{i % 60:03d}", "E1 1BB", "SE3 9BY", "Completed" if i % 9 else "Aborted",
+            round((i * 7) % 40 + 0.5, 1), None if i % 4 else 12.5, round(i % 97 * 1.25, 2),
+            "" if i % 3 else "Return journey",
+        ])
+    mixed = workbook.create_sheet("Mixed types")
+    for row in _mixed_rows(12_000):
+        mixed.append(row)
+    blanks = workbook.create_sheet("Blank row")
+    for row in _mixed_rows(12_000, blank_row=True):
+        blanks.append(row)
+    small = workbook.create_sheet("Small")
+    for row in _mixed_rows(40):
+        small.append(row)
+    workbook.create_sheet("Empty")
+    workbook.save(path)
+
+
+def child(mode: str, engine: str, xlsx_path: str, out_dir: str) -> None:
+    import xslx_to_csv
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    written = xslx_to_csv.xlsx_to_csv(xlsx_path, out_dir, mode=mode, engine=engine)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "elapsed": elapsed,
+        "baseline_kb": baseline,
+        "peak_kb": peak,
+        "engine": xslx_to_csv.resolve_engine(xlsx_path, engine, mode),
+        "written": [(os.path.basename(p), rows) for p, rows in written],
+    }))
+
+
+def run_mode(mode: str, engine: str, xlsx_path: str, out_dir: str) -> dict:
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", mode, engine, xlsx_path, out_dir],
+        check=True, capture_output=True, text=True, cwd=ROOT,
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000, help="rows in the large sheet")
+    parser.add_argument("--engine", default="auto",
+                        help="reader engine (calamine holds each sheet's cells in native memory)")
+    parser.add_argument("--keep", help="build/convert in this directory and keep the files")
+    parser.add_argument("--child", nargs=4, metavar=("MODE", "ENGINE", "XLSX", "OUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    work = args.keep or tempfile.mkdtemp(prefix="xlsx_bench_")
+    os.makedirs(work, exist_ok=True)
+    try:
+        xlsx_path = os.path.join(work, "weekly_export.xlsx")
+        start = time.perf_counter()
+        build_workbook(xlsx_path, args.rows)
+        print(f"workbook: {args.rows:,} + 2 x 12,000 + 40 rows, {os.path.getsize(xlsx_path) / 1e6:.1f} MB "
+              f"(built in {time.perf_counter() - start:.1f}s)")
+
+        results = {}
+        for mode in ("pandas", "streaming"):
+            results[mode] = run_mode(mode, args.engine, xlsx_path, os.path.join(work, mode))
+            r = results[mode]
+            print(f"{mode:>10} ({r['engine']:>8}): {r['elapsed']:7.1f}s  peak RSS {r['peak_kb'] / 1024:7.0f} MB  "
+                  f"(+{(r['peak_kb'] - r['baseline_kb']) / 1024:.0f} MB over imports)")
+
+        assert results["pandas"]["written"] == results["streaming"]["written"], "row counts differ"
+        for name, rows in results["pandas"]["written"]:
+            a = os.path.join(work, "pandas", "weekly_export", name)
+            b = os.path.join(work, "streaming", "weekly_export", name)
+            assert filecmp.cmp(a, b, shallow=False), f"{name} differs between modes"
+            print(f"  identical: {name} ({rows:,} rows)")
+    finally:
+        if not args.keep:
+            shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
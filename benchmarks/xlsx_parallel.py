@@ -0,0 +1,102 @@
+"""
+Benchmark: multi-workbook XLSX conversion, sequential vs process pool.
+
+Builds a month-end style batch (``--workbooks`` workbooks of ``--sheets``
+sheets each) and converts it with ``xlsx_to_csv`` one workbook after another,
+then with ``conversion_service.convert_workbooks`` at increasing worker
+counts (up to the CPU count).  Pools are warmed up before timing, and every
+parallel run must produce the same CSVs as the sequential one.
+
+    python benchmarks/xlsx_parallel.py [--workbooks 12] [--sheets 4] [--rows 5000]
+"""
+
+import argparse
+import asyncio
+import filecmp
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import config  # noqa: E402
+import executors  # noqa: E402
+import xslx_to_csv  # noqa: E402
+from services import conversion_service  # noqa: E402
+
+
+def build_workbook(path: str, n_sheets: int, n_rows: int, seed: int) -> None:
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    base = datetime(2025, 1, 1, 8, 30)
+    for s in range(n_sheets):
+        sheet = workbook.create_sheet(f"Hospital {s + 1}")
+        sheet.append(["JobRef", "Date", "Patient", "BudgetCodeText", "Status", "Miles", "Total"])
+        for i in range(n_rows):
+            sheet.append([
+                seed * 10 ** 6 + s * 10 ** 5 + i, base + timedelta(minutes=17 * i), f"Patient {i % 900}",
+                f"BC{(i + s) % 60:03d}", "Completed" if i % 9 else "Aborted",
+                round((i * 7) % 40 + 0.5, 1), round(i % 97 * 1.25, 2),
+            ])
+    workbook.save(path)
+
+
+def run_parallel(paths: list[str], out_dir: str, workers: int) -> tuple[float, list]:
+    config.CPU_WORKERS = workers
+    executors.shutdown()
+    warmup = os.path.join(out_dir, "warmup")
+    asyncio.run(conversion_service.convert_workbooks(paths[:1], warmup))
+    shutil.rmtree(warmup)
+    start = time.perf_counter()
+    written = asyncio.run(conversion_service.convert_workbooks(paths, out_dir))
+    return time.perf_counter() - start, [(path, rows) for path, rows, _sha in written]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workbooks", type=int, default=12)
+    parser.add_argument("--sheets", type=int, default=4)
+    parser.add_argument("--rows", type=int, default=5000, help="rows per sheet")
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    work = tempfile.mkdtemp(prefix="xlsx_parallel_")
+    try:
+        paths = []
+        for w in range(args.workbooks):
+            path = os.path.join(work, f"hospital_group_{w + 1:02d}.xlsx")
+            build_workbook(path, args.sheets, args.rows, w)
+            paths.append(path)
+        total_rows = args.workbooks * args.sheets * args.rows
+        print(f"{args.workbooks} workbooks x {args.sheets} sheets x {args.rows:,} rows "
+              f"= {total_rows:,} rows, engine {xslx_to_csv.resolve_engine(paths[0])}, {cpus} CPU(s)")
+
+        start = time.perf_counter()
+        sequential = []
+        for path in paths:
+            sequential += xslx_to_csv.xlsx_to_csv(path, os.path.join(work, "sequential"))
+        baseline = time.perf_counter() - start
+        print(f"  sequential : {baseline:7.2f}s  {total_rows / baseline:9,.0f} rows/s")
+
+        workers = 1
+        while True:
+            elapsed, written = run_parallel(paths, os.path.join(work, f"pool_{workers}"), workers)
+            print(f"  {workers:2d} worker(s): {elapsed:7.2f}s  {total_rows / elapsed:9,.0f} rows/s  "
+                  f"({baseline / elapsed:.1f}x)")
+            assert [rows for _, rows in written] == [rows for _, rows in sequential], "row counts differ"
+            for (a, _), (b, _) in zip(sequential, written):
+                assert filecmp.cmp(a, b, shallow=False), f"{os.path.basename(a)} differs"
+            if workers >= cpus:
+                break
+            workers = min(workers * 2, cpus)
+        executors.shutdown()
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
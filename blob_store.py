@@ -0,0 +1,185 @@
+"""
+Content-addressed store for uploaded and derived files.
+
+Every CSV/XLSX a session keeps is also linked into ``config.BLOB_STORE_DIR``
+under its SHA-256::
+
+    temp/blobs/3f/3f9a…e1
+
+Session files are hard links to these blobs, so identical bytes — the same
+weekly export uploaded twice, a split CSV copied into a combined session or
+a batch — sit on disk once and are "copied" by creating a link.  A blob's
+reference count is its link count: once no session links to it any more
+(``st_nlink == 1``) the reaper deletes it.
+
+Where hard links are unavailable (another filesystem, FAT, …) files are
+copied instead and everything keeps working without the sharing.  Session
+files must never be rewritten in place; writers create new files, and
+:func:`link` replaces any existing destination rather than writing into it.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import time
+from typing import Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def blob_dir() -> str:
+    """Return the blob directory, creating it on first use."""
+    path = config.BLOB_STORE_DIR or os.path.join(config.TEMP_DIR, "blobs")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def blob_path(digest: str) -> str:
+    """Return where the blob with SHA-256 *digest* lives (it may not exist)."""
+    return os.path.join(blob_dir(), digest[:2], digest)
+
+
+def file_sha256(path: str) -> str:
+    """Return the hex SHA-256 of the file at *path*, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _link_atomic(src: str, dest: str) -> None:
+    """Make *dest* a hard link to *src*, replacing whatever *dest* was."""
+    tmp = os.path.join(os.path.dirname(dest), f".link_{os.urandom(8).hex()}")
+    try:
+        os.link(src, tmp)
+        os.replace(tmp, dest)
+    except BaseException:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def adopt(path: str, digest: Optional[str] = None) -> str:
+    """Put the file at *path* into the store and return its SHA-256.
+
+    New content is linked into the store as-is (no copy).  If the store
+    already holds the same bytes, *path* is replaced by a link to that blob,
+    freeing the duplicate.  Without hard-link support this only hashes.
+    """
+    digest = digest or file_sha256(path)
+    blob = blob_path(digest)
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    try:
+        try:
+            blob_stat = os.stat(blob)
+        except FileNotFoundError:
+            _link_atomic(path, blob)
+            return digest
+        if blob_stat.st_ino != os.stat(path).st_ino:
+            _link_atomic(blob, path)
+    except OSError as e:
+        logger.debug("Could not share %s through the blob store: %s", path, e)
+    return digest
+
+
+def link(digest: str, dest: str, fallback_src: Optional[str] = None) -> None:
+    """Create *dest* with the content of blob *digest*.
+
+    Hard-links when possible, otherwise copies — from the blob, or from
+    *fallback_src* when the blob is missing (e.g. never stored).
+    """
+    blob = blob_path(digest)
+    try:
+        _link_atomic(blob, dest)
+        return
+    except FileNotFoundError:
+        if fallback_src is None:
+            raise
+        src = fallback_src
+    except OSError:
+        src = blob if os.path.exists(blob) else fallback_src
+        if src is None:
+            raise
+    if os.path.lexists(dest):
+        os.remove(dest)
+    shutil.copyfile(src, dest)
+
+
+def ingest_file(src: str, dest: str, digest: Optional[str] = None) -> str:
+    """Store *src* (hash given or computed) and link it to *dest*; return the hash."""
+    digest = adopt(src, digest)
+    link(digest, dest, fallback_src=src)
+    return digest
+
+
+def place(src: str, dest: str, digest: str) -> None:
+    """Move *src*, whose SHA-256 is *digest*, to *dest* and into the store.
+
+    A rename when *src* is on the same filesystem (uploads are staged under
+    ``TEMP_DIR``); if the store already has the bytes, *dest* links to that
+    blob and *src* is dropped.
+    """
+    if os.path.exists(blob_path(digest)):
+        try:
+            link(digest, dest)
+            os.remove(src)
+            return
+        except FileNotFoundError:
+            pass  # collected in between; move it in below
+    if os.path.lexists(dest):
+        os.remove(dest)
+    shutil.move(src, dest)
+    adopt(dest, digest)
+
+
+def blob_inodes() -> dict[tuple[int, int], int]:
+    """Return ``{(st_dev, st_ino): size}`` for every file in the store.
+
+    The reaper uses it to tell a session file's link to its blob from links
+    held by other sessions.
+    """
+    inodes = {}
+    for dirpath, _dirs, files in os.walk(blob_dir()):
+        for name in files:
+            try:
+                st = os.lstat(os.path.join(dirpath, name))
+            except OSError:
+                continue
+            inodes[(st.st_dev, st.st_ino)] = st.st_size
+    return inodes
+
+
+def collect_garbage(now: Optional[float] = None, grace: Optional[float] = None) -> tuple[int, int]:
+    """Delete blobs no session links to any more; return ``(count, bytes)``.
+
+    A blob is only collected once its link count has been 1 for *grace*
+    seconds (link changes update ``st_ctime``), so a blob that was just
+    stored and is about to be linked is left alone.  Deleting a blob never
+    loses data a session still uses — the session's own link keeps it.
+    """
+    now = now or time.time()
+    grace = config.BLOB_GC_GRACE if grace is None else grace
+    root = blob_dir()
+    removed = reclaimed = 0
+    for dirpath, _dirs, files in os.walk(root):
+        for name in files:
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.lstat(path)
+            except OSError:
+                continue
+            stale_temp = name.startswith(".") and now - st.st_mtime > grace
+            if (st.st_nlink == 1 and now - st.st_ctime > grace) or stale_temp:
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                removed += 1
+                reclaimed += st.st_size
+    return removed, reclaimed
@@ -0,0 +1,249 @@
+"""
+Columnar sidecars for the CSVs stage 1 produces.
+
+Every derived CSV recorded in a session manifest gets an Arrow IPC (Feather
+v2, uncompressed) file next to it::
+
+    temp/convert_<hex>_<suffix>/split_csvs/BARTS_HDU.csv
+    temp/convert_<hex>_<suffix>/split_csvs/.BARTS_HDU.csv.arrow
+
+holding the frame ``pd.read_csv`` gives for the CSV, plus the raw text of
+every column it parses as numbers or booleans (for readers that want those
+as strings, e.g. identifiers).  Later stages call :func:`read_csv` and
+:func:`read_header` instead of parsing the CSV again: the sidecar is
+memory-mapped and only the requested columns are converted.  The CSV stays
+the file users download.
+
+Sidecars are built on a background thread (:func:`build_later`), so writing
+a CSV never waits for one; a CSV read before its sidecar is ready is parsed
+as usual.  A sidecar records the size and mtime of the CSV it was built
+from and is ignored once they no longer match; session files are never
+rewritten in place, so this only happens to copies.  Sidecars are only written when the
+round trip reproduces ``read_csv`` exactly (not for columns pandas itself
+reads with mixed types), and everything falls back to parsing the CSV when
+pyarrow is not installed (``pip install pyarrow``) or ``COLUMNAR_CACHE`` is
+off.
+"""
+
+import importlib.util
+import json
+import logging
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional
+
+import pandas as pd
+
+import config
+
+logger = logging.getLogger(__name__)
+
+SIDECAR_SUFFIX = ".arrow"
+SIDECAR_VERSION = 1
+
+_METADATA_KEY = b"batchinvoicer"
+# Field names of the raw-text copies; never a CSV header
+_TEXT_PREFIX = "\x00text:"
+
+# One background thread builds sidecars in the order they are queued.
+_builder: Optional[ThreadPoolExecutor] = None
+_builder_lock = threading.Lock()
+
+
+def available() -> bool:
+    """Return whether sidecars are enabled and pyarrow is installed."""
+    return config.COLUMNAR_CACHE and importlib.util.find_spec("pyarrow") is not None
+
+
+def sidecar_path(csv_path: str) -> str:
+    """Return where the sidecar of *csv_path* lives (a hidden file beside it)."""
+    directory, name = os.path.split(csv_path)
+    return os.path.join(directory, f".{name}{SIDECAR_SUFFIX}")
+
+
+def _csv_key(csv_path: str) -> dict:
+    stat = os.stat(csv_path)
+    return {"csv_size": stat.st_size, "csv_mtime_ns": stat.st_mtime_ns}
+
+
+def write_sidecar(csv_path: str) -> bool:
+    """Build the sidecar of *csv_path*; return whether one was written.
+
+    Never raises for CSVs that cannot be represented (they are simply read
+    from the CSV later).
+    """
+    if not available():
+        return False
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    try:
+        key = _csv_key(csv_path)
+        frame = pd.read_csv(csv_path)
+        positions = [i for i, dtype in enumerate(frame.dtypes) if not isinstance(dtype, pd.StringDtype)]
+        text = pd.read_csv(csv_path, usecols=positions, dtype=str) if positions else pd.DataFrame()
+
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        # name -> field with its raw text, or None where str(value) gives it back
+        text_fields = {}
+        for name in text.columns:
+            if _same_frame(frame[[name]].astype("str"), text[[name]]):
+                text_fields[name] = None
+                continue
+            text_fields[name] = f"{_TEXT_PREFIX}{name}"
+            table = table.append_column(text_fields[name], pa.array(text[name], type=pa.string(), from_pandas=True))
+
+        metadata = {"version": SIDECAR_VERSION, "columns": list(frame.columns), "text": text_fields, **key}
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}), _METADATA_KEY: json.dumps(metadata).encode("utf-8"),
+        })
+        if not (_same_frame(_select(table, metadata, list(frame.columns)), frame)
+                and _same_frame(_select(table, metadata, list(text.columns), text.columns), text)):
+            logger.debug("Not caching %s: the Arrow round trip changes it", csv_path)
+            return False
+
+        path = sidecar_path(csv_path)
+        tmp_path = f"{path}.{os.urandom(4).hex()}.tmp"
+        try:
+            feather.write_feather(table, tmp_path, compression="uncompressed")
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return True
+    except (ValueError, TypeError, OSError, pd.errors.ParserError, pd.errors.EmptyDataError, pa.ArrowException) as e:
+        logger.debug("Not caching %s: %s", csv_path, e)
+        return False
+
+
+def build_later(csv_paths: Iterable[str]) -> None:
+    """Queue the sidecars of *csv_paths* to be built on the background thread."""
+    global _builder
+    if not available():
+        return
+    with _builder_lock:
+        if _builder is None:
+            _builder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sidecar")
+        for csv_path in csv_paths:
+            _builder.submit(_build, csv_path)
+
+
+def _build(csv_path: str) -> None:
+    try:
+        write_sidecar(csv_path)
+    except Exception:
+        logger.exception("Could not build the sidecar of %s", csv_path)
+
+
+def shutdown() -> None:
+    """Stop the background thread, dropping sidecars not built yet (app shutdown)."""
+    global _builder
+    with _builder_lock:
+        builder, _builder = _builder, None
+    if builder is not None:
+        builder.shutdown(wait=True, cancel_futures=True)
+
+
+def copy_sidecar(src_csv: str, dest_csv: str) -> bool:
+    """Give *dest_csv* — a link or copy of *src_csv* — the sidecar of *src_csv*.
+
+    The sidecar is hard-linked (copied without link support); it only counts
+    if *dest_csv* has the size and mtime it was built for.  Without one to
+    copy (not built yet, or *dest_csv* differs) *dest_csv* gets its own, later.
+    """
+    metadata = _metadata(src_csv)
+    if metadata is None or _csv_key(dest_csv) != {k: metadata[k] for k in ("csv_size", "csv_mtime_ns")}:
+        build_later([dest_csv])
+        return False
+    src, dest = sidecar_path(src_csv), sidecar_path(dest_csv)
+    try:
+        if os.path.lexists(dest):
+            os.remove(dest)
+        try:
+            os.link(src, dest)
+        except OSError:
+            shutil.copyfile(src, dest)
+        return True
+    except OSError as e:
+        logger.debug("Could not copy sidecar of %s: %s", src_csv, e)
+        return False
+
+
+def read_header(csv_path: str) -> list:
+    """Return the column names of *csv_path* (``pd.read_csv(nrows=0)``)."""
+    metadata = _metadata(csv_path)
+    if metadata is not None:
+        return list(metadata["columns"])
+    return list(pd.read_csv(csv_path, nrows=0).columns)
+
+
+def read_csv(csv_path: str, usecols: Optional[Iterable] = None, text_columns: Iterable = ()) -> pd.DataFrame:
+    """Return ``pd.read_csv(csv_path, usecols=usecols, dtype={c: str for c in text_columns})``.
+
+    Served from the sidecar when *csv_path* has a valid one.
+    """
+    text_columns = set(text_columns)
+    usecols = list(usecols) if usecols is not None else None
+    table, metadata = _open(csv_path)
+    if table is not None:
+        columns = metadata["columns"]
+        if columns and (usecols is None or set(usecols) <= set(columns)) and usecols != []:
+            wanted = columns if usecols is None else [c for c in columns if c in set(usecols)]
+            return _select(table, metadata, wanted, text_columns)
+    dtype = {name: str for name in text_columns} or None
+    return pd.read_csv(csv_path, usecols=usecols, dtype=dtype)
+
+
+def _metadata(csv_path: str) -> Optional[dict]:
+    """Return the sidecar metadata of *csv_path* if it has a valid sidecar."""
+    return _open(csv_path, schema_only=True)[1]
+
+
+def _open(csv_path: str, schema_only: bool = False):
+    """Return ``(table, metadata)`` of a valid sidecar, else ``(None, None)``."""
+    if not available():
+        return None, None
+    import pyarrow as pa
+
+    try:
+        key = _csv_key(csv_path)
+        with pa.memory_map(sidecar_path(csv_path)) as source:
+            reader = pa.ipc.open_file(source)
+            raw = (reader.schema.metadata or {}).get(_METADATA_KEY)
+            metadata = json.loads(raw) if raw else None
+            if (metadata is None or metadata.get("version") != SIDECAR_VERSION
+                    or {k: metadata.get(k) for k in key} != key):
+                return None, None
+            # Buffers stay mapped after the file object is closed
+            return (None if schema_only else reader.read_all()), metadata
+    except FileNotFoundError:
+        return None, None
+    except (OSError, ValueError, pa.ArrowException) as e:
+        logger.debug("Ignoring sidecar of %s: %s", csv_path, e)
+        return None, None
+
+
+def _select(table, metadata: dict, names: list, text_columns: Iterable = ()) -> pd.DataFrame:
+    """Build the frame of columns *names*, with *text_columns* as raw text."""
+    fields = []
+    derive = []
+    for position, name in enumerate(names):
+        field = name
+        if name in text_columns and name in metadata["text"]:
+            field = metadata["text"][name]
+            if field is None:
+                field = name
+                derive.append(position)
+        fields.append(field)
+    # split_blocks: no consolidation copy; columns convert from the mapped buffers
+    frame = table.select(fields).to_pandas(split_blocks=True).set_axis(names, axis=1)
+    for position in derive:
+        frame.isetitem(position, frame.iloc[:, position].astype("str"))
+    return frame
+
+
+def _same_frame(a: pd.DataFrame, b: pd.DataFrame) -> bool:
+    return list(a.columns) == list(b.columns) and list(a.dtypes) == list(b.dtypes) and a.equals(b)
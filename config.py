@@ -46,18 +46,100 @@ INVOICE_HTML_DIR: str = os.getenv("INVOICE_HTML_DIR", "invoice html")
 STATIC_DIR: str = os.getenv("STATIC_DIR", "static")
 TEMPLATES_DIR: str = os.getenv("TEMPLATES_DIR", "templates")
 
+# ---------------------------------------------------------------------------
+# Session registry (SQLite index of TEMP_DIR, shared by all workers)
+# ---------------------------------------------------------------------------
+SESSION_REGISTRY_PATH: str = os.getenv("SESSION_REGISTRY_PATH", os.path.join(TEMP_DIR, "session_registry.sqlite3"))
+SESSION_LEASE_TTL: int = int(os.getenv("SESSION_LEASE_TTL", "3600"))  # crashed-worker safety net
+
+# ---------------------------------------------------------------------------
+# Invoice state store: "filesystem" (files per invoice) or "sqlite" (WAL database)
+# ---------------------------------------------------------------------------
+SESSION_STORE_BACKEND: str = os.getenv("SESSION_STORE_BACKEND", "filesystem").lower()
+SESSION_STORE_PATH: str = os.getenv("SESSION_STORE_PATH", os.path.join(TEMP_DIR, "session_store.sqlite3"))
+
+# ---------------------------------------------------------------------------
+# Content-addressed blob store (session files are hard links into it)
+# ---------------------------------------------------------------------------
+BLOB_STORE_DIR: str = os.getenv("BLOB_STORE_DIR", os.path.join(TEMP_DIR, "blobs"))
+BLOB_GC_GRACE: int = int(os.getenv("BLOB_GC_GRACE", "600"))  # unreferenced blobs kept this long
+
+# ---------------------------------------------------------------------------
+# Executors for blocking route work: I/O threads and CPU processes (0 = sized from the CPU count)
+# ---------------------------------------------------------------------------
+IO_WORKERS: int = int(os.getenv("IO_WORKERS", "0"))    # 0 = CPUs + 4, at most 32
+CPU_WORKERS: int = int(os.getenv("CPU_WORKERS", os.getenv("CONVERT_WORKERS", "0")))  # 0 = one per CPU
+
+# ---------------------------------------------------------------------------
+# Background jobs (SQLite queue shared by all workers; see jobs.py)
+# ---------------------------------------------------------------------------
+JOBS_DB_PATH: str = os.getenv("JOBS_DB_PATH", os.path.join(TEMP_DIR, "jobs.sqlite3"))
+JOB_CONCURRENCY: int = int(os.getenv("JOB_CONCURRENCY", "2"))           # per worker; 0 = run no jobs here
+JOB_POLL_INTERVAL: float = float(os.getenv("JOB_POLL_INTERVAL", "1"))    # seconds between queue polls
+JOB_HEARTBEAT: float = float(os.getenv("JOB_HEARTBEAT", "1"))            # progress flush + cancel check
+JOB_STALE_AFTER: int = int(os.getenv("JOB_STALE_AFTER", "60"))           # no heartbeat this long: requeue
+JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETENTION: int = int(os.getenv("JOB_RETENTION", "86400"))            # finished jobs kept 24 h
+
+# ---------------------------------------------------------------------------
+# Uploads: streamed to the staging dir, then moved into their session (0 disables a limit)
+# ---------------------------------------------------------------------------
+UPLOAD_STAGING_DIR: str = os.getenv("UPLOAD_STAGING_DIR", os.path.join(TEMP_DIR, ".incoming"))
+UPLOAD_MAX_FILE_MB: int = int(os.getenv("UPLOAD_MAX_FILE_MB", "512"))
+UPLOAD_MAX_REQUEST_MB: int = int(os.getenv("UPLOAD_MAX_REQUEST_MB", "2048"))
+
+# ---------------------------------------------------------------------------
+# XLSX conversion: "streaming" (bounded memory) or "pandas" (whole sheet in memory)
+# ---------------------------------------------------------------------------
+XLSX_CONVERT_MODE: str = os.getenv("XLSX_CONVERT_MODE", "streaming").lower()
+XLSX_READER_ENGINE: str = os.getenv("XLSX_READER_ENGINE", "auto").lower()  # auto (openpyxl when streaming) | calamine (pip install python-calamine) | openpyxl
+
+# ---------------------------------------------------------------------------
+# CSV splitting by budget code: uploads above the threshold are split in chunks
+# ---------------------------------------------------------------------------
+SPLIT_STREAMING_THRESHOLD_MB: int = int(os.getenv("SPLIT_STREAMING_THRESHOLD_MB", "256"))  # 0 = always stream
+SPLIT_CHUNK_ROWS: int = int(os.getenv("SPLIT_CHUNK_ROWS", "100000"))
+SPLIT_MAX_OPEN_FILES: int = int(os.getenv("SPLIT_MAX_OPEN_FILES", "64"))
+
+# ---------------------------------------------------------------------------
+# Columnar sidecars (Arrow IPC) for stage-1 CSVs; needs pyarrow, else CSVs are parsed
+# ---------------------------------------------------------------------------
+COLUMNAR_CACHE: bool = os.getenv("COLUMNAR_CACHE", "true").lower() == "true"
+
+# ---------------------------------------------------------------------------
+# Temp-directory reaper (0 disables a limit)
+# ---------------------------------------------------------------------------
+REAPER_ENABLED: bool = os.getenv("REAPER_ENABLED", "true").lower() == "true"
+REAPER_INTERVAL: int = int(os.getenv("REAPER_INTERVAL", "300"))                # 5 min
+SESSION_TTL: int = int(os.getenv("SESSION_TTL", "86400"))                      # 24 h since last access
+INVOICE_HTML_TTL: int = int(os.getenv("INVOICE_HTML_TTL", "86400"))
+USER_QUOTA_BYTES: int = int(os.getenv("USER_QUOTA_BYTES", str(2 * 1024 ** 3)))     # 2 GiB
+GLOBAL_QUOTA_BYTES: int = int(os.getenv("GLOBAL_QUOTA_BYTES", str(20 * 1024 ** 3)))  # 20 GiB
+
 # ---------------------------------------------------------------------------
 # Invoice templates
 # ---------------------------------------------------------------------------
 INVOICE_TEMPLATE_STYLE1: str = "Invoice 2.html"
 INVOICE_TEMPLATE_STYLE2: str = "Invoice 2 - Style 2.html"
 DEFAULT_INVOICE_STYLE: str = "style1"
+JINJA_BYTECODE_DIR: str = os.getenv("JINJA_BYTECODE_DIR", os.path.join(TEMP_DIR, ".jinja_bytecode"))  # "" disables
+TEMPLATE_AUTO_RELOAD: bool = os.getenv("TEMPLATE_AUTO_RELOAD", str(not IS_PRODUCTION)).lower() == "true"  # mtime check
+INVOICE_FIRST_PAGE_ROWS: int = int(os.getenv("INVOICE_FIRST_PAGE_ROWS", "13"))  # line items under the first heading
+INVOICE_ROWS_PER_PAGE: int = int(os.getenv("INVOICE_ROWS_PER_PAGE", "14"))      # line items on each later page
+
+# ---------------------------------------------------------------------------
+# Render cache: rendered invoice HTML on disk, least recently used evicted ("" disables)
+# ---------------------------------------------------------------------------
+RENDER_CACHE_DIR: str = os.getenv("RENDER_CACHE_DIR", os.path.join(TEMP_DIR, "render_cache"))
+RENDER_CACHE_MAX_BYTES: int = int(os.getenv("RENDER_CACHE_MAX_BYTES", str(512 * 1024 ** 2)))  # 512 MiB
 
 # ---------------------------------------------------------------------------
 # Static assets
 # ---------------------------------------------------------------------------
 LOGO_FILENAME: str = "bears-pts logo.jpg"
 PAID_STAMP_FILENAME: str = "PAID STAMP.png"
+EXPORT_ASSET_MODE: str = os.getenv("EXPORT_ASSET_MODE", "embedded")  # download-all ZIP images: "embedded" or "linked"
+EXPORT_ASSETS_DIR: str = "assets"  # ZIP folder holding each image once in linked mode
 
 # ---------------------------------------------------------------------------
 # Business defaults — bank details, VAT, etc.
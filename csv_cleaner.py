@@ -1,3 +1,4 @@
+import io
 import logging
 import os
 import pickle
@@ -6,13 +7,55 @@ from pathlib import Path
 
 import pandas as pd
 
+import columnar_cache
+
 logger = logging.getLogger(__name__)
 
 
+# Columns kept from the Cleric export (it has 120+)
+COLUMNS_TO_KEEP = [
+    'Start Date',
+    'Record ID',
+    'Pas Number',
+    'Passenger UPC',
+    'Contract Hospital Text',
+    'Caller',
+    'From Postcode',
+    'To Postcode',
+    'Direction Text',
+    'Jrny Status Text',
+    'Actual Mileage',
+    'Mobility Abbreviation',
+    'Waiting Time Reason',
+    'Forename',
+    'Surname',
+    'Patient Road',
+    'Patient Town',
+    'Patient Postcode',
+    'Start Date range'
+]
+
+# References and codes: read as text so "00123" keeps its zeros and an ID
+# column with blanks is not turned into floats ("1005.0").
+IDENTIFIER_COLUMNS = ['Record ID', 'Pas Number', 'Passenger UPC', 'Caller', 'Mobility Abbreviation']
+
+# Everything but the mileage (used as a number) is text
+COLUMN_DTYPES = {col: str for col in COLUMNS_TO_KEEP if col != 'Actual Mileage'}
+
+# Whole numbers Excel stored as floats, as CSVs converted from XLSX contain them
+_WHOLE_FLOAT = r'^(-?\d+)\.0$'
+
+
 def csv_to_dataframe(csv_file_path):
     """
     Read a CSV file and convert it to a pandas DataFrame.
     Only keeps the specified columns in the DataFrame.
+
+    The header is read first to find which of ``COLUMNS_TO_KEEP`` exist;
+    only those are parsed, with the dtypes in ``COLUMN_DTYPES`` (from the
+    columnar sidecar when the CSV has one).
+    Identifier columns stay strings, with an Excel-style ``.0`` removed
+    from whole numbers.
     
     Args:
         csv_file_path (str): Path to the input CSV file
@@ -20,51 +63,78 @@ def csv_to_dataframe(csv_file_path):
     Returns:
         pd.DataFrame: The DataFrame containing only the specified columns
     """
-    # Define the columns to keep
-    columns_to_keep = [
-        'Start Date',
-        'Record ID',
-        'Pas Number',
-        'Passenger UPC',
-        'Contract Hospital Text',
-        'Caller',
-        'From Postcode',
-        'To Postcode',
-        'Direction Text',
-        'Jrny Status Text',
-        'Actual Mileage',
-        'Mobility Abbreviation',
-        'Waiting Time Reason',
-        'Forename',
-        'Surname',
-        'Patient Road',
-        'Patient Town',
-        'Patient Postcode',
-        'Start Date range'
-    ]
-    
     # Validate input file exists
     if not os.path.exists(csv_file_path):
         raise FileNotFoundError(f"File not found: {csv_file_path}")
     
     try:
-        df = pd.read_csv(csv_file_path)
-        logger.info("Loaded CSV %s (%d rows, %d cols)", csv_file_path, *df.shape)
-
-        existing_columns = [col for col in columns_to_keep if col in df.columns]
-        missing_columns = [col for col in columns_to_keep if col not in df.columns]
+        header = columnar_cache.read_header(csv_file_path)
+        existing_columns = [col for col in COLUMNS_TO_KEEP if col in header]
+        missing_columns = [col for col in COLUMNS_TO_KEEP if col not in header]
 
         if missing_columns:
             logger.warning("Columns not found in CSV: %s", missing_columns)
 
+        df = columnar_cache.read_csv(
+            csv_file_path,
+            usecols=existing_columns,
+            text_columns=[col for col in existing_columns if COLUMN_DTYPES.get(col) is str],
+        )
         df = df[existing_columns]
-        logger.debug("Filtered to %d rows, %d cols: %s", *df.shape, existing_columns)
+        logger.info("Loaded CSV %s (%d rows, %d of %d cols)", csv_file_path, len(df), len(existing_columns), len(header))
 
-        return df
+        return _normalise_identifiers(df)
     except (FileNotFoundError, pd.errors.ParserError, pd.errors.EmptyDataError, OSError) as e:
         raise ValueError(f"Error reading CSV file: {str(e)}") from e
 
 
+def frame_to_dataframe(frame):
+    """
+    Return what ``csv_to_dataframe`` gives for ``frame.to_csv(index=False)``.
+
+    For frames read with inferred types (as ``divider`` reads an export) whose
+    CSV is never written: text columns are taken as they are, and the rest —
+    numbers, the mileage, mixed columns — go through an in-memory CSV of just
+    those columns, so every value is typed exactly as the written file would
+    have been parsed.
+
+    Args:
+        frame (pd.DataFrame): Rows of an export, with ``pd.read_csv`` types
+
+    Returns:
+        pd.DataFrame: The DataFrame containing only the specified columns
+    """
+    existing_columns = [col for col in COLUMNS_TO_KEEP if col in frame.columns]
+    missing_columns = [col for col in COLUMNS_TO_KEEP if col not in frame.columns]
+
+    if missing_columns:
+        logger.warning("Columns not found in CSV: %s", missing_columns)
+
+    df = frame[existing_columns].reset_index(drop=True)
+    reparse = [
+        col for col in existing_columns
+        if COLUMN_DTYPES.get(col) is not str or not isinstance(df[col].dtype, pd.StringDtype)
+    ]
+    if reparse:
+        parsed = pd.read_csv(
+            io.StringIO(df[reparse].to_csv(index=False)),
+            dtype={col: str for col in reparse if COLUMN_DTYPES.get(col) is str},
+        )
+        for col in reparse:
+            df[col] = parsed[col]
+    return _normalise_identifiers(df)
+
+
+def _normalise_identifiers(df):
+    for col in IDENTIFIER_COLUMNS:
+        if col in df.columns:
+            # The regex only runs on the few candidates; most exports have none
+            candidates = df[col].str.endswith('.0', na=False)
+            if candidates.any():
+                df.loc[candidates, col] = df.loc[candidates, col].str.replace(_WHOLE_FLOAT, r'\1', regex=True)
+    return df
+
+
 if __name__ == "__main__":
     # Get CSV file path from command line argument or use default
     if len(sys.argv) > 1:
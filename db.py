@@ -0,0 +1,91 @@
+"""
+Small helpers shared by the SQLite-backed stores (session registry, session store).
+
+Each database runs in WAL mode so that every uvicorn worker process can read
+while another writes.  Connections are cached per thread and per process — a
+forked or spawned worker never reuses its parent's handle.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+@contextmanager
+def transaction(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """Run a block inside ``BEGIN IMMEDIATE`` … ``COMMIT`` (rolled back on error)."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def connect(
+    path: str, schema: str, version: int, reset_on_mismatch: bool = False,
+    migrations: Optional[dict[int, str]] = None,
+) -> sqlite3.Connection:
+    """Return this thread's connection to *path*, creating *schema* on first use.
+
+    The schema version is kept in ``PRAGMA user_version``.  A database written
+    by an older version is upgraded in place when *migrations* maps every
+    version in between to the SQL script taking it to the next one (*schema*
+    then adds any new tables and indexes).  Otherwise a database written by
+    another version is dropped and recreated when *reset_on_mismatch* is set
+    (for indexes that can be rebuilt), or it is an error.
+    """
+    conns = getattr(_local, "conns", None)
+    if conns is None or _local.pid != os.getpid():
+        conns = _local.conns = {}
+        _local.pid = os.getpid()
+    conn = conns.get(path)
+    if conn is not None:
+        return conn
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    _ensure_schema(conn, path, schema, version, reset_on_mismatch, migrations or {})
+    conns[path] = conn
+    return conn
+
+
+def _ensure_schema(
+    conn: sqlite3.Connection, path: str, schema: str, version: int, reset_on_mismatch: bool,
+    migrations: dict[int, str],
+) -> None:
+    with transaction(conn):
+        current = conn.execute("PRAGMA user_version").fetchone()[0]
+        if current == version:
+            return
+        if current and all(v in migrations for v in range(current, version)):
+            logger.info("%s schema %s -> %s, migrating", path, current, version)
+            for from_version in range(current, version):
+                _run_script(conn, migrations[from_version])
+        elif current:
+            if not reset_on_mismatch:
+                raise RuntimeError(f"{path} has schema version {current}, expected {version}")
+            logger.info("%s schema %s -> %s, dropping tables", path, current, version)
+            for (name,) in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+            ).fetchall():
+                conn.execute(f'DROP TABLE IF EXISTS "{name}"')
+        _run_script(conn, schema)
+        conn.execute(f"PRAGMA user_version = {version}")
+
+
+def _run_script(conn: sqlite3.Connection, script: str) -> None:
+    # executescript() would commit the open transaction
+    for statement in script.split(";"):
+        if statement.strip():
+            conn.execute(statement)
@@ -1,9 +1,13 @@
 import logging
 import os
 import re
+from collections import OrderedDict
 
+import numpy as np
 import pandas as pd
 
+import config
+
 logger = logging.getLogger(__name__)
 
 def sanitize_filename(filename):
@@ -16,82 +20,226 @@ def sanitize_filename(filename):
     filename = re.sub(r'[\s_]+', '_', filename)
     return filename
 
-def split_csv_by_budget_code(input_file, output_dir='output'):
+# Budget codes that should be combined into one file.
+# Format: {group_name: [list of budget codes to combine]}
+# Note: Use the exact values as they appear in the CSV
+COMBINED_GROUPS = {
+    'BARTS_HDU': ['BARTS BHOC HDU', 'BARTS HDU']
+}
+
+NO_BUDGET_CODE_FILENAME = 'No_BudgetCode.csv'
+
+SPLIT_MODES = ("memory", "streaming")
+
+
+def budget_code_filename(budget_code, code_to_group=None):
+    """Return the output file name for a budget code (combined groups included)."""
+    code_to_group = _code_to_group() if code_to_group is None else code_to_group
+    if pd.isna(budget_code) or budget_code == '':
+        return NO_BUDGET_CODE_FILENAME
+    name = code_to_group.get(budget_code, budget_code)
+    safe_name = sanitize_filename(str(name))
+    return f"{safe_name}.csv" if safe_name else NO_BUDGET_CODE_FILENAME
+
+
+def _code_to_group():
+    # Reverse mapping: budget_code -> group_name
+    return {code: group_name for group_name, codes in COMBINED_GROUPS.items() for code in codes}
+
+
+def split_csv_by_budget_code(input_file, output_dir='output', mode=None):
     """
     Split a CSV file into multiple CSV files based on BudgetCodeText column.
     Each unique BudgetCodeText value gets its own CSV file.
     Special case: BARTS_BHOC_HDU and BARTS_HDU are combined into one file.
+
+    Every distinct code is mapped to its output file once; rows are then
+    bucketed by file in a single pass and each file is written once, in
+    order of first appearance, keeping the rows in input order.  Codes whose
+    file names coincide (a combined group, or names that only differ in
+    characters the sanitiser replaces) share one file, and rows without a
+    budget code go to ``No_BudgetCode.csv``.
+
+    ``mode`` is ``"memory"`` (read the whole file at once) or
+    ``"streaming"`` (read ``config.SPLIT_CHUNK_ROWS`` rows at a time, see
+    :func:`_split_streaming`); by default files larger than
+    ``config.SPLIT_STREAMING_THRESHOLD_MB`` are streamed.  Both modes write
+    the same bytes.
+
+    Returns a list of ``(output_path, row_count)`` for every file written.
     """
-    # Define budget codes that should be combined into one file
-    # Format: {group_name: [list of budget codes to combine]}
-    # Note: Use the exact values as they appear in the CSV
-    combined_groups = {
-        'BARTS_HDU': ['BARTS BHOC HDU', 'BARTS HDU']
-    }
-    
-    # Create a reverse mapping: budget_code -> group_name
-    budget_code_to_group = {}
-    for group_name, codes in combined_groups.items():
-        for code in codes:
-            budget_code_to_group[code] = group_name
-    
-    logger.info("Reading CSV file: %s", input_file)
-    df = pd.read_csv(input_file)
-    
-    # Check if BudgetCodeText column exists
-    if 'BudgetCodeText' not in df.columns:
-        raise ValueError("Column 'BudgetCodeText' not found in the CSV file")
-    
+    mode = mode or split_mode(input_file)
+    if mode not in SPLIT_MODES:
+        raise ValueError(f"Unknown split mode '{mode}' (expected one of {', '.join(SPLIT_MODES)})")
+
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
-    
-    # Get unique BudgetCodeText values
-    unique_budget_codes = df['BudgetCodeText'].unique()
-    logger.info("Found %d unique BudgetCodeText values", len(unique_budget_codes))
-    
-    # Track which groups have been processed
-    processed_groups = set()
-    
-    # Group by BudgetCodeText and create separate CSV files
-    for budget_code in unique_budget_codes:
-        # Check if this budget code belongs to a combined group
-        if budget_code in budget_code_to_group:
-            group_name = budget_code_to_group[budget_code]
-            
-            # Skip if we've already processed this group
-            if group_name in processed_groups:
-                continue
-            
-            # Mark this group as processed
-            processed_groups.add(group_name)
-            
-            # Get all budget codes in this group
-            codes_to_combine = combined_groups[group_name]
-            
-            # Filter rows for all codes in this group
-            filtered_df = df[df['BudgetCodeText'].isin(codes_to_combine)]
-            
-            # Create safe filename
-            safe_name = sanitize_filename(group_name)
-            filename = f"{safe_name}.csv"
-        else:
-            # Regular processing for non-combined codes
-            # Filter rows for this budget code
-            filtered_df = df[df['BudgetCodeText'] == budget_code]
-            
-            # Create safe filename
-            if pd.isna(budget_code) or budget_code == '':
-                filename = 'No_BudgetCode.csv'
-            else:
-                safe_name = sanitize_filename(str(budget_code))
-                filename = f"{safe_name}.csv"
-        
-        output_path = os.path.join(output_dir, filename)
-        
-        filtered_df.to_csv(output_path, index=False)
-        logger.info("Created: %s (%d rows)", output_path, len(filtered_df))
+
+    logger.info("Reading CSV file: %s (%s)", input_file, mode)
+    if mode == "streaming":
+        written = _split_streaming(input_file, output_dir)
+    else:
+        written = _split_in_memory(input_file, output_dir)
 
     logger.info("All files created in '%s' directory", output_dir)
+    return written
+
+
+def budget_code_frames(input_file, columns=None):
+    """Yield ``(filename, frame)`` for every file :func:`split_csv_by_budget_code` would write.
+
+    The same rows, in the same order, with the types ``pd.read_csv`` infers
+    for the whole input (one dtype per column, as the split files get) — without writing anything.  ``columns`` limits the
+    columns read (names missing from the input are skipped; the budget code
+    is always read but only returned if asked for).
+    """
+    usecols = None if columns is None else (set(columns) | {'BudgetCodeText'}).__contains__
+    df = pd.read_csv(input_file, usecols=usecols, low_memory=False)
+    _check_columns(df.columns)
+    budget_codes = df['BudgetCodeText']
+    if columns is not None and 'BudgetCodeText' not in columns:
+        df = df.drop(columns='BudgetCodeText')
+
+    for filename, rows in _bucket_by_file(budget_codes, {}, _code_to_group()):
+        yield filename, df.take(rows)
+
+
+def split_mode(input_file):
+    """Return the split mode used by default for *input_file*: ``"streaming"`` above the threshold."""
+    threshold = config.SPLIT_STREAMING_THRESHOLD_MB * 1024 * 1024
+    return "streaming" if os.path.getsize(input_file) > threshold else "memory"
+
+
+def _check_columns(columns):
+    # Check if BudgetCodeText column exists
+    if 'BudgetCodeText' not in columns:
+        raise ValueError("Column 'BudgetCodeText' not found in the CSV file")
+
+
+def _bucket_by_file(budget_codes, filenames, code_to_group):
+    """Yield ``(filename, row_positions)`` for every output file the rows touch.
+
+    ``filenames`` maps file name -> id and is extended with the names of
+    codes not seen before, so ids follow the order of first appearance.
+    """
+    # One code per row -> index into the distinct codes (NaN included)
+    code_index, unique_budget_codes = pd.factorize(budget_codes, use_na_sentinel=False)
+
+    # Distinct code -> output file
+    code_file = np.array(
+        [filenames.setdefault(budget_code_filename(code, code_to_group), len(filenames))
+         for code in unique_budget_codes],
+        dtype=np.intp,
+    )
+
+    # Bucket rows by file: a stable sort keeps each file's rows in input order
+    row_file = code_file[code_index]
+    order = np.argsort(row_file, kind='stable')
+    counts = np.bincount(row_file, minlength=len(filenames))
+    bounds = np.concatenate(([0], np.cumsum(counts)))
+    names = list(filenames)
+    for file_id in np.flatnonzero(counts):
+        yield names[file_id], order[bounds[file_id]:bounds[file_id + 1]]
+
+
+def _split_in_memory(input_file, output_dir):
+    df = pd.read_csv(input_file, low_memory=False)
+    _check_columns(df.columns)
+    logger.info("Found %d unique BudgetCodeText values", df['BudgetCodeText'].nunique(dropna=False))
+
+    filenames = {}
+    written = []
+    for filename, rows in _bucket_by_file(df['BudgetCodeText'], filenames, _code_to_group()):
+        output_path = os.path.join(output_dir, filename)
+        df.take(rows).to_csv(output_path, index=False)
+        logger.info("Created: %s (%d rows)", output_path, len(rows))
+        written.append((output_path, len(rows)))
+    return written
+
+
+def _split_streaming(input_file, output_dir):
+    """Split in chunks of ``config.SPLIT_CHUNK_ROWS`` rows, in two passes.
+
+    The in-memory split reads with ``low_memory=False``, so each column gets
+    the one dtype inferred from all of its values; a chunk only sees its own
+    rows.  The first pass reads the chunks for their dtypes alone.  Columns
+    on which chunks disagree are declared for the second pass: as float when
+    pandas would widen their ints to floats, otherwise as text, which keeps
+    every value as written — what a whole-column read does with a column of
+    mixed numbers and text.  Rows are then appended to the output files
+    chunk by chunk, so values are written exactly as the in-memory split
+    writes them.  Output files are kept open through :class:`_OpenFiles`.
+    """
+    columns = pd.read_csv(input_file, nrows=0).columns
+    _check_columns(columns)
+
+    found = {}
+    for chunk in _read_chunks(input_file):
+        for name, dtype in chunk.dtypes.items():
+            found.setdefault(name, {})[dtype] = None
+    dtypes = {name: _declared_dtype(kinds) for name, kinds in found.items() if len(kinds) > 1}
+
+    filenames = {}
+    row_counts = {}
+    code_to_group = _code_to_group()
+    with _OpenFiles(config.SPLIT_MAX_OPEN_FILES) as files:
+        for chunk in _read_chunks(input_file, dtypes):
+            for filename, rows in _bucket_by_file(chunk['BudgetCodeText'], filenames, code_to_group):
+                output_path = os.path.join(output_dir, filename)
+                is_new = output_path not in row_counts
+                chunk.take(rows).to_csv(files.get(output_path, append=not is_new), index=False, header=is_new)
+                row_counts[output_path] = row_counts.get(output_path, 0) + len(rows)
+
+    written = []
+    for output_path, rows in row_counts.items():
+        logger.info("Created: %s (%d rows)", output_path, rows)
+        written.append((output_path, rows))
+    return written
+
+
+def _read_chunks(input_file, dtypes=None):
+    # low_memory=False: each chunk's dtypes come from all of its rows at once
+    return pd.read_csv(input_file, chunksize=max(1, config.SPLIT_CHUNK_ROWS), dtype=dtypes, low_memory=False)
+
+
+def _declared_dtype(dtypes):
+    # The dtype a whole-column read gives values the chunks read as *dtypes*
+    dtype = _common_dtype(dtypes)
+    return dtype if pd.api.types.is_float_dtype(dtype) else str
+
+
+def _common_dtype(dtypes):
+    # The dtype of a column made of parts of each of *dtypes*, as pd.concat combines them
+    return pd.concat([pd.Series([], dtype=dtype) for dtype in dtypes]).dtype
+
+
+class _OpenFiles:
+    """At most ``limit`` output files open at once, least recently used closed first."""
+
+    def __init__(self, limit):
+        self.limit = max(1, limit)
+        self.handles = OrderedDict()
+
+    def get(self, path, append):
+        handle = self.handles.get(path)
+        if handle is not None:
+            self.handles.move_to_end(path)
+            return handle
+        if len(self.handles) >= self.limit:
+            _path, oldest = self.handles.popitem(last=False)
+            oldest.close()
+        # newline='' as to_csv uses when it opens the path itself
+        handle = open(path, 'a' if append else 'w', newline='', encoding='utf-8')
+        self.handles[path] = handle
+        return handle
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        for handle in self.handles.values():
+            handle.close()
+        self.handles.clear()
 
 if __name__ == "__main__":
     # Default input file name
@@ -0,0 +1,145 @@
+"""
+Managed executors for the blocking work ``async def`` routes start.
+
+Two pools, started in the app lifespan (or on first use) and shut down with
+it:
+
+* ``io`` — threads (``config.IO_WORKERS``), for pandas reads/writes, ZIP
+  files, the session store and registry: work that waits on the disk or
+  releases the GIL.  The caller's context travels with each call, so
+  session lookups in the thread still take the request's leases.
+* ``cpu`` — processes (``config.CPU_WORKERS``, spawned), for pure-Python CPU
+  work on picklable arguments: XLSX conversion, CSV splitting, HTML
+  rendering and parsing.  Functions must be importable module-level ones
+  and get paths, not session IDs.
+
+:func:`stats` reports, per pool, its size, the calls queued and running and
+running totals (``GET /api/system/executors``).
+"""
+
+import asyncio
+import contextvars
+import functools
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class _Pool:
+    """One executor plus the counters :func:`stats` reports (event-loop thread only)."""
+
+    def __init__(self, name: str, kind: str, workers: Callable[[], int], factory: Callable[[int], Executor]):
+        self.name = name
+        self.kind = kind
+        self._workers = workers
+        self._factory = factory
+        self._executor: Optional[Executor] = None
+        self.size = 0
+        self.pending = 0
+        self.peak_pending = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+
+    def executor(self) -> Executor:
+        if self._executor is None:
+            self.size = self._workers()
+            self._executor = self._factory(self.size)
+            logger.info("Started %s executor with %d worker(s)", self.name, self.size)
+        return self._executor
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, fn: Callable, args: tuple, kwargs: dict, context: Optional[contextvars.Context] = None):
+        call = functools.partial(fn, *args, **kwargs)
+        if context is not None:
+            call = functools.partial(context.run, call)
+        self.submitted += 1
+        self.pending += 1
+        self.peak_pending = max(self.peak_pending, self.pending)
+        started = time.perf_counter()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self.executor(), call)
+        except BrokenProcessPool:
+            self.failed += 1
+            self.shutdown(wait=False)  # a dead worker breaks the pool; start afresh next time
+            raise
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+            self.busy_seconds += time.perf_counter() - started
+        self.completed += 1
+        return result
+
+    def stats(self) -> dict:
+        size = self.size or self._workers()
+        return {
+            "kind": self.kind,
+            "workers": size,
+            "started": self._executor is not None,
+            "running": min(self.pending, size),
+            "queued": max(self.pending - size, 0),
+            "peak_pending": self.peak_pending,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "busy_seconds": round(self.busy_seconds, 3),
+        }
+
+
+def io_workers() -> int:
+    """Threads in the I/O pool (``IO_WORKERS``, or CPUs + 4 up to 32)."""
+    return config.IO_WORKERS or min(32, (os.cpu_count() or 1) + 4)
+
+
+def cpu_workers() -> int:
+    """Processes in the CPU pool (``CPU_WORKERS``, or one per CPU)."""
+    return config.CPU_WORKERS or os.cpu_count() or 1
+
+
+_io = _Pool("io", "threads", io_workers, lambda n: ThreadPoolExecutor(max_workers=n, thread_name_prefix="io"))
+# spawn, not fork: the server process has threads and open SQLite handles.
+_cpu = _Pool("cpu", "processes", cpu_workers, lambda n: ProcessPoolExecutor(
+    max_workers=n, mp_context=multiprocessing.get_context("spawn"),
+))
+
+
+async def run_io(fn: Callable, *args, **kwargs):
+    """Run ``fn(*args, **kwargs)`` on the I/O thread pool, with the caller's context."""
+    return await _io.run(fn, args, kwargs, contextvars.copy_context())
+
+
+async def run_cpu(fn: Callable, *args, **kwargs):
+    """Run ``fn(*args, **kwargs)`` in the CPU process pool (arguments and result are pickled)."""
+    return await _cpu.run(fn, args, kwargs)
+
+
+def start() -> None:
+    """Start both pools (called from the app lifespan)."""
+    _io.executor()
+    _cpu.executor()
+
+
+def shutdown() -> None:
+    """Stop both pools, waiting for running calls (called on app shutdown)."""
+    _io.shutdown()
+    _cpu.shutdown()
+
+
+def stats() -> dict:
+    """Return size, queue depth and totals of each pool."""
+    return {pool.name: pool.stats() for pool in (_io, _cpu)}
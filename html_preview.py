@@ -1,8 +1,9 @@
-import pickle
 import sys
 import os
 from pathlib import Path
-from jinja2 import Environment, FileSystemLoader
+
+import invoice_codec
+from services.invoice_service import render_invoice_html as render_invoice
 
 
 def render_invoice_html(invoice_data_pkl_path, template_name='Invoice 2.html', output_file=None):
@@ -10,19 +11,19 @@ def render_invoice_html(invoice_data_pkl_path, template_name='Invoice 2.html', o
     Load invoice data and render it into an HTML file.
     
     Args:
-        invoice_data_pkl_path (str): Path to the invoice data pickle file
+        invoice_data_pkl_path (str): Path to a stored ``<id>_invoice_data.bin`` file
         template_name (str): Name of the template file in the templates directory
         output_file (str, optional): Output HTML file path. If None, auto-generates from input.
     
     Returns:
         str: Path to the generated HTML file
     """
-    # Load invoice data from pickle file
+    # Load invoice data file
     if not os.path.exists(invoice_data_pkl_path):
         raise FileNotFoundError(f"Invoice data file not found: {invoice_data_pkl_path}")
     
     with open(invoice_data_pkl_path, 'rb') as f:
-        invoice_data = pickle.load(f)
+        invoice_data = invoice_codec.decode(f.read())
     
     print(f"Loaded invoice data from: {invoice_data_pkl_path}")
     print(f"Patient: {invoice_data['patient']['name']}")
@@ -33,11 +34,8 @@ def render_invoice_html(invoice_data_pkl_path, template_name='Invoice 2.html', o
     if not templates_dir.exists():
         raise FileNotFoundError(f"Templates directory not found: {templates_dir}")
     
-    env = Environment(loader=FileSystemLoader(str(templates_dir)))
-    template = env.get_template(template_name)
-    
-    # Render the template with the invoice data
-    rendered_html = template.render(data=invoice_data)
+    # Render the template with the invoice data (images left as /static/ URLs)
+    rendered_html = render_invoice(invoice_data, template_name, embed_image=False)
     
     # Fix image path for standalone HTML (change /static/ to relative path)
     # Check if image exists in templates directory, otherwise use static
@@ -77,12 +75,12 @@ def render_invoice_html(invoice_data_pkl_path, template_name='Invoice 2.html', o
 
 
 if __name__ == "__main__":
-    # Get invoice data pickle file path from command line argument
+    # Get invoice data file path from command line argument
     if len(sys.argv) > 1:
         pkl_path = sys.argv[1]
     else:
         # Prompt user for file path if not provided
-        pkl_path = input("Enter the path to the invoice data pickle file: ").strip().strip('"')
+        pkl_path = input("Enter the path to the invoice data file: ").strip().strip('"')
     
     # Optional: Get output file path
     output_path = None
@@ -0,0 +1,166 @@
+"""
+Compact, versioned binary format for invoice-data documents.
+
+Replaces pickle for everything the session store writes.  A document is
+stored as::
+
+    b"BIV" + <version byte> + msgpack({"doc": ..., "items": ...})
+
+where ``doc`` is the invoice dict without its line items and ``items`` holds
+``invoice.items`` column-wise — one array per key instead of repeating every
+key on every journey, with low-cardinality columns dictionary-encoded —
+which is most of the size on large invoices.
+
+Decoding only ever builds plain containers, strings, numbers and dates, so a
+tampered file cannot execute code the way an unpickled one can.
+"""
+
+import sys
+from array import array
+from datetime import date, datetime
+from itertools import repeat
+from operator import itemgetter
+from typing import Any
+
+import msgpack
+import numpy as np
+
+FORMAT_MAGIC = b"BIV"
+FORMAT_VERSION = 1
+
+_HEADER = FORMAT_MAGIC + bytes([FORMAT_VERSION])
+
+_EXT_DATETIME = 1
+_EXT_DATE = 2
+
+
+class InvoiceFormatError(ValueError):
+    """Raised when bytes are not an invoice document this version can read."""
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, datetime):
+        return msgpack.ExtType(_EXT_DATETIME, obj.isoformat().encode("ascii"))
+    if isinstance(obj, date):
+        return msgpack.ExtType(_EXT_DATE, obj.isoformat().encode("ascii"))
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Cannot store {type(obj).__name__} in invoice data")
+
+
+def _ext_hook(code: int, data: bytes) -> Any:
+    if code == _EXT_DATETIME:
+        return datetime.fromisoformat(data.decode("ascii"))
+    if code == _EXT_DATE:
+        return date.fromisoformat(data.decode("ascii"))
+    raise InvoiceFormatError(f"Unknown extension type {code}")
+
+
+def _pack_codes(codes: list[int], n_values: int) -> tuple[str, bytes]:
+    typecode = "B" if n_values <= 0xFF else "H" if n_values <= 0xFFFF else "I"
+    packed = array(typecode, codes)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return typecode, packed.tobytes()
+
+
+def _unpack_codes(typecode: str, data: bytes) -> array:
+    codes = array(typecode)
+    codes.frombytes(data)
+    if sys.byteorder != "little":
+        codes.byteswap()
+    return codes
+
+
+_DICT_TYPES = {str, type(None)}
+
+
+def _encode_column(values: list) -> Any:
+    """Return a column as a plain list, or dictionary-encoded when values repeat a lot.
+
+    Invoice columns such as hospital, status or the empty charge fields hold
+    a handful of distinct values; those are stored once plus a byte-packed
+    index per row.
+    """
+    # Strings only: a dict would merge equal values of other types (1, 1.0, True).
+    if not set(map(type, values)) <= _DICT_TYPES:
+        return values
+    distinct = dict.fromkeys(values)
+    if len(distinct) * 2 > len(values):
+        return values
+    index = {value: i for i, value in enumerate(distinct)}
+    typecode, codes = _pack_codes(list(map(index.__getitem__, values)), len(distinct))
+    return {"values": list(distinct), "type": typecode, "codes": codes}
+
+
+def _decode_column(column: Any) -> list:
+    if isinstance(column, list):
+        return column
+    return list(map(column["values"].__getitem__, _unpack_codes(column["type"], column["codes"])))
+
+
+def _items_to_columns(items: list[dict]) -> dict:
+    absent = []
+    first = items[0].keys() if items else {}.keys()
+    uniform = all(map(first.__eq__, map(dict.keys, items)))
+    keys = list(first) if uniform else list(dict.fromkeys(k for item in items for k in item))
+    if not keys:
+        columns = []
+    elif uniform:
+        # Every item has every key: transpose in C via itemgetter + zip.
+        rows = map(itemgetter(*keys), items) if len(keys) > 1 else ((item[keys[0]],) for item in items)
+        columns = [_encode_column(list(column)) for column in zip(*rows)]
+    else:
+        columns = [_encode_column([item.get(key) for item in items]) for key in keys]
+        # Keys missing from some items, as (column, row) pairs, so they come back missing.
+        absent = [
+            [c, r]
+            for c, key in enumerate(keys)
+            for r, item in enumerate(items)
+            if key not in item
+        ]
+    return {"n": len(items), "keys": keys, "columns": columns, "absent": absent}
+
+
+def _columns_to_items(packed: dict) -> list[dict]:
+    keys = packed["keys"]
+    if keys:
+        columns = [_decode_column(column) for column in packed["columns"]]
+        items = list(map(dict, map(zip, repeat(keys), zip(*columns))))
+    else:
+        items = [{} for _ in range(packed["n"])]
+    for c, r in packed["absent"]:
+        del items[r][keys[c]]
+    return items
+
+
+def encode(invoice_data: dict) -> bytes:
+    """Serialise an invoice-data dict."""
+    doc = invoice_data
+    items = None
+    invoice = invoice_data.get("invoice")
+    if isinstance(invoice, dict) and isinstance(invoice.get("items"), list) and all(
+        isinstance(item, dict) for item in invoice["items"]
+    ):
+        items = _items_to_columns(invoice["items"])
+        doc = {**invoice_data, "invoice": {k: v for k, v in invoice.items() if k != "items"}}
+    return _HEADER + msgpack.packb({"doc": doc, "items": items}, default=_default, use_bin_type=True)
+
+
+def decode(blob: bytes) -> dict:
+    """Inverse of :func:`encode`; raises :class:`InvoiceFormatError` for foreign data."""
+    if blob[:len(FORMAT_MAGIC)] != FORMAT_MAGIC:
+        raise InvoiceFormatError("Not an invoice document")
+    version = blob[len(FORMAT_MAGIC)] if len(blob) > len(FORMAT_MAGIC) else None
+    if version != FORMAT_VERSION:
+        raise InvoiceFormatError(f"Unsupported invoice document version {version}")
+    try:
+        payload = msgpack.unpackb(blob[len(_HEADER):], raw=False, ext_hook=_ext_hook, strict_map_key=False)
+    except (msgpack.UnpackException, ValueError) as e:
+        raise InvoiceFormatError(f"Corrupt invoice document: {e}") from e
+    doc = payload["doc"]
+    if payload["items"] is not None:
+        doc["invoice"]["items"] = _columns_to_items(payload["items"])
+    return doc
@@ -0,0 +1,448 @@
+"""
+Background jobs for batch work too long for one HTTP request.
+
+``POST /api/jobs/...`` queues a job and returns its ID at once.  The job runs
+on a worker's runner (started from the app lifespan) and reports progress —
+files done, rows processed, an ETA — which ``GET /api/jobs/{id}/events``
+streams as Server-Sent Events; once it has finished the client fetches the
+result.
+
+The queue is a SQLite table (``config.JOBS_DB_PATH``, WAL mode like the
+session registry), so every uvicorn worker shares it and queued jobs survive
+a restart: whichever runner polls first claims the oldest queued job.  A
+running job's progress and heartbeat are written every ``JOB_HEARTBEAT``
+seconds.  A job whose worker stopped heartbeating (crash, restart) is queued
+again, up to ``JOB_MAX_ATTEMPTS`` runs; one interrupted by a clean shutdown
+goes straight back to the queue.  Cancelling a queued job takes it off the
+queue; a running one is cancelled at its next heartbeat (at once if it runs
+in the worker that received the request).
+
+Job kinds are registered with :func:`handler`: an ``async`` function taking
+the :class:`Job` and returning a JSON-serialisable result.  Handlers run in
+a session lease scope, so the sessions they look up are safe from the reaper.
+The input session named at :func:`submit` is leased from then on, so it
+cannot be reaped while the job waits in the queue; the lease is renewed by
+the runners' maintenance and released when the job finishes.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Awaitable, Callable, Optional
+
+import config
+import db
+import executors
+import session_registry
+from db import transaction as _transaction
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 2  # 2: lease on the input session
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id            TEXT PRIMARY KEY,
+    kind              TEXT NOT NULL,
+    owner             TEXT,
+    params            TEXT NOT NULL,
+    status            TEXT NOT NULL,
+    created_at        REAL NOT NULL,
+    started_at        REAL,
+    finished_at       REAL,
+    heartbeat_at      REAL,
+    worker_pid        INTEGER,
+    attempts          INTEGER NOT NULL DEFAULT 0,
+    cancel_requested  INTEGER NOT NULL DEFAULT 0,
+    files_total       INTEGER,
+    files_done        INTEGER NOT NULL DEFAULT 0,
+    rows_done         INTEGER NOT NULL DEFAULT 0,
+    lease_id          INTEGER,
+    result            TEXT,
+    error             TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, created_at);
+"""
+
+_COLUMNS = (
+    "job_id", "kind", "owner", "params", "status", "created_at", "started_at", "finished_at",
+    "heartbeat_at", "attempts", "cancel_requested", "files_total", "files_done", "rows_done", "error",
+)
+
+_HANDLERS: dict[str, Callable[["Job"], Awaitable]] = {}
+
+
+def jobs_db_path() -> str:
+    """Return the path of the job queue database file."""
+    return config.JOBS_DB_PATH or os.path.join(config.TEMP_DIR, "jobs.sqlite3")
+
+
+def _connect() -> sqlite3.Connection:
+    return db.connect(jobs_db_path(), _SCHEMA, SCHEMA_VERSION, reset_on_mismatch=True)
+
+
+def handler(kind: str):
+    """Decorator registering the coroutine function that runs jobs of *kind*."""
+    def register(fn):
+        _HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+class Job:
+    """A claimed job, as its handler sees it: parameters in, progress out."""
+
+    def __init__(self, job_id: str, kind: str, owner: Optional[str], params: dict):
+        self.job_id = job_id
+        self.kind = kind
+        self.owner = owner
+        self.params = params
+        self.files_total: Optional[int] = None
+        self.files_done = 0
+        self.rows_done = 0
+        self.cancelled = False
+
+    def set_total(self, files: int) -> None:
+        """Record how many files the job will go through (for the ETA)."""
+        self.files_total = files
+
+    def advance(self, rows: int = 0) -> None:
+        """Count one more file done and *rows* more rows processed."""
+        self.files_done += 1
+        self.rows_done += rows
+
+
+# ---------------------------------------------------------------------------
+# Queue
+# ---------------------------------------------------------------------------
+
+def submit(kind: str, params: dict, owner: Optional[str] = None, session_id: Optional[str] = None) -> dict:
+    """Queue a job of *kind* and return its view (see :func:`get`).
+
+    *session_id*, the session the job reads, is leased until the job finishes.
+    """
+    if kind not in _HANDLERS:
+        raise ValueError(f"Unknown job kind {kind!r}")
+    job_id = os.urandom(16).hex()
+    lease_id = session_registry.acquire_lease(session_id) if session_id else None
+    try:
+        _connect().execute(
+            "INSERT INTO jobs (job_id, kind, owner, params, status, created_at, lease_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, owner, json.dumps(params), QUEUED, time.time(), lease_id),
+        )
+    except sqlite3.Error:
+        if lease_id is not None:
+            session_registry.release_leases([lease_id])
+        raise
+    return get(job_id)
+
+
+def _view(row: tuple, now: float) -> dict:
+    job = dict(zip(_COLUMNS, row))
+    eta = None
+    total, done = job["files_total"], job["files_done"]
+    if job["status"] == RUNNING and total and done and job["started_at"]:
+        eta = round((now - job["started_at"]) / done * max(total - done, 0), 1)
+    return {
+        "job_id": job["job_id"],
+        "kind": job["kind"],
+        "owner": job["owner"],
+        "status": job["status"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "attempts": job["attempts"],
+        "cancel_requested": bool(job["cancel_requested"]),
+        "progress": {
+            "files_total": total,
+            "files_done": done,
+            "rows_done": job["rows_done"],
+            "eta_seconds": eta,
+        },
+        "error": job["error"],
+    }
+
+
+def get(job_id: str) -> Optional[dict]:
+    """Return the status and progress of *job_id*, or *None* if there is no such job."""
+    row = _connect().execute(
+        f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE job_id = ?", (job_id,),
+    ).fetchone()
+    return None if row is None else _view(row, time.time())
+
+
+def get_result(job_id: str):
+    """Return what the handler of a succeeded job returned (*None* otherwise)."""
+    row = _connect().execute(
+        "SELECT result FROM jobs WHERE job_id = ? AND status = ?", (job_id, SUCCEEDED),
+    ).fetchone()
+    return None if row is None or row[0] is None else json.loads(row[0])
+
+
+def cancel(job_id: str) -> Optional[dict]:
+    """Cancel *job_id*: dequeue it if queued, flag it if running.  Returns its view.
+
+    The flag stops the job at its next heartbeat; :func:`interrupt` stops it
+    at once when it runs in this worker.
+    """
+    now = time.time()
+    conn = _connect()
+    with _transaction(conn):
+        conn.execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, cancel_requested = 1 WHERE job_id = ? AND status = ?",
+            (CANCELLED, now, job_id, QUEUED),
+        )
+        conn.execute(
+            "UPDATE jobs SET cancel_requested = 1 WHERE job_id = ? AND status = ?", (job_id, RUNNING),
+        )
+    _release_finished_leases()
+    return get(job_id)
+
+
+def _claim_next(now: Optional[float] = None) -> Optional[Job]:
+    """Move the oldest queued job to running for this worker; return it, or *None*."""
+    now = now or time.time()
+    conn = _connect()
+    with _transaction(conn):
+        row = conn.execute(
+            "SELECT job_id, kind, owner, params FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,),
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = ?, started_at = ?, heartbeat_at = ?, worker_pid = ?, attempts = attempts + 1, "
+            "files_total = NULL, files_done = 0, rows_done = 0 WHERE job_id = ?",
+            (RUNNING, now, now, os.getpid(), row[0]),
+        )
+    return Job(row[0], row[1], row[2], json.loads(row[3]))
+
+
+def _heartbeat(job: Job) -> bool:
+    """Write *job*'s progress and heartbeat; return True if it was asked to cancel."""
+    conn = _connect()
+    with _transaction(conn):
+        conn.execute(
+            "UPDATE jobs SET heartbeat_at = ?, files_total = ?, files_done = ?, rows_done = ? WHERE job_id = ?",
+            (time.time(), job.files_total, job.files_done, job.rows_done, job.job_id),
+        )
+        row = conn.execute("SELECT cancel_requested FROM jobs WHERE job_id = ?", (job.job_id,)).fetchone()
+    return bool(row and row[0])
+
+
+def _finish(job: Job, status: str, result=None, error: Optional[str] = None) -> None:
+    _connect().execute(
+        "UPDATE jobs SET status = ?, finished_at = ?, files_total = ?, files_done = ?, rows_done = ?, "
+        "result = ?, error = ?, worker_pid = NULL WHERE job_id = ?",
+        (status, time.time(), job.files_total, job.files_done, job.rows_done,
+         None if result is None else json.dumps(result), error, job.job_id),
+    )
+    _release_finished_leases()
+
+
+def _requeue(job: Job) -> None:
+    _connect().execute(
+        "UPDATE jobs SET status = ?, started_at = NULL, heartbeat_at = NULL, worker_pid = NULL WHERE job_id = ?",
+        (QUEUED, job.job_id),
+    )
+
+
+def recover_stale(now: Optional[float] = None) -> int:
+    """Requeue running jobs whose worker stopped heartbeating; return how many.
+
+    Jobs already run ``JOB_MAX_ATTEMPTS`` times fail instead, and ones asked
+    to cancel are cancelled.
+    """
+    now = now or time.time()
+    cutoff = now - config.JOB_STALE_AFTER
+    conn = _connect()
+    with _transaction(conn):
+        conn.execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, worker_pid = NULL "
+            "WHERE status = ? AND heartbeat_at < ? AND cancel_requested = 1",
+            (CANCELLED, now, RUNNING, cutoff),
+        )
+        conn.execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, worker_pid = NULL, error = ? "
+            "WHERE status = ? AND heartbeat_at < ? AND attempts >= ?",
+            (FAILED, now, "The worker running this job stopped", RUNNING, cutoff, config.JOB_MAX_ATTEMPTS),
+        )
+        cur = conn.execute(
+            "UPDATE jobs SET status = ?, started_at = NULL, heartbeat_at = NULL, worker_pid = NULL "
+            "WHERE status = ? AND heartbeat_at < ?",
+            (QUEUED, RUNNING, cutoff),
+        )
+    _release_finished_leases()
+    if cur.rowcount:
+        logger.warning("Requeued %d job(s) from stopped workers", cur.rowcount)
+    return cur.rowcount
+
+
+def _release_finished_leases() -> None:
+    """Release the input-session leases of finished jobs."""
+    conn = _connect()
+    rows = conn.execute(
+        "SELECT job_id, lease_id FROM jobs WHERE lease_id IS NOT NULL "
+        f"AND status IN ({', '.join('?' * len(FINISHED))})",
+        FINISHED,
+    ).fetchall()
+    if rows:
+        session_registry.release_leases([lease_id for _job_id, lease_id in rows])
+        conn.executemany("UPDATE jobs SET lease_id = NULL WHERE job_id = ?", [(job_id,) for job_id, _ in rows])
+
+
+def renew_leases() -> int:
+    """Renew the input-session leases of queued and running jobs; return how many."""
+    rows = _connect().execute(
+        "SELECT lease_id FROM jobs WHERE lease_id IS NOT NULL AND status IN (?, ?)", (QUEUED, RUNNING),
+    ).fetchall()
+    for (lease_id,) in rows:
+        session_registry.renew_lease(lease_id)
+    return len(rows)
+
+
+def purge_finished(now: Optional[float] = None) -> int:
+    """Delete jobs finished more than ``JOB_RETENTION`` seconds ago; return how many."""
+    cur = _connect().execute(
+        f"DELETE FROM jobs WHERE status IN ({', '.join('?' * len(FINISHED))}) AND finished_at < ?",
+        (*FINISHED, (now or time.time()) - config.JOB_RETENTION),
+    )
+    return cur.rowcount
+
+
+def queue_stats() -> dict:
+    """Return the number of jobs per status."""
+    rows = _connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+    return {status: count for status, count in rows}
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+# Jobs running in this worker: job_id -> (job, task)
+_running: dict[str, tuple[Job, asyncio.Task]] = {}
+_wake: Optional[asyncio.Event] = None
+_runner: Optional[asyncio.Task] = None
+
+
+def wake() -> None:
+    """Have this worker's runner poll now, e.g. after :func:`submit` (event-loop thread only).
+
+    Other workers pick new jobs up on their next poll.
+    """
+    if _wake is not None:
+        _wake.set()
+
+
+def interrupt(job_id: str) -> None:
+    """Stop *job_id* now if it runs in this worker, after :func:`cancel` (event-loop thread only)."""
+    running = _running.get(job_id)
+    if running is not None:
+        job, task = running
+        job.cancelled = True
+        task.cancel()
+
+
+async def _watch(job: Job, task: asyncio.Task) -> None:
+    """Heartbeat *job*, renew its session leases and cancel *task* when the job is cancelled elsewhere."""
+    renewed = time.monotonic()
+    while True:
+        await asyncio.sleep(config.JOB_HEARTBEAT)
+        if await executors.run_io(_heartbeat, job):
+            job.cancelled = True
+            task.cancel()
+            return
+        if time.monotonic() - renewed > config.SESSION_LEASE_TTL / 2:
+            for lease_id in session_registry.current_leases():
+                await executors.run_io(session_registry.renew_lease, lease_id)
+            renewed = time.monotonic()
+
+
+async def _execute(job: Job) -> None:
+    task = asyncio.current_task()
+    watcher = None
+    try:
+        with session_registry.lease_scope():
+            watcher = asyncio.create_task(_watch(job, task), name=f"job-watch-{job.job_id}")
+            fn = _HANDLERS.get(job.kind)
+            if fn is None:
+                raise ValueError(f"Unknown job kind {job.kind!r}")
+            result = await fn(job)
+    except asyncio.CancelledError:
+        if job.cancelled:
+            logger.info("Job %s cancelled", job.job_id)
+            await asyncio.shield(executors.run_io(_finish, job, CANCELLED))
+        else:
+            logger.info("Job %s interrupted, back to the queue", job.job_id)
+            await asyncio.shield(executors.run_io(_requeue, job))
+            raise
+    except Exception as e:
+        logger.exception("Job %s (%s) failed", job.job_id, job.kind)
+        await executors.run_io(_finish, job, FAILED, None, str(getattr(e, "detail", None) or e))
+    else:
+        await executors.run_io(_finish, job, SUCCEEDED, result)
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        _running.pop(job.job_id, None)
+        if _wake is not None:
+            _wake.set()
+
+
+async def _run_forever() -> None:
+    global _wake
+    _wake = asyncio.Event()
+    last_maintenance = 0.0
+    while True:
+        _wake.clear()
+        try:
+            if time.monotonic() - last_maintenance > config.JOB_STALE_AFTER:
+                await executors.run_io(recover_stale)
+                await executors.run_io(renew_leases)
+                await executors.run_io(purge_finished)
+                last_maintenance = time.monotonic()
+            while len(_running) < config.JOB_CONCURRENCY:
+                job = await executors.run_io(_claim_next)
+                if job is None:
+                    break
+                logger.info("Running job %s (%s)", job.job_id, job.kind)
+                task = asyncio.create_task(_execute(job), name=f"job-{job.job_id}")
+                _running[job.job_id] = (job, task)
+        except Exception:
+            logger.exception("Job runner poll failed")
+        try:
+            await asyncio.wait_for(_wake.wait(), timeout=config.JOB_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start() -> Optional[asyncio.Task]:
+    """Start this worker's job runner on the running event loop (no-op if ``JOB_CONCURRENCY`` is 0)."""
+    global _runner
+    if config.JOB_CONCURRENCY <= 0:
+        return None
+    _runner = asyncio.create_task(_run_forever(), name="job-runner")
+    return _runner
+
+
+async def stop() -> None:
+    """Stop the runner; jobs still running go back to the queue for the next worker."""
+    global _runner, _wake
+    tasks = [task for _job, task in _running.values()]
+    if _runner is not None:
+        tasks.append(_runner)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _running.clear()
+    _runner = _wake = None
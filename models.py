@@ -108,6 +108,9 @@ class ConversionResponse(BaseModel):
     base_name: str
     file_count: int
     files: list[str]
+    row_counts: dict[str, Optional[int]] = {}
+    engine: Optional[str] = None
+    elapsed_seconds: Optional[float] = None
 
 
 class MergeResponse(BaseModel):
@@ -123,6 +126,7 @@ class CombinedSessionResponse(BaseModel):
     session_id: str
     file_count: int
     files: list[str]
+    row_counts: dict[str, Optional[int]] = {}
 
 
 class InvoiceEntry(BaseModel):
@@ -134,10 +138,41 @@ class InvoiceEntry(BaseModel):
     index: int
 
 
+class BatchFailure(BaseModel):
+    filename: str
+    index: int
+    error: str
+
+
 class BatchInvoicesResponse(BaseModel):
     batch_session_id: str
     invoices: list[InvoiceEntry]
     total_count: int
+    failures: list[BatchFailure] = []
+
+
+class PipelineInvoicesResponse(BatchInvoicesResponse):
+    conversion_session_id: str
+
+
+class JobProgress(BaseModel):
+    files_total: Optional[int] = None
+    files_done: int
+    rows_done: int
+    eta_seconds: Optional[float] = None
+
+
+class JobResponse(BaseModel):
+    job_id: str
+    kind: str
+    status: str
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    attempts: int
+    cancel_requested: bool
+    progress: JobProgress
+    error: Optional[str] = None
 
 
 class UploadHtmlResponse(BaseModel):
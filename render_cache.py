@@ -0,0 +1,168 @@
+"""
+On-disk cache of rendered invoice HTML, shared by every worker process.
+
+An entry is named by the SHA-256 of everything its render depended on —
+the invoice data, the template's name and content, the images it embeds
+and :data:`KEY_VERSION`, a digest of the rendering code — under ``config.RENDER_CACHE_DIR``::
+
+    temp/render_cache/3f/3f9a…e1.html
+
+Editing an invoice or a template changes the key, so a stale entry is never
+served; it is simply no longer hit and ages out.  A hit refreshes the
+entry's mtime, and once the cache grows past ``config.RENDER_CACHE_MAX_BYTES``
+the least recently used entries are deleted down to :data:`TRIM_TO` of it.
+Entries are written to a temporary file and renamed into place, so readers
+never see a partial one.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Modules whose code shapes a render beyond what the key captures (template
+# context, filters); their source is part of :data:`KEY_VERSION`, so an
+# upgrade that changes them never serves entries rendered by older code.
+RENDER_SOURCES = ("services/invoice_service.py", "services/summary_service.py", "render_cache.py")
+
+# Bump for a rendering change outside RENDER_SOURCES.
+KEY_EPOCH = 1
+
+TRIM_TO = 0.8
+
+_lock = threading.Lock()
+_estimated_bytes: Optional[int] = None
+
+
+def _code_version() -> str:
+    """Digest of :data:`KEY_EPOCH` and the source of :data:`RENDER_SOURCES`."""
+    digest = hashlib.sha256(str(KEY_EPOCH).encode("ascii"))
+    for name in RENDER_SOURCES:
+        digest.update(name.encode("utf-8"))
+        try:
+            digest.update((config.BASE_DIR / name).read_bytes())
+        except OSError:
+            logger.warning("Render source %s not readable; left out of the cache key version", name)
+    return digest.hexdigest()[:16]
+
+
+KEY_VERSION = _code_version()
+
+
+def enabled() -> bool:
+    """Whether renders are cached: ``RENDER_CACHE_DIR`` is set and the size limit is above 0."""
+    return bool(config.RENDER_CACHE_DIR) and config.RENDER_CACHE_MAX_BYTES > 0
+
+
+def make_key(*parts) -> str:
+    """Return the cache key for a render depending on *parts* (JSON-serialisable)."""
+    payload = json.dumps([KEY_VERSION, *parts], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _entry_path(key: str) -> str:
+    return os.path.join(config.RENDER_CACHE_DIR, key[:2], f"{key}.html")
+
+
+def get(key: str) -> Optional[str]:
+    """Return the cached HTML for *key*, or *None* on a miss."""
+    path = _entry_path(key)
+    try:
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+    except FileNotFoundError:
+        return None
+    except OSError:
+        logger.debug("Could not read render cache entry %s", key, exc_info=True)
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return html
+
+
+def put(key: str, html: str) -> None:
+    """Store *html* under *key*, trimming the cache if that takes it over the limit."""
+    global _estimated_bytes
+    path = _entry_path(key)
+    data = html.encode("utf-8")
+    tmp = os.path.join(os.path.dirname(path), f".tmp_{os.urandom(8).hex()}")
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except OSError:
+        logger.warning("Could not write render cache entry %s", key, exc_info=True)
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        return
+
+    with _lock:
+        if _estimated_bytes is None:
+            _estimated_bytes = _scan()[1]
+        else:
+            _estimated_bytes += len(data)
+        over = _estimated_bytes > config.RENDER_CACHE_MAX_BYTES
+    if over:
+        trim()
+
+
+def _scan() -> tuple[list[tuple[float, int, str]], int]:
+    """Return ``([(mtime, size, path), ...], total bytes)`` for every entry."""
+    entries = []
+    total = 0
+    for dirpath, _dirs, files in os.walk(config.RENDER_CACHE_DIR):
+        for name in files:
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+    return entries, total
+
+
+def size() -> int:
+    """Return the bytes the cache holds on disk."""
+    if not config.RENDER_CACHE_DIR:
+        return 0
+    return _scan()[1]
+
+
+def trim(max_bytes: Optional[int] = None) -> tuple[int, int]:
+    """Evict least recently used entries while over the limit; return ``(count, bytes)``.
+
+    *max_bytes* lowers the limit for this call; the reaper uses it to make
+    room under ``config.GLOBAL_QUOTA_BYTES`` before evicting sessions.
+    """
+    global _estimated_bytes
+    if not enabled():
+        return 0, 0
+    limit = config.RENDER_CACHE_MAX_BYTES if max_bytes is None else min(max_bytes, config.RENDER_CACHE_MAX_BYTES)
+    entries, total = _scan()
+    removed = reclaimed = 0
+    if total > limit:
+        target = limit * TRIM_TO
+        entries.sort()
+        for _mtime, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+            reclaimed += size
+    with _lock:
+        _estimated_bytes = total
+    return removed, reclaimed
@@ -1,34 +1,35 @@
 """Invoice routes: update, download, preview, and download-all."""
 
+import io
 import json
 import logging
-import os
-import pickle
 import zipfile
-from pathlib import Path
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
 
-import pandas as pd
 from fastapi import APIRouter, Form, Depends, HTTPException
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 
-import config
+import executors
 import session_manager
+from invoice_codec import InvoiceFormatError
 from dependencies import require_auth
 from models import parse_invoice_data
 
 logger = logging.getLogger(__name__)
 from services.invoice_service import (
-    generate_invoice_html,
     format_date_word_format,
     format_date_dd_mm_yyyy,
     format_currency,
-    _build_jinja_env,
+    render_invoice_html,
 )
+from services.export_service import attachment_headers, invoices_zip_name, linked_assets, stream_invoices_zip
 from services.summary_service import (
     try_build_summary_zip,
     ensure_line_item_charges,
     build_summary_rows_from_line_items,
     build_merged_summary,
+    summary_csv_bytes,
 )
 
 router = APIRouter()
@@ -41,7 +42,7 @@ async def update_invoice(
     preview: str = Form("false"),
     current_user: str = Depends(require_auth),
 ):
-    """Update invoice data and generate HTML.
+    """Update invoice data and return its HTML, rendered in memory.
 
     When preview=true, always return just the HTML (no ZIP with summary).
     """
@@ -49,47 +50,47 @@ async def update_invoice(
         invoice_data = parse_invoice_data(invoice_data_json)
         is_preview = preview.lower() in ("true", "1", "yes")
 
-        invoice_data_path, temp_dir = session_manager.find_invoice_data_with_dir(session_id)
-        if not invoice_data_path or not temp_dir:
+        temp_dir, state = await executors.run_io(session_manager.load_invoice_state, session_id)
+        if not temp_dir:
             raise HTTPException(status_code=404, detail="Session not found")
 
-        with open(invoice_data_path, 'wb') as f:
-            pickle.dump(invoice_data, f)
-
-        html_file = generate_invoice_html(invoice_data_path, template_name=None)
+        store = session_manager.get_store()
+        await executors.run_io(store.save_invoice, temp_dir, session_id, invoice_data)
+        state.invoice_data = invoice_data
+
+        html = await executors.run_cpu(render_invoice_html, invoice_data)
+        html_name = f"{state.stem}_invoice.html"
+
+        def build_zip() -> Optional[bytes]:
+            result = build_merged_summary(temp_dir, state)
+            if result is None:
+                return None
+            summary_columns, merged_rows, _ = result
+            if not merged_rows:
+                return None
+            store.set_summary_sheet(temp_dir, session_id, summary_columns, merged_rows)
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
+                zipf.writestr(html_name, html)
+                zipf.writestr(f"{state.stem}_backing_data.csv", summary_csv_bytes(summary_columns, merged_rows))
+            return buffer.getvalue()
 
         if not is_preview:
             try:
-                result = build_merged_summary(temp_dir, session_id, invoice_data)
-                if result is not None:
-                    summary_columns, merged_rows, _ = result
-                    if merged_rows:
-                        out_df = pd.DataFrame(merged_rows, columns=summary_columns)
-                        summary_csv_path = os.path.join(temp_dir, f"summary_single_{session_id}.csv")
-                        out_df.to_csv(summary_csv_path, index=False, encoding="utf-8")
-                        src_fn_path = os.path.join(temp_dir, f"{session_id}_source_filename.txt")
-                        if os.path.isfile(src_fn_path):
-                            with open(src_fn_path, "r", encoding="utf-8") as fn:
-                                invoice_stem = Path(fn.read().strip()).stem
-                        else:
-                            invoice_stem = Path(html_file).stem
-                        backing_name = f"{invoice_stem}_backing_data.csv"
-                        zip_path = os.path.join(temp_dir, f"invoice_and_summary_{session_id}.zip")
-                        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                            zipf.write(html_file, Path(html_file).name)
-                            zipf.write(summary_csv_path, backing_name)
-                        return FileResponse(
-                            zip_path,
-                            media_type="application/zip",
-                            filename=f"invoice_and_summary_{Path(html_file).stem}.zip",
-                        )
+                zip_bytes = await executors.run_io(build_zip)
+                if zip_bytes is not None:
+                    return Response(
+                        content=zip_bytes,
+                        media_type="application/zip",
+                        headers=attachment_headers(f"invoice_and_summary_{state.stem}_invoice.zip"),
+                    )
             except (OSError, ValueError, KeyError) as summary_err:
                 logger.exception("Summary build failed: %s", summary_err)
 
-        return FileResponse(html_file, media_type="text/html", filename=Path(html_file).name)
+        return Response(content=html, media_type="text/html", headers=attachment_headers(html_name))
     except HTTPException:
         raise
-    except (FileNotFoundError, pickle.UnpicklingError, OSError) as e:
+    except (FileNotFoundError, InvoiceFormatError, OSError, BrokenProcessPool) as e:
         logger.exception("Error generating invoice")
         raise HTTPException(status_code=500, detail=f"Error generating invoice: {str(e)}")
     except Exception as e:
@@ -99,17 +100,17 @@ async def update_invoice(
 
 @router.post("/api/download-invoice/{session_id}")
 async def download_invoice(session_id: str, current_user: str = Depends(require_auth)):
-    """Download a single invoice HTML file."""
+    """Download a single invoice HTML file, rendered in memory."""
     try:
-        invoice_data_path = session_manager.find_invoice_data_path(session_id)
-        if not invoice_data_path:
+        _temp_dir, state = await executors.run_io(session_manager.load_invoice_state, session_id)
+        if not state:
             raise HTTPException(status_code=404, detail="Invoice not found")
 
-        html_file = generate_invoice_html(invoice_data_path, template_name=None)
-        return FileResponse(html_file, media_type="text/html", filename=Path(html_file).name)
+        html = await executors.run_cpu(render_invoice_html, state.invoice_data)
+        return Response(content=html, media_type="text/html", headers=attachment_headers(f"{state.stem}_invoice.html"))
     except HTTPException:
         raise
-    except (FileNotFoundError, pickle.UnpicklingError, OSError) as e:
+    except (FileNotFoundError, InvoiceFormatError, OSError, BrokenProcessPool) as e:
         logger.exception("Error downloading invoice %s", session_id)
         raise HTTPException(status_code=500, detail=f"Error downloading invoice: {str(e)}")
 
@@ -117,74 +118,48 @@ async def download_invoice(session_id: str, current_user: str = Depends(require_
 @router.post("/api/download-all-invoices")
 async def download_all_invoices(
     batch_session_id: str = Form(...),
+    asset_mode: Optional[str] = Form(None),
     current_user: str = Depends(require_auth),
 ):
     """Download all invoices from a batch session as a ZIP file.
 
     If a summary template and mapping exist, a filled summary CSV is included.
+    *asset_mode* ``linked`` ships the images once in the ZIP instead of
+    embedding them in every invoice (default ``EXPORT_ASSET_MODE``).  The ZIP
+    is streamed as the invoices are rendered; a failure part-way through is
+    logged and ends the response early.
     """
+    linked = linked_assets(asset_mode)
     try:
-        batch_dir, invoice_files = session_manager.find_batch_invoice_files(batch_session_id)
-        if not batch_dir or not invoice_files:
-            raise HTTPException(status_code=404, detail="Batch session not found")
-
-        html_files = []
-        for invoice_data_path in invoice_files:
-            html_file = generate_invoice_html(invoice_data_path, template_name=None)
-            html_files.append(html_file)
-
-        zip_path = os.path.join(batch_dir, f"invoices_{batch_session_id}.zip")
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for idx, html_file in enumerate(html_files):
-                zipf.write(html_file, Path(html_file).name)
-                invoice_data_path = invoice_files[idx]
-                sid = Path(invoice_data_path).stem.replace("_invoice_data", "")
-                template_path = os.path.join(batch_dir, f"summary_template_{sid}.csv")
-                mapping_path = os.path.join(batch_dir, f"summary_mapping_{sid}.json")
-                if os.path.isfile(template_path) and os.path.isfile(mapping_path):
-                    with open(invoice_data_path, "rb") as f:
-                        inv_data = pickle.load(f)
-                    result = build_merged_summary(batch_dir, sid, inv_data)
-                    if result is not None:
-                        summary_columns, merged_rows, _ = result
-                        if merged_rows:
-                            out_df = pd.DataFrame(merged_rows, columns=summary_columns)
-                            summary_csv_path = os.path.join(batch_dir, f"summary_single_{sid}_zip.csv")
-                            out_df.to_csv(summary_csv_path, index=False, encoding="utf-8")
-                            src_fn_path = os.path.join(batch_dir, f"{sid}_source_filename.txt")
-                            if os.path.isfile(src_fn_path):
-                                with open(src_fn_path, "r", encoding="utf-8") as fn:
-                                    invoice_stem = Path(fn.read().strip()).stem
-                            else:
-                                invoice_stem = sid
-                            zipf.write(summary_csv_path, f"{invoice_stem}_backing_data.csv")
-                            try:
-                                os.remove(summary_csv_path)
-                            except OSError:
-                                pass
-
-        return FileResponse(zip_path, media_type="application/zip", filename=f"invoices_{batch_session_id}.zip")
-    except HTTPException:
-        raise
-    except (FileNotFoundError, pickle.UnpicklingError, OSError, zipfile.BadZipFile) as e:
-        logger.exception("Error creating invoice ZIP for batch %s", batch_session_id)
+        batch_dir, states = await executors.run_io(session_manager.load_batch_state, batch_session_id)
+    except (FileNotFoundError, InvoiceFormatError, OSError) as e:
+        logger.exception("Error loading batch %s", batch_session_id)
         raise HTTPException(status_code=500, detail=f"Error creating ZIP: {str(e)}")
+    if not batch_dir or not states:
+        raise HTTPException(status_code=404, detail="Batch session not found")
+
+    async def body():
+        try:
+            async for chunk in stream_invoices_zip(batch_dir, states, linked=linked):
+                yield chunk
+        except (OSError, zipfile.BadZipFile, BrokenProcessPool):
+            logger.exception("Error streaming invoice ZIP for batch %s", batch_session_id)
+            raise
+
+    return StreamingResponse(
+        body(),
+        media_type="application/zip",
+        headers=attachment_headers(invoices_zip_name(batch_session_id)),
+    )
 
 
 @router.get("/api/invoice-preview/{session_id}")
 async def invoice_preview(session_id: str, current_user: str = Depends(require_auth)):
     """Preview the invoice HTML for a session."""
-    invoice_data_path = session_manager.find_invoice_data_path(session_id)
-    if not invoice_data_path:
+    try:
+        invoice_data = await executors.run_io(session_manager.load_invoice_data, session_id)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    with open(invoice_data_path, 'rb') as f:
-        invoice_data = pickle.load(f)
-
-    style = invoice_data.get('style', config.DEFAULT_INVOICE_STYLE)
-    template_name = config.INVOICE_TEMPLATE_STYLE2 if style == 'style2' else config.INVOICE_TEMPLATE_STYLE1
-
-    env = _build_jinja_env()
-    template = env.get_template(template_name)
-    html_content = template.render(data=invoice_data)
+    html_content = await executors.run_cpu(render_invoice_html, invoice_data, embed_image=False)
     return HTMLResponse(content=html_content)
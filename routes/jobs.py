@@ -0,0 +1,176 @@
+"""Job routes: queue long batch work, follow its progress over SSE, cancel it, fetch the result."""
+
+import asyncio
+import logging
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Form, HTTPException, Request
+from fastapi.responses import FileResponse, StreamingResponse
+
+import executors
+import jobs
+import session_manager
+from dependencies import require_auth
+from models import JobResponse
+from services.csv_service import batch_response, build_invoice_batch, collect_conversion_csvs
+from services.export_service import build_invoices_zip, invoices_zip_name, linked_assets
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+KIND_CONVERSION_INVOICES = "conversion-invoices"
+KIND_DOWNLOAD_ALL = "download-all-invoices"
+
+SSE_POLL_INTERVAL = 0.5
+SSE_KEEPALIVE = 15.0
+
+
+# ---------------------------------------------------------------------------
+# Job kinds
+# ---------------------------------------------------------------------------
+
+@jobs.handler(KIND_CONVERSION_INVOICES)
+async def run_conversion_invoices(job: jobs.Job) -> dict:
+    """``/api/get-conversion-files`` as a job; the result is the same response body."""
+    conversion_dir = await executors.run_io(session_manager.find_conversion_dir, job.params["session_id"])
+    if not conversion_dir:
+        raise ValueError("Conversion session not found")
+    csv_files = await executors.run_io(collect_conversion_csvs, conversion_dir, job.params.get("files"))
+    if not csv_files:
+        raise ValueError("No CSV files found in conversion session")
+    job.set_total(len(csv_files))
+
+    batch_session_id, batch_dir = await executors.run_io(session_manager.create_session_dir, "batch_", owner=job.owner)
+    invoices, failures = await build_invoice_batch(batch_dir, csv_files, on_file=job.advance)
+    return batch_response(batch_session_id, invoices, failures)
+
+
+@jobs.handler(KIND_DOWNLOAD_ALL)
+async def run_download_all(job: jobs.Job) -> dict:
+    """``/api/download-all-invoices`` as a job; the ZIP stays in the batch session for the result."""
+    batch_session_id = job.params["batch_session_id"]
+    batch_dir, states = await executors.run_io(session_manager.load_batch_state, batch_session_id)
+    if not batch_dir or not states:
+        raise ValueError("Batch session not found")
+    job.set_total(len(states))
+
+    zip_path = await build_invoices_zip(
+        batch_dir, batch_session_id, states, on_invoice=job.advance, linked=job.params.get("linked_assets", False),
+    )
+    return {"path": zip_path, "filename": invoices_zip_name(batch_session_id)}
+
+
+# ---------------------------------------------------------------------------
+# Endpoints
+# ---------------------------------------------------------------------------
+
+async def _submit(kind: str, params: dict, owner: str, session_id: str) -> dict:
+    job = await executors.run_io(jobs.submit, kind, params, owner, session_id)
+    jobs.wake()
+    return job
+
+
+async def _owned_job(job_id: str, current_user: str) -> dict:
+    """Return the job if it belongs to *current_user*; 404 otherwise."""
+    job = await executors.run_io(jobs.get, job_id)
+    if job is None or job["owner"] != current_user:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.post("/api/jobs/conversion-invoices", response_model=JobResponse, status_code=202)
+async def submit_conversion_invoices(
+    session_id: str = Form(...),
+    files: Optional[str] = Form(None),
+    current_user: str = Depends(require_auth),
+):
+    """Queue invoice creation for a conversion session (as ``/api/get-conversion-files``)."""
+    if not await executors.run_io(session_manager.find_conversion_dir, session_id):
+        raise HTTPException(status_code=404, detail=f"Conversion session not found. Session ID: {session_id}")
+    params = {"session_id": session_id, "files": files}
+    return await _submit(KIND_CONVERSION_INVOICES, params, current_user, session_id)
+
+
+@router.post("/api/jobs/download-all-invoices", response_model=JobResponse, status_code=202)
+async def submit_download_all(
+    batch_session_id: str = Form(...),
+    asset_mode: Optional[str] = Form(None),
+    current_user: str = Depends(require_auth),
+):
+    """Queue the ZIP of every invoice in a batch (as ``/api/download-all-invoices``)."""
+    linked = linked_assets(asset_mode)
+    if not await executors.run_io(session_manager.find_batch_dir, batch_session_id):
+        raise HTTPException(status_code=404, detail="Batch session not found")
+    params = {"batch_session_id": batch_session_id, "linked_assets": linked}
+    return await _submit(KIND_DOWNLOAD_ALL, params, current_user, batch_session_id)
+
+
+@router.get("/api/jobs/{job_id}", response_model=JobResponse)
+async def job_status(job_id: str, current_user: str = Depends(require_auth)):
+    """Return a job's status and progress."""
+    return await _owned_job(job_id, current_user)
+
+
+@router.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request, current_user: str = Depends(require_auth)):
+    """Stream a job's progress as Server-Sent Events until it finishes.
+
+    Every change is sent as a ``progress`` event holding the job status
+    (as ``GET /api/jobs/{job_id}``); the final one is a ``done`` event.
+    """
+    await _owned_job(job_id, current_user)
+
+    async def stream():
+        last = None
+        quiet = 0.0
+        while True:
+            job = await executors.run_io(jobs.get, job_id)
+            if job is None:
+                return
+            finished = job["status"] in jobs.FINISHED
+            payload = JobResponse.model_validate(job).model_dump_json()
+            if payload != last:
+                yield f"event: {'done' if finished else 'progress'}\ndata: {payload}\n\n"
+                last, quiet = payload, 0.0
+            elif quiet >= SSE_KEEPALIVE:
+                yield ": keepalive\n\n"
+                quiet = 0.0
+            if finished or await request.is_disconnected():
+                return
+            await asyncio.sleep(SSE_POLL_INTERVAL)
+            quiet += SSE_POLL_INTERVAL
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/api/jobs/{job_id}/cancel", response_model=JobResponse)
+async def cancel_job(job_id: str, current_user: str = Depends(require_auth)):
+    """Cancel a queued or running job."""
+    job = await _owned_job(job_id, current_user)
+    if job["status"] in jobs.FINISHED:
+        raise HTTPException(status_code=409, detail=f"Job already {job['status']}")
+    job = await executors.run_io(jobs.cancel, job_id)
+    jobs.interrupt(job_id)
+    return job
+
+
+@router.get("/api/jobs/{job_id}/result")
+async def job_result(job_id: str, current_user: str = Depends(require_auth)):
+    """Return a finished job's result: the batch JSON, or the invoices ZIP."""
+    job = await _owned_job(job_id, current_user)
+    if job["status"] != jobs.SUCCEEDED:
+        detail = f"Job is {job['status']}" + (f": {job['error']}" if job["error"] else "")
+        raise HTTPException(status_code=409, detail=detail)
+    result = await executors.run_io(jobs.get_result, job_id)
+
+    if job["kind"] == KIND_DOWNLOAD_ALL:
+        if not os.path.isfile(result["path"]):
+            raise HTTPException(status_code=410, detail="The ZIP is no longer available; download again")
+        return FileResponse(result["path"], media_type="application/zip", filename=result["filename"])
+    return result
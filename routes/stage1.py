@@ -2,23 +2,27 @@
 
 import logging
 import os
-import shutil
 import tempfile
+import time
 import zipfile
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 from typing import Optional
 
 import pandas as pd
-from fastapi import APIRouter, Request, UploadFile, File, Form, Depends, HTTPException
+from fastapi import APIRouter, Request, Form, Depends, HTTPException
 from fastapi.responses import HTMLResponse, FileResponse
 
 import config
+import executors
 import session_manager
 from dependencies import templates, require_auth
 from divider import split_csv_by_budget_code
 from models import ConversionResponse, MergeResponse, parse_json_string_list
+from services import conversion_service
 from services.csv_service import merge_csv_dataframes, save_merged_csv
-from xslx_to_csv import xlsx_to_csv
+from upload_ingest import UploadForm, upload_form
+from xslx_to_csv import resolve_engine, xlsx_to_csv
 
 logger = logging.getLogger(__name__)
 
@@ -32,73 +36,132 @@ async def stage1_page(request: Request, current_user: str = Depends(require_auth
 
 
 @router.post("/api/convert-xlsx", response_model=ConversionResponse)
-async def convert_xlsx(file: UploadFile = File(...), current_user: str = Depends(require_auth)):
+async def convert_xlsx(form: UploadForm = Depends(upload_form), current_user: str = Depends(require_auth)):
     """Convert XLSX file to multiple CSV files."""
+    file = form.file("file")
     if not file.filename.endswith(('.xlsx', '.xls')):
         raise HTTPException(status_code=400, detail="File must be an Excel file (.xlsx or .xls)")
 
-    conversion_session_id, temp_dir = session_manager.create_session_dir("convert_")
+    conversion_session_id, temp_dir = await executors.run_io(
+        session_manager.create_session_dir, "convert_", owner=current_user,
+    )
 
     try:
         xlsx_path = os.path.join(temp_dir, file.filename)
-        with open(xlsx_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        upload_sha256 = await executors.run_io(file.move_to, xlsx_path)
 
         base_name = Path(file.filename).stem
-        xlsx_to_csv(xlsx_path, temp_dir)
-        output_dir = os.path.join(temp_dir, base_name)
-
-        csv_files = []
-        if os.path.exists(output_dir):
-            for root, dirs, files in os.walk(output_dir):
-                for csv_file in files:
-                    if csv_file.endswith('.csv'):
-                        csv_files.append(csv_file)
+        engine = resolve_engine(xlsx_path)
+        started = time.perf_counter()
+        written = await executors.run_cpu(xlsx_to_csv, xlsx_path, temp_dir, engine=engine)
+        elapsed = time.perf_counter() - started
+        await executors.run_io(
+            session_manager.record_artifacts, temp_dir, [(xlsx_path, session_manager.ROLE_UPLOAD, None, upload_sha256)]
+        )
+        artifacts = await executors.run_io(
+            session_manager.record_artifacts, temp_dir, [(path, session_manager.ROLE_SHEET, rows) for path, rows in written]
+        )
 
         return {
             'session_id': conversion_session_id,
             'base_name': base_name,
-            'file_count': len(csv_files),
-            'files': csv_files,
+            'file_count': len(artifacts),
+            'files': [a['name'] for a in artifacts],
+            'row_counts': {a['name']: a['rows'] for a in artifacts},
+            'engine': engine,
+            'elapsed_seconds': round(elapsed, 3),
         }
-    except (FileNotFoundError, OSError, ValueError) as e:
+    except (FileNotFoundError, OSError, ValueError, BrokenProcessPool) as e:
         logger.exception("Error converting XLSX file")
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
 
 
+@router.post("/api/convert-xlsx-batch", response_model=ConversionResponse)
+async def convert_xlsx_batch(form: UploadForm = Depends(upload_form), current_user: str = Depends(require_auth)):
+    """Convert several XLSX files in one request, sheets in parallel, into one conversion session."""
+    files = form.uploads.get("files")
+    if not files:
+        raise HTTPException(status_code=400, detail="At least one Excel file is required")
+    for file in files:
+        if not file.filename.endswith(('.xlsx', '.xls')):
+            raise HTTPException(status_code=400, detail=f"File {file.filename} must be an Excel file (.xlsx or .xls)")
+    names = [Path(file.filename).name for file in files]
+    if len({Path(name).stem for name in names}) != len(names):
+        raise HTTPException(status_code=400, detail="Workbook names must be unique")
+
+    conversion_session_id, temp_dir = await executors.run_io(
+        session_manager.create_session_dir, "convert_", owner=current_user,
+    )
+
+    try:
+        xlsx_paths = []
+        uploads = []
+        for file, name in zip(files, names):
+            xlsx_path = os.path.join(temp_dir, name)
+            sha256 = await executors.run_io(file.move_to, xlsx_path)
+            xlsx_paths.append(xlsx_path)
+            uploads.append((xlsx_path, session_manager.ROLE_UPLOAD, None, sha256))
+        await executors.run_io(session_manager.record_artifacts, temp_dir, uploads)
+
+        engines = sorted({resolve_engine(path) for path in xlsx_paths})
+        started = time.perf_counter()
+        written = await conversion_service.convert_workbooks(xlsx_paths, temp_dir)
+        elapsed = time.perf_counter() - started
+        artifacts = await executors.run_io(
+            session_manager.record_artifacts, temp_dir,
+            [(path, session_manager.ROLE_SHEET, rows, sha256) for path, rows, sha256 in written],
+        )
+
+        return {
+            'session_id': conversion_session_id,
+            'base_name': Path(names[0]).stem if len(names) == 1 else f"{len(names)}_workbooks",
+            'file_count': len(artifacts),
+            'files': [a['name'] for a in artifacts],
+            'row_counts': {a['name']: a['rows'] for a in artifacts},
+            'engine': ", ".join(engines),
+            'elapsed_seconds': round(elapsed, 3),
+        }
+    except (FileNotFoundError, OSError, ValueError, BrokenProcessPool) as e:
+        logger.exception("Error converting XLSX files")
+        raise HTTPException(status_code=500, detail=f"Error processing files: {str(e)}")
+
+
 @router.post("/api/convert-csv", response_model=ConversionResponse)
-async def convert_csv(file: UploadFile = File(...), current_user: str = Depends(require_auth)):
+async def convert_csv(form: UploadForm = Depends(upload_form), current_user: str = Depends(require_auth)):
     """Split CSV file by BudgetCodeText column."""
+    file = form.file("file")
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="File must be a CSV file (.csv)")
 
-    conversion_session_id, temp_dir = session_manager.create_session_dir("convert_")
+    conversion_session_id, temp_dir = await executors.run_io(
+        session_manager.create_session_dir, "convert_", owner=current_user,
+    )
 
     try:
         csv_path = os.path.join(temp_dir, file.filename)
-        with open(csv_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        upload_sha256 = await executors.run_io(file.move_to, csv_path)
 
         output_dir = os.path.join(temp_dir, "split_csvs")
         os.makedirs(output_dir, exist_ok=True)
-        split_csv_by_budget_code(csv_path, output_dir)
-
-        csv_files = []
-        for root, dirs, files in os.walk(output_dir):
-            for csv_file in files:
-                if csv_file.endswith('.csv'):
-                    csv_files.append(csv_file)
+        written = await executors.run_cpu(split_csv_by_budget_code, csv_path, output_dir)
+        await executors.run_io(
+            session_manager.record_artifacts, temp_dir, [(csv_path, session_manager.ROLE_UPLOAD, None, upload_sha256)]
+        )
+        artifacts = await executors.run_io(
+            session_manager.record_artifacts, temp_dir, [(path, session_manager.ROLE_SPLIT, rows) for path, rows in written]
+        )
 
         base_name = Path(file.filename).stem
         return {
             'session_id': conversion_session_id,
             'base_name': base_name,
-            'file_count': len(csv_files),
-            'files': csv_files,
+            'file_count': len(artifacts),
+            'files': [a['name'] for a in artifacts],
+            'row_counts': {a['name']: a['rows'] for a in artifacts},
         }
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    except (FileNotFoundError, OSError) as e:
+    except (FileNotFoundError, OSError, BrokenProcessPool) as e:
         logger.exception("Error splitting CSV file")
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
 
@@ -106,20 +169,20 @@ async def convert_csv(file: UploadFile = File(...), current_user: str = Depends(
 @router.get("/api/download-conversion-zip/{session_id}")
 async def download_conversion_zip(session_id: str, current_user: str = Depends(require_auth)):
     """Download ZIP file from a conversion session."""
-    conversion_dir = session_manager.find_conversion_dir(session_id)
+    conversion_dir = await executors.run_io(session_manager.find_conversion_dir, session_id)
     if not conversion_dir:
         raise HTTPException(status_code=404, detail="Conversion session not found")
 
-    temp_zip_dir = tempfile.mkdtemp(dir=config.TEMP_DIR)
+    temp_zip_dir = await executors.run_io(tempfile.mkdtemp, dir=config.TEMP_DIR)
     zip_path = os.path.join(temp_zip_dir, f"conversion_{session_id}.zip")
 
-    try:
+    def build_zip():
         with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk(conversion_dir):
-                for csv_file in files:
-                    if csv_file.endswith('.csv'):
-                        zipf.write(os.path.join(root, csv_file), csv_file)
+            for artifact in session_manager.list_artifacts(conversion_dir):
+                zipf.write(session_manager.artifact_path(conversion_dir, artifact), artifact['name'])
 
+    try:
+        await executors.run_io(build_zip)
         return FileResponse(zip_path, media_type="application/zip", filename=f"conversion_{session_id}.zip", background=None)
     except (OSError, zipfile.BadZipFile) as e:
         logger.exception("Error creating conversion ZIP for %s", session_id)
@@ -129,18 +192,12 @@ async def download_conversion_zip(session_id: str, current_user: str = Depends(r
 @router.get("/api/download-conversion-file/{session_id}/{filename:path}")
 async def download_conversion_file(session_id: str, filename: str, current_user: str = Depends(require_auth)):
     """Download a single CSV file from a conversion session."""
-    conversion_dir = session_manager.find_conversion_dir(session_id)
+    conversion_dir = await executors.run_io(session_manager.find_conversion_dir, session_id)
     if not conversion_dir:
         raise HTTPException(status_code=404, detail="Conversion session not found")
 
-    file_path = None
-    for root, dirs, files_walk in os.walk(conversion_dir):
-        for csv_file in files_walk:
-            if csv_file == filename and csv_file.endswith('.csv'):
-                file_path = os.path.join(root, csv_file)
-                break
-        if file_path:
-            break
+    artifact = await executors.run_io(session_manager.find_artifact, conversion_dir, filename) if filename.endswith('.csv') else None
+    file_path = session_manager.artifact_path(conversion_dir, artifact) if artifact else None
 
     if not file_path or not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail=f"File {filename} not found in conversion session")
@@ -149,8 +206,10 @@ async def download_conversion_file(session_id: str, filename: str, current_user:
 
 
 @router.post("/api/merge-csvs", response_model=MergeResponse)
-async def merge_csvs(files: list[UploadFile] = File(...), filename: Optional[str] = Form(None), current_user: str = Depends(require_auth)):
+async def merge_csvs(form: UploadForm = Depends(upload_form), current_user: str = Depends(require_auth)):
     """Merge multiple CSV files into one CSV file."""
+    files = form.uploads.get("files")
+    filename = form.field("filename", None)
     if not files or len(files) == 0:
         raise HTTPException(status_code=400, detail="At least one CSV file is required")
 
@@ -158,18 +217,22 @@ async def merge_csvs(files: list[UploadFile] = File(...), filename: Optional[str
         if not file.filename.endswith('.csv'):
             raise HTTPException(status_code=400, detail=f"File {file.filename} must be a CSV file")
 
-    conversion_session_id, temp_dir = session_manager.create_session_dir("convert_")
+    conversion_session_id, temp_dir = await executors.run_io(
+        session_manager.create_session_dir, "convert_", owner=current_user,
+    )
 
     try:
         saved_paths = []
+        uploads = []
         for file in files:
             file_path = os.path.join(temp_dir, file.filename)
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+            sha256 = await executors.run_io(file.move_to, file_path)
             saved_paths.append(file_path)
+            uploads.append((file_path, session_manager.ROLE_UPLOAD, None, sha256))
+        await executors.run_io(session_manager.record_artifacts, temp_dir, uploads)
 
-        merged_df = merge_csv_dataframes(saved_paths)
-        return save_merged_csv(merged_df, conversion_session_id, temp_dir, filename)
+        merged_df = await executors.run_io(merge_csv_dataframes, saved_paths)
+        return await executors.run_io(save_merged_csv, merged_df, conversion_session_id, temp_dir, filename)
     except HTTPException:
         raise
     except (OSError, ValueError, pd.errors.EmptyDataError) as e:
@@ -190,24 +253,27 @@ async def merge_csvs_from_session(
     if not file_list or len(file_list) == 0:
         raise HTTPException(status_code=400, detail="At least one file must be selected")
 
-    conversion_dir = session_manager.find_conversion_dir(session_id)
+    conversion_dir = await executors.run_io(session_manager.find_conversion_dir, session_id)
     if not conversion_dir:
         raise HTTPException(status_code=404, detail="Conversion session not found")
 
-    csv_files_to_merge = []
-    for root, dirs, files_walk in os.walk(conversion_dir):
-        for csv_file in files_walk:
-            if csv_file.endswith('.csv') and csv_file in file_list:
-                csv_files_to_merge.append(os.path.join(root, csv_file))
+    wanted = set(file_list)
+    csv_files_to_merge = [
+        session_manager.artifact_path(conversion_dir, a)
+        for a in await executors.run_io(session_manager.list_artifacts, conversion_dir)
+        if a['name'] in wanted
+    ]
 
     if not csv_files_to_merge:
         raise HTTPException(status_code=404, detail="No matching CSV files found in conversion session")
 
-    new_conversion_session_id, temp_dir = session_manager.create_session_dir("convert_")
+    new_conversion_session_id, temp_dir = await executors.run_io(
+        session_manager.create_session_dir, "convert_", owner=current_user,
+    )
 
     try:
-        merged_df = merge_csv_dataframes(csv_files_to_merge)
-        return save_merged_csv(merged_df, new_conversion_session_id, temp_dir, filename)
+        merged_df = await executors.run_io(merge_csv_dataframes, csv_files_to_merge)
+        return await executors.run_io(save_merged_csv, merged_df, new_conversion_session_id, temp_dir, filename)
     except HTTPException:
         raise
     except (OSError, ValueError, pd.errors.EmptyDataError) as e:
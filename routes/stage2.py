@@ -1,33 +1,40 @@
-"""Stage 2 routes: invoice creation from CSVs, combined sessions, upload CSV/HTML."""
+"""Stage 2 routes: invoice creation from CSVs, combined sessions, upload CSV/HTML, upload-to-invoices pipeline."""
 
 import logging
 import os
-import pickle
-import shutil
+from concurrent.futures.process import BrokenProcessPool
 from typing import Optional
 
-import pandas as pd
-from fastapi import APIRouter, Request, UploadFile, File, Form, Depends, HTTPException
+from fastapi import APIRouter, Request, Form, Depends, HTTPException
 from fastapi.responses import HTMLResponse
 
 logger = logging.getLogger(__name__)
 
+import blob_store
+import executors
 import session_manager
-from csv_cleaner import csv_to_dataframe
-from DataScraper import transform_dataframe_to_invoice_data
 from dependencies import templates, require_auth
+from upload_ingest import UploadForm, upload_form
+from xslx_to_csv import resolve_engine, xlsx_to_csv
 from models import (
     BatchInvoicesResponse,
     CombinedSessionResponse,
+    PipelineInvoicesResponse,
     UploadHtmlResponse,
     parse_json_dict,
 )
-from services.csv_service import collect_conversion_csvs, process_csv_to_invoice
-from services.invoice_service import parse_html_invoice, serialize_invoice_data
+from services.csv_service import (
+    batch_response,
+    build_invoice_batch,
+    collect_conversion_csvs,
+    process_upload_to_invoices,
+)
+from services.invoice_service import parse_html_invoice
 
 router = APIRouter()
 
 
+
 @router.get("/stage2", response_class=HTMLResponse)
 async def stage2_page(request: Request, session_id: Optional[str] = None, current_user: str = Depends(require_auth)):
     """Invoice Creation: CSV to Invoice conversion page."""
@@ -41,33 +48,73 @@ async def get_conversion_files(
     current_user: str = Depends(require_auth),
 ):
     """Get CSV files from a conversion session for invoice creation."""
-    conversion_dir = session_manager.find_conversion_dir(session_id)
+    conversion_dir = await executors.run_io(session_manager.find_conversion_dir, session_id)
     if not conversion_dir:
         raise HTTPException(status_code=404, detail=f"Conversion session not found. Session ID: {session_id}")
 
-    csv_files = collect_conversion_csvs(conversion_dir, files)
+    csv_files = await executors.run_io(collect_conversion_csvs, conversion_dir, files)
     if not csv_files:
         raise HTTPException(status_code=404, detail=f"No CSV files found in conversion session. Searched in: {conversion_dir}")
 
-    batch_session_id, batch_temp_dir = session_manager.create_session_dir("batch_")
+    batch_session_id, batch_temp_dir = await executors.run_io(
+        session_manager.create_session_dir, "batch_", owner=current_user,
+    )
+    invoices, failures = await build_invoice_batch(batch_temp_dir, csv_files)
+    return batch_response(batch_session_id, invoices, failures)
 
-    invoices = []
-    for idx, csv_path in enumerate(csv_files):
-        try:
-            result = process_csv_to_invoice(csv_path, batch_temp_dir, idx)
-            invoices.append(result)
-        except (ValueError, OSError, pd.errors.ParserError) as e:
-            logger.exception("Failed to process %s", csv_path)
-            continue
 
-    if not invoices:
-        raise HTTPException(status_code=500, detail="Failed to process any CSV files")
 
-    return {
-        'batch_session_id': batch_session_id,
-        'invoices': invoices,
-        'total_count': len(invoices),
-    }
+@router.post("/api/convert-to-invoices", response_model=PipelineInvoicesResponse)
+async def convert_to_invoices(form: UploadForm = Depends(upload_form), current_user: str = Depends(require_auth)):
+    """Create invoices straight from an export: one request for convert + get-conversion-files.
+
+    A CSV is split by budget code in memory; its split CSVs (conversion
+    session) and source CSVs (batch session) are only written when first
+    downloaded or used.  A CSV above ``SPLIT_STREAMING_THRESHOLD_MB`` is
+    split to files in chunks instead.  An Excel file is converted to CSVs as in stage 1,
+    one invoice per sheet.
+    """
+    file = form.file("file")
+    is_excel = file.filename.endswith(('.xlsx', '.xls'))
+    if not (is_excel or file.filename.endswith('.csv')):
+        raise HTTPException(status_code=400, detail="File must be a CSV (.csv) or Excel file (.xlsx or .xls)")
+
+    conversion_session_id, conversion_dir = await executors.run_io(
+        session_manager.create_session_dir, "convert_", owner=current_user,
+    )
+    batch_session_id, batch_temp_dir = await executors.run_io(
+        session_manager.create_session_dir, "batch_", owner=current_user,
+    )
+
+    try:
+        upload_path = os.path.join(conversion_dir, file.filename)
+        upload_sha256 = await executors.run_io(file.move_to, upload_path)
+        await executors.run_io(
+            session_manager.record_artifacts, conversion_dir,
+            [(upload_path, session_manager.ROLE_UPLOAD, None, upload_sha256)],
+        )
+
+        if is_excel:
+            written = await executors.run_cpu(xlsx_to_csv, upload_path, conversion_dir, engine=resolve_engine(upload_path))
+            artifacts = await executors.run_io(
+                session_manager.record_artifacts, conversion_dir,
+                [(path, session_manager.ROLE_SHEET, rows) for path, rows in written],
+            )
+            invoices, failures = await build_invoice_batch(batch_temp_dir, [
+                (session_manager.artifact_path(conversion_dir, artifact), artifact['sha256'])
+                for artifact in artifacts
+            ])
+        else:
+            invoices, failures = await process_upload_to_invoices(
+                upload_path, conversion_dir, conversion_session_id, batch_temp_dir,
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (FileNotFoundError, OSError, BrokenProcessPool) as e:
+        logger.exception("Error converting %s to invoices", file.filename)
+        raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
+
+    return {'conversion_session_id': conversion_session_id, **batch_response(batch_session_id, invoices, failures)}
 
 
 @router.post("/api/create-combined-session", response_model=CombinedSessionResponse)
@@ -78,127 +125,94 @@ async def create_combined_session(files_data: str = Form(...), current_user: str
     if not files_by_session or len(files_by_session) == 0:
         raise HTTPException(status_code=400, detail="No files provided")
 
-    combined_session_id, combined_temp_dir = session_manager.create_session_dir("convert_")
+    combined_session_id, combined_temp_dir = await executors.run_io(
+        session_manager.create_session_dir, "convert_", owner=current_user,
+    )
     combined_output_dir = os.path.join(combined_temp_dir, "combined")
-    os.makedirs(combined_output_dir, exist_ok=True)
+    await executors.run_io(os.makedirs, combined_output_dir, exist_ok=True)
 
+    copied = {}
     for sid, filenames in files_by_session.items():
-        conversion_dir = session_manager.find_conversion_dir(sid)
+        conversion_dir = await executors.run_io(session_manager.find_conversion_dir, sid)
         if not conversion_dir:
             logger.warning("Session %s not found, skipping", sid)
             continue
-        for root, dirs, files_walk in os.walk(conversion_dir):
-            for csv_file in files_walk:
-                if csv_file.endswith('.csv') and csv_file in filenames:
-                    shutil.copy2(os.path.join(root, csv_file), os.path.join(combined_output_dir, csv_file))
-
-    copied_files = [f for f in os.listdir(combined_output_dir) if f.endswith('.csv')]
-    if not copied_files:
+        wanted = set(filenames)
+        for artifact in await executors.run_io(session_manager.list_artifacts, conversion_dir):
+            if artifact['name'] in wanted:
+                dest = os.path.join(combined_output_dir, artifact['name'])
+                await executors.run_io(
+                    blob_store.ingest_file, session_manager.artifact_path(conversion_dir, artifact), dest, artifact['sha256'],
+                )
+                copied[dest] = (dest, session_manager.ROLE_COMBINED, artifact['rows'], artifact['sha256'])
+
+    if not copied:
         raise HTTPException(status_code=500, detail="Failed to copy files to combined session")
+    artifacts = await executors.run_io(session_manager.record_artifacts, combined_temp_dir, list(copied.values()))
 
     return {
         'session_id': combined_session_id,
-        'file_count': len(copied_files),
-        'files': copied_files,
+        'file_count': len(artifacts),
+        'files': [a['name'] for a in artifacts],
+        'row_counts': {a['name']: a['rows'] for a in artifacts},
     }
 
 
 @router.post("/api/upload-csv", response_model=BatchInvoicesResponse)
-async def upload_csv(files: list[UploadFile] = File(...), current_user: str = Depends(require_auth)):
-    """Upload one or more CSV files, process them, and return invoice data for editing."""
+async def upload_csv(form: UploadForm = Depends(upload_form), current_user: str = Depends(require_auth)):
+    """Upload one or more CSV files, process them, and return invoice data for editing.
+
+    Files that cannot be turned into an invoice are reported in ``failures``.
+    """
+    files = form.uploads.get("files")
     if not files:
         raise HTTPException(status_code=400, detail="At least one CSV file is required")
+    names = [file.filename for file in files]
+    for name in names:
+        if not name.endswith('.csv'):
+            raise HTTPException(status_code=400, detail=f"File {name} must be a CSV file")
+    if len(set(names)) != len(names):
+        raise HTTPException(status_code=400, detail="CSV files must have different names")
+
+    batch_session_id, batch_temp_dir = await executors.run_io(
+        session_manager.create_session_dir, "batch_", owner=current_user,
+    )
+
+    csv_files = []
+    for file in files:
+        csv_path = os.path.join(batch_temp_dir, file.filename)
+        try:
+            csv_files.append((csv_path, await executors.run_io(file.move_to, csv_path)))
+        except OSError as e:
+            raise HTTPException(status_code=500, detail=f"Failed to save uploaded file: {str(e)}")
 
-    batch_session_id, batch_temp_dir = session_manager.create_session_dir("batch_")
-    invoices = []
-
-    try:
-        for idx, file in enumerate(files):
-            if not file.filename.endswith('.csv'):
-                raise HTTPException(status_code=400, detail=f"File {file.filename} must be a CSV file")
-
-            csv_path = os.path.join(batch_temp_dir, file.filename)
-            try:
-                with open(csv_path, "wb") as buffer:
-                    shutil.copyfileobj(file.file, buffer)
-            except OSError as e:
-                raise HTTPException(status_code=500, detail=f"Failed to save uploaded file: {str(e)}")
-
-            try:
-                df = csv_to_dataframe(csv_path)
-            except (FileNotFoundError, pd.errors.ParserError, pd.errors.EmptyDataError, ValueError) as e:
-                raise HTTPException(status_code=500, detail=f"Error reading CSV file {file.filename}: {str(e)}")
-
-            try:
-                invoice_data = transform_dataframe_to_invoice_data(df)
-            except (ValueError, KeyError) as e:
-                raise HTTPException(status_code=500, detail=f"Error transforming data for {file.filename}: {str(e)}")
-
-            invoice_session_id = os.urandom(16).hex()
-            invoice_data_path = os.path.join(batch_temp_dir, f"{invoice_session_id}_invoice_data.pkl")
-            source_csv_path = os.path.join(batch_temp_dir, f"{invoice_session_id}_source.csv")
-
-            try:
-                with open(invoice_data_path, 'wb') as f:
-                    pickle.dump(invoice_data, f)
-            except (OSError, pickle.PicklingError) as e:
-                raise HTTPException(status_code=500, detail=f"Error saving invoice data: {str(e)}")
-
-            try:
-                shutil.copy2(csv_path, source_csv_path)
-                with open(os.path.join(batch_temp_dir, f"{invoice_session_id}_source_filename.txt"), "w", encoding="utf-8") as fn:
-                    fn.write(file.filename)
-                source_headers = list(pd.read_csv(source_csv_path, nrows=0).columns)
-            except (OSError, pd.errors.ParserError):
-                source_headers = list(df.columns)
-
-            try:
-                serialized_invoice_data = serialize_invoice_data(invoice_data)
-            except (TypeError, ValueError) as e:
-                raise HTTPException(status_code=500, detail=f"Error serializing invoice data: {str(e)}")
-
-            invoices.append({
-                'session_id': invoice_session_id,
-                'filename': file.filename,
-                'invoice_data': serialized_invoice_data,
-                'source_headers': source_headers,
-                'index': idx,
-            })
-
-        return {
-            'batch_session_id': batch_session_id,
-            'invoices': invoices,
-            'total_count': len(invoices),
-        }
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.exception("Unexpected error processing CSV files")
-        raise HTTPException(status_code=500, detail=f"Error processing CSV: {str(e)}")
+    invoices, failures = await build_invoice_batch(batch_temp_dir, csv_files)
+    return batch_response(batch_session_id, invoices, failures)
 
 
 @router.post("/api/upload-html", response_model=UploadHtmlResponse)
-async def upload_html(file: UploadFile = File(...), current_user: str = Depends(require_auth)):
+async def upload_html(form: UploadForm = Depends(upload_form), current_user: str = Depends(require_auth)):
     """Upload HTML invoice file, parse it, and return invoice data for editing."""
+    file = form.file("file")
     if not file.filename.endswith('.html'):
         raise HTTPException(status_code=400, detail="File must be an HTML file (.html)")
 
-    invoice_session_id, batch_temp_dir = session_manager.create_session_dir("html_")
+    invoice_session_id, batch_temp_dir = await executors.run_io(
+        session_manager.create_session_dir, "html_", owner=current_user,
+    )
 
     try:
         html_content = await file.read()
         html_content_str = html_content.decode('utf-8')
-        invoice_data = parse_html_invoice(html_content_str)
+        invoice_data = await executors.run_cpu(parse_html_invoice, html_content_str)
 
-        invoice_data_path = os.path.join(batch_temp_dir, f"{invoice_session_id}_invoice_data.pkl")
-        with open(invoice_data_path, 'wb') as f:
-            pickle.dump(invoice_data, f)
+        await executors.run_io(session_manager.create_invoice, batch_temp_dir, invoice_data, invoice_session_id)
 
         return {
             'session_id': invoice_session_id,
             'filename': file.filename,
             'invoice_data': invoice_data,
         }
-    except (UnicodeDecodeError, ValueError, OSError) as e:
+    except (UnicodeDecodeError, ValueError, OSError, BrokenProcessPool) as e:
         logger.exception("Error processing HTML invoice")
         raise HTTPException(status_code=500, detail=f"Error processing HTML invoice: {str(e)}")
@@ -2,19 +2,18 @@
 
 import json
 import logging
-import os
-import pickle
 
 import pandas as pd
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, Request
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
+from fastapi import APIRouter, Form, Depends, HTTPException, Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 from fastapi.templating import Jinja2Templates
-from pathlib import Path
 
+import executors
 import session_manager
 
 logger = logging.getLogger(__name__)
 from dependencies import require_auth
+from upload_ingest import UploadForm, upload_form
 from models import (
     CalculatedFieldsResponse,
     SummaryMappingResponse,
@@ -22,10 +21,13 @@ from models import (
     SummaryTemplateUploadResponse,
     parse_json_dict,
 )
+from services.export_service import attachment_headers
 from services.summary_service import (
     SUMMARY_CALCULATED_FIELDS,
     build_merged_summary,
     ensure_line_item_charges,
+    summary_csv_bytes,
+    summary_template_columns,
 )
 
 import config
@@ -43,9 +45,7 @@ async def get_summary_calculated_fields(current_user: str = Depends(require_auth
 
 @router.post("/api/upload-summary-template", response_model=SummaryTemplateUploadResponse)
 async def upload_summary_template(
-    batch_session_id: str = Form(...),
-    invoice_session_id: str = Form(...),
-    file: UploadFile = File(...),
+    form: UploadForm = Depends(upload_form),
     current_user: str = Depends(require_auth),
 ):
     """Upload the empty/template CSV for the summary sheet.
@@ -53,27 +53,26 @@ async def upload_summary_template(
     Saves it per-invoice so each invoice can have its own summary template.
     Returns the column headers so the client can show the column-mapping modal.
     """
+    batch_session_id = form.field("batch_session_id")
+    invoice_session_id = form.field("invoice_session_id")
+    file = form.file("file")
     if not file.filename or not file.filename.lower().endswith(".csv"):
         raise HTTPException(status_code=400, detail="File must be a CSV")
-    batch_dir = session_manager.find_batch_dir(batch_session_id)
+    batch_dir = await executors.run_io(session_manager.find_batch_dir, batch_session_id)
     if not batch_dir:
         raise HTTPException(status_code=404, detail="Batch session not found")
 
-    path = os.path.join(batch_dir, f"summary_template_{invoice_session_id}.csv")
     content = await file.read()
-    with open(path, "wb") as f:
-        f.write(content)
-
-    name_path = os.path.join(batch_dir, f"summary_template_filename_{invoice_session_id}.txt")
-    with open(name_path, "w", encoding="utf-8") as f:
-        f.write(file.filename or "summary_template.csv")
-
     try:
-        df = pd.read_csv(path, nrows=0)
-        columns = list(df.columns)
-    except (pd.errors.ParserError, pd.errors.EmptyDataError, OSError) as e:
+        columns = await executors.run_io(summary_template_columns, content)
+    except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as e:
         raise HTTPException(status_code=400, detail=f"Invalid CSV: {str(e)}")
 
+    await executors.run_io(
+        session_manager.get_store().set_summary_template,
+        batch_dir, invoice_session_id, file.filename or "summary_template.csv", content,
+    )
+
     return {"columns": columns, "template_filename": file.filename}
 
 
@@ -85,14 +84,12 @@ async def set_summary_mapping(
     current_user: str = Depends(require_auth),
 ):
     """Save the column mapping (summary column -> source CSV column) per invoice."""
-    batch_dir = session_manager.find_batch_dir(batch_session_id)
+    batch_dir = await executors.run_io(session_manager.find_batch_dir, batch_session_id)
     if not batch_dir:
         raise HTTPException(status_code=404, detail="Batch session not found")
     mapping_obj = parse_json_dict(mapping, "mapping")
 
-    path = os.path.join(batch_dir, f"summary_mapping_{invoice_session_id}.json")
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(mapping_obj, f, indent=2)
+    await executors.run_io(session_manager.get_store().set_summary_mapping, batch_dir, invoice_session_id, mapping_obj)
     return {"ok": True}
 
 
@@ -103,45 +100,28 @@ async def summary_template_status(
     current_user: str = Depends(require_auth),
 ):
     """Return whether a summary template and mapping exist for this invoice."""
-    batch_dir = session_manager.find_batch_dir(batch_session_id)
+    batch_dir = await executors.run_io(session_manager.find_batch_dir, batch_session_id)
     if not batch_dir:
         raise HTTPException(status_code=404, detail="Batch session not found")
 
-    template_path = os.path.join(batch_dir, f"summary_template_{invoice_session_id}.csv")
-    mapping_path = os.path.join(batch_dir, f"summary_mapping_{invoice_session_id}.json")
-    filename_path = os.path.join(batch_dir, f"summary_template_filename_{invoice_session_id}.txt")
-
-    has_template = os.path.isfile(template_path)
-    has_mapping = os.path.isfile(mapping_path)
+    state = await executors.run_io(session_manager.get_store().load_state, batch_dir, invoice_session_id)
+    has_template = state is not None and state.summary_template is not None
+    has_mapping = state is not None and state.summary_mapping is not None
     columns = []
     template_filename = None
 
     if has_template:
         try:
-            df = pd.read_csv(template_path, nrows=0)
-            columns = list(df.columns)
-        except (pd.errors.ParserError, pd.errors.EmptyDataError, OSError) as e:
+            columns = await executors.run_io(summary_template_columns, state.summary_template)
+        except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as e:
             logger.warning("Could not read summary template columns: %s", e)
-        if os.path.isfile(filename_path):
-            try:
-                with open(filename_path, "r", encoding="utf-8") as f:
-                    template_filename = f.read().strip()
-            except OSError as e:
-                logger.warning("Could not read template filename: %s", e)
-
-    mapping_obj = None
-    if has_mapping:
-        try:
-            with open(mapping_path, "r", encoding="utf-8") as f:
-                mapping_obj = json.load(f)
-        except (OSError, json.JSONDecodeError) as e:
-            logger.warning("Could not read summary mapping: %s", e)
+        template_filename = state.summary_template_filename
 
     return {
         "has_template": has_template,
         "has_mapping": has_mapping,
         "columns": columns,
-        "mapping": mapping_obj or {},
+        "mapping": (state.summary_mapping if has_mapping else None) or {},
         "template_filename": template_filename,
     }
 
@@ -162,19 +142,15 @@ async def generate_summary_data(
     can continue tracking which cells are user-owned.
     """
     try:
-        invoice_data_path, temp_dir = session_manager.find_invoice_data_with_dir(session_id)
-        if not temp_dir or not invoice_data_path:
+        temp_dir, state = await executors.run_io(session_manager.load_invoice_state, session_id)
+        if not temp_dir:
             raise HTTPException(status_code=404, detail="Session not found")
 
         if invoice_data_json:
-            invoice_data = json.loads(invoice_data_json)
-            with open(invoice_data_path, 'wb') as f:
-                pickle.dump(invoice_data, f)
-        else:
-            with open(invoice_data_path, 'rb') as f:
-                invoice_data = pickle.load(f)
-
-        result = build_merged_summary(temp_dir, session_id, invoice_data)
+            state.invoice_data = json.loads(invoice_data_json)
+            await executors.run_io(session_manager.get_store().save_invoice, temp_dir, session_id, state.invoice_data)
+
+        result = await executors.run_io(build_merged_summary, temp_dir, state)
         if result is None:
             raise HTTPException(
                 status_code=400,
@@ -182,18 +158,8 @@ async def generate_summary_data(
             )
 
         summary_columns, rows, edited_cells = result
-
-        tpl_name_path = os.path.join(temp_dir, f"summary_template_filename_{session_id}.txt")
-        template_filename = None
-        if os.path.isfile(tpl_name_path):
-            with open(tpl_name_path, "r", encoding="utf-8") as fn:
-                template_filename = fn.read().strip()
-
-        src_fn_path = os.path.join(temp_dir, f"{session_id}_source_filename.txt")
-        source_filename = None
-        if os.path.isfile(src_fn_path):
-            with open(src_fn_path, "r", encoding="utf-8") as fn:
-                source_filename = fn.read().strip()
+        template_filename = state.summary_template_filename
+        source_filename = state.source_filename
 
         return JSONResponse({
             "columns": summary_columns,
@@ -226,17 +192,11 @@ async def save_summary_edits(
         row_data = json.loads(rows)
         mask = json.loads(edited_cells)
 
-        _, temp_dir = session_manager.find_invoice_data_with_dir(session_id)
+        temp_dir = await executors.run_io(session_manager.find_invoice_dir, session_id)
         if not temp_dir:
             raise HTTPException(status_code=404, detail="Session not found")
 
-        out_df = pd.DataFrame(row_data, columns=cols)
-        summary_csv_path = os.path.join(temp_dir, f"summary_single_{session_id}.csv")
-        out_df.to_csv(summary_csv_path, index=False, encoding="utf-8")
-
-        edits_mask_path = os.path.join(temp_dir, f"summary_edits_{session_id}.json")
-        with open(edits_mask_path, "w", encoding="utf-8") as f:
-            json.dump({"edited_cells": mask}, f)
+        await executors.run_io(session_manager.get_store().set_summary_sheet, temp_dir, session_id, cols, row_data, mask)
 
         return JSONResponse({"ok": True})
     except HTTPException:
@@ -251,26 +211,16 @@ async def download_summary_csv(
     current_user: str = Depends(require_auth),
 ):
     """Download the saved summary CSV for a single invoice session."""
-    _, temp_dir = session_manager.find_invoice_data_with_dir(session_id)
-    if not temp_dir:
+    _temp_dir, state = await executors.run_io(session_manager.load_invoice_state, session_id)
+    if not state:
         raise HTTPException(status_code=404, detail="Session not found")
-
-    summary_csv_path = os.path.join(temp_dir, f"summary_single_{session_id}.csv")
-    if not os.path.isfile(summary_csv_path):
+    if state.summary_rows is None:
         raise HTTPException(status_code=404, detail="Summary CSV not found. Generate summary data first.")
 
-    src_fn_path = os.path.join(temp_dir, f"{session_id}_source_filename.txt")
-    if os.path.isfile(src_fn_path):
-        with open(src_fn_path, "r", encoding="utf-8") as fn:
-            invoice_stem = Path(fn.read().strip()).stem
-    else:
-        invoice_stem = session_id
-    download_name = f"{invoice_stem}_backing_data.csv"
-
-    return FileResponse(
-        summary_csv_path,
+    return Response(
+        content=await executors.run_io(summary_csv_bytes, state.summary_columns, state.summary_rows),
         media_type="text/csv",
-        filename=download_name,
+        headers=attachment_headers(f"{state.stem}_backing_data.csv"),
     )
 
 
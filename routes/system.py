@@ -0,0 +1,28 @@
+"""System routes: operational statistics for the temp-directory reaper, the executors and the job queue."""
+
+from fastapi import APIRouter, Depends
+
+import executors
+import jobs
+import session_reaper
+from dependencies import require_auth
+
+router = APIRouter()
+
+
+@router.get("/api/system/reaper")
+async def reaper_stats(current_user: str = Depends(require_auth)):
+    """Return temp-directory usage (totals, and the caller's own) and what the reaper has reclaimed so far."""
+    return await executors.run_io(session_reaper.get_stats, current_user)
+
+
+@router.get("/api/system/executors")
+async def executor_stats(current_user: str = Depends(require_auth)):
+    """Return size, queue depth and totals of the I/O and CPU executors."""
+    return executors.stats()
+
+
+@router.get("/api/system/jobs")
+async def job_queue_stats(current_user: str = Depends(require_auth)):
+    """Return the number of jobs per status in the shared queue."""
+    return await executors.run_io(jobs.queue_stats)
@@ -0,0 +1,59 @@
+"""
+Parallel XLSX -> CSV conversion of several workbooks at once.
+
+Worksheets are the unit of work: each workbook's sheet list is read in a
+worker, then every sheet is converted by :func:`xslx_to_csv.convert_sheet`
+in its own task on the :mod:`executors` CPU pool, so a batch of multi-sheet
+workbooks keeps all ``config.CPU_WORKERS`` cores busy instead of one.
+"""
+
+import asyncio
+import logging
+from typing import Optional
+
+import executors
+import xslx_to_csv
+
+logger = logging.getLogger(__name__)
+
+
+async def _gather(tasks: list) -> list:
+    # Let every task finish before failing, so no worker is still writing
+    # into the session directory after the request has returned.
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+async def _convert_workbook(xlsx_path: str, output_dir: str, engine: Optional[str], mode: Optional[str]) -> list:
+    engine = xslx_to_csv.resolve_engine(xlsx_path, engine, mode)
+    mode = xslx_to_csv.resolve_mode(engine, mode)
+    (sheets,) = await _gather([executors.run_cpu(xslx_to_csv.sheet_names, xlsx_path, engine)])
+
+    workbook_dir = xslx_to_csv.output_dir_for(xlsx_path, output_dir)
+    tasks = []
+    taken = set()
+    for sheet_name in sheets:
+        csv_path = xslx_to_csv.csv_path_for(workbook_dir, xlsx_path, sheet_name, taken)
+        tasks.append(executors.run_cpu(xslx_to_csv.convert_sheet, xlsx_path, sheet_name, csv_path, mode, engine))
+    logger.info("Converting %d sheet(s) of %s (%s, %s)", len(tasks), xlsx_path, mode, engine)
+    return await _gather(tasks)
+
+
+async def convert_workbooks(
+    xlsx_paths: list[str],
+    output_dir: str,
+    engine: Optional[str] = None,
+    mode: Optional[str] = None,
+) -> list[tuple[str, int, str]]:
+    """Convert every sheet of every workbook into ``output_dir/<workbook stem>/``.
+
+    Returns ``(csv_path, row_count, sha256)`` in workbook order, then sheet
+    order.  Raises ``ValueError`` if any workbook or sheet cannot be read.
+    """
+    per_workbook = await _gather([
+        _convert_workbook(path, output_dir, engine, mode) for path in xlsx_paths
+    ])
+    return [result for results in per_workbook for result in results]
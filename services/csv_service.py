@@ -1,19 +1,24 @@
 """CSV merge, collection, and per-file invoice-creation helpers."""
 
+import asyncio
 import json
 import logging
 import os
-import pickle
-import shutil
-from typing import Optional
+import sqlite3
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
 
 import pandas as pd
 from fastapi import HTTPException
 
+import blob_store
+import columnar_cache
+import divider
+import executors
 import session_manager
 
 logger = logging.getLogger(__name__)
-from csv_cleaner import csv_to_dataframe
+from csv_cleaner import COLUMNS_TO_KEEP, csv_to_dataframe, frame_to_dataframe
 from DataScraper import transform_dataframe_to_invoice_data
 from services.invoice_service import serialize_invoice_data
 
@@ -23,7 +28,7 @@ def merge_csv_dataframes(csv_paths: list[str]) -> pd.DataFrame:
     dataframes = []
     for path in csv_paths:
         try:
-            dataframes.append(pd.read_csv(path))
+            dataframes.append(columnar_cache.read_csv(path))
         except (FileNotFoundError, pd.errors.ParserError, pd.errors.EmptyDataError, OSError) as e:
             raise HTTPException(
                 status_code=400,
@@ -48,7 +53,9 @@ def save_merged_csv(
 
     output_dir = os.path.join(temp_dir, "merged")
     os.makedirs(output_dir, exist_ok=True)
-    merged_df.to_csv(os.path.join(output_dir, output_filename), index=False, encoding='utf-8')
+    output_path = os.path.join(output_dir, output_filename)
+    merged_df.to_csv(output_path, index=False, encoding='utf-8')
+    session_manager.record_artifact(temp_dir, output_path, session_manager.ROLE_MERGED, len(merged_df))
 
     return {
         'session_id': session_id,
@@ -60,53 +67,52 @@ def save_merged_csv(
     }
 
 
-def collect_conversion_csvs(conversion_dir: str, files_filter: Optional[str] = None) -> list[str]:
-    """Collect CSV file paths from a conversion directory, excluding the original upload."""
-    original_file_path = None
-    for item in os.listdir(conversion_dir):
-        item_path = os.path.join(conversion_dir, item)
-        if os.path.isfile(item_path) and item.endswith('.csv'):
-            original_file_path = item_path
-            break
+def collect_conversion_csvs(conversion_dir: str, files_filter: Optional[str] = None) -> list[tuple[str, str]]:
+    """Collect derived CSVs from a conversion session's manifest as ``(path, sha256)``.
 
-    csv_files = []
-    for root, _dirs, files_walk in os.walk(conversion_dir):
-        for csv_file in files_walk:
-            if csv_file.endswith('.csv'):
-                file_path = os.path.join(root, csv_file)
-                if file_path != original_file_path:
-                    csv_files.append(file_path)
+    Original uploads are excluded; *files_filter* is an optional JSON list of
+    file names to keep.
+    """
+    artifacts = session_manager.list_artifacts(conversion_dir, session_manager.DERIVED_ROLES)
 
     if files_filter:
         try:
             selected = set(json.loads(files_filter))
-            csv_files = [f for f in csv_files if os.path.basename(f) in selected]
+            artifacts = [a for a in artifacts if a['name'] in selected]
         except (json.JSONDecodeError, TypeError):
             pass
-    return csv_files
+    return [(session_manager.artifact_path(conversion_dir, a), a['sha256']) for a in artifacts]
 
 
-def process_csv_to_invoice(csv_path: str, batch_dir: str, index: int) -> dict:
-    """Read a single CSV, convert to invoice data, persist artefacts, and return metadata."""
-    df = csv_to_dataframe(csv_path)
-    invoice_data = transform_dataframe_to_invoice_data(df)
+# Errors that fail one file of a batch rather than the whole request.
+BATCH_FILE_ERRORS = (ValueError, KeyError, OSError, pd.errors.ParserError, sqlite3.Error, BrokenProcessPool)
+
 
-    invoice_session_id = os.urandom(16).hex()
-    invoice_data_path = os.path.join(batch_dir, f"{invoice_session_id}_invoice_data.pkl")
-    source_csv_path = os.path.join(batch_dir, f"{invoice_session_id}_source.csv")
+def csv_invoice_data(csv_path: str) -> tuple[dict, list[str], int]:
+    """Read a single CSV and return ``(invoice data, column names, row count)`` (no side effects)."""
+    df = csv_to_dataframe(csv_path)
+    return transform_dataframe_to_invoice_data(df), list(df.columns), len(df)
 
-    with open(invoice_data_path, 'wb') as f:
-        pickle.dump(invoice_data, f)
 
-    shutil.copy2(csv_path, source_csv_path)
+def save_csv_invoice(
+    csv_path: str,
+    batch_dir: str,
+    index: int,
+    invoice_data: dict,
+    columns: list[str],
+    sha256: Optional[str] = None,
+) -> dict:
+    """Persist the invoice built from *csv_path* and its source CSV; return its metadata."""
     csv_filename = os.path.basename(csv_path)
-    with open(os.path.join(batch_dir, f"{invoice_session_id}_source_filename.txt"), "w", encoding="utf-8") as fn:
-        fn.write(csv_filename)
+    invoice_session_id = session_manager.create_invoice(batch_dir, invoice_data, source_filename=csv_filename)
+    source_csv_path = session_manager.source_csv_path(batch_dir, invoice_session_id)
+    blob_store.ingest_file(csv_path, source_csv_path, sha256)
+    columnar_cache.copy_sidecar(csv_path, source_csv_path)
 
     try:
-        source_headers = list(pd.read_csv(source_csv_path, nrows=0).columns)
+        source_headers = columnar_cache.read_header(source_csv_path)
     except (OSError, pd.errors.ParserError):
-        source_headers = list(df.columns)
+        source_headers = columns
 
     return {
         'session_id': invoice_session_id,
@@ -115,3 +121,134 @@ def process_csv_to_invoice(csv_path: str, batch_dir: str, index: int) -> dict:
         'source_headers': source_headers,
         'index': index,
     }
+
+
+def process_csv_to_invoice(csv_path: str, batch_dir: str, index: int, sha256: Optional[str] = None) -> dict:
+    """Read a single CSV, convert to invoice data, persist artefacts, and return metadata.
+
+    *sha256* is the CSV's content hash when already known (from a manifest).
+    """
+    invoice_data, columns, _rows = csv_invoice_data(csv_path)
+    return save_csv_invoice(csv_path, batch_dir, index, invoice_data, columns, sha256)
+
+
+async def build_invoice_batch(
+    batch_dir: str,
+    csv_files: list[tuple[str, Optional[str]]],
+    on_file: Optional[Callable[[int], None]] = None,
+) -> tuple[list[dict], list[dict]]:
+    """Create one invoice per ``(csv_path, sha256)`` in *batch_dir*; return ``(invoices, failures)``.
+
+    The CSVs are read and transformed concurrently in the CPU executor;
+    invoices are saved in input order as their data arrives, so the batch
+    keeps the order of *csv_files*.  A file that fails is logged and
+    reported as ``{'filename', 'index', 'error'}`` without stopping the rest.
+    *on_file* is called with the rows read after each file (0 if it failed).
+    """
+    reads = [asyncio.ensure_future(executors.run_cpu(csv_invoice_data, path)) for path, _sha256 in csv_files]
+    invoices, failures = [], []
+    try:
+        for index, ((csv_path, sha256), read) in enumerate(zip(csv_files, reads)):
+            rows = 0
+            try:
+                invoice_data, columns, rows = await read
+                invoices.append(await executors.run_io(
+                    save_csv_invoice, csv_path, batch_dir, index, invoice_data, columns, sha256,
+                ))
+            except BATCH_FILE_ERRORS as e:
+                logger.exception("Failed to process %s", csv_path)
+                failures.append({'filename': os.path.basename(csv_path), 'index': index, 'error': str(e)})
+                rows = 0
+            if on_file is not None:
+                on_file(rows)
+    finally:
+        for read in reads:
+            read.cancel()
+    return invoices, failures
+
+
+def batch_response(batch_session_id: str, invoices: list[dict], failures: list[dict]) -> dict:
+    """Response body for a new batch; 500 when no file produced an invoice."""
+    if not invoices:
+        reasons = "; ".join(f"{f['filename']}: {f['error']}" for f in failures)
+        raise HTTPException(status_code=500, detail=f"Failed to process any CSV files{': ' + reasons if reasons else ''}")
+    return {
+        'batch_session_id': batch_session_id,
+        'invoices': invoices,
+        'total_count': len(invoices),
+        'failures': failures,
+    }
+
+
+async def process_upload_to_invoices(
+    csv_path: str, conversion_dir: str, conversion_session_id: str, batch_dir: str,
+) -> tuple[list[dict], list[dict]]:
+    """Split an uploaded export by budget code and create one invoice per part.
+
+    Returns ``(invoices, failures)`` as :func:`build_invoice_batch` does, one
+    per split CSV.  An upload up to ``config.SPLIT_STREAMING_THRESHOLD_MB`` is
+    split in memory in the CPU executor without writing the parts: the split
+    CSVs and the invoices' source CSVs are deferred (see
+    :func:`session_manager.defer_source_csvs`).  A larger one is split to
+    files in chunks, as ``/api/convert-csv`` does, and goes through
+    :func:`build_invoice_batch`, so no request holds a whole export in memory.
+    """
+    if divider.split_mode(csv_path) == "streaming":
+        output_dir = os.path.join(conversion_dir, session_manager.SPLIT_DIRNAME)
+        written = await executors.run_cpu(divider.split_csv_by_budget_code, csv_path, output_dir)
+        artifacts = await executors.run_io(
+            session_manager.record_artifacts, conversion_dir,
+            [(path, session_manager.ROLE_SPLIT, rows) for path, rows in written],
+        )
+        return await build_invoice_batch(batch_dir, [
+            (session_manager.artifact_path(conversion_dir, artifact), artifact['sha256']) for artifact in artifacts
+        ])
+
+    await executors.run_io(session_manager.defer_split, conversion_dir, csv_path)
+    source_headers, parts = await executors.run_cpu(upload_invoice_parts, csv_path)
+    return await executors.run_io(save_upload_invoices, parts, source_headers, conversion_session_id, batch_dir)
+
+
+def upload_invoice_parts(csv_path: str) -> tuple[list, list[tuple[str, Optional[dict], Optional[str]]]]:
+    """Split an export by budget code in memory and build each part's invoice data (no side effects).
+
+    Returns ``(source headers, [(filename, invoice data, error), ...])`` in
+    split order; a part that fails has no data and the error message.
+    """
+    source_headers = columnar_cache.read_header(csv_path)
+    parts = []
+    for filename, part in divider.budget_code_frames(csv_path, COLUMNS_TO_KEEP):
+        try:
+            parts.append((filename, transform_dataframe_to_invoice_data(frame_to_dataframe(part)), None))
+        except BATCH_FILE_ERRORS as e:
+            logger.exception("Failed to process %s of %s", filename, csv_path)
+            parts.append((filename, None, str(e)))
+    return source_headers, parts
+
+
+def save_upload_invoices(
+    parts: list, source_headers: list, conversion_session_id: str, batch_dir: str,
+) -> tuple[list[dict], list[dict]]:
+    """Persist the invoices :func:`upload_invoice_parts` built; return ``(invoices, failures)``."""
+    invoices, failures = [], []
+    sources = {}
+    for index, (filename, invoice_data, error) in enumerate(parts):
+        try:
+            if error is not None:
+                raise ValueError(error)
+            invoice_session_id = session_manager.create_invoice(batch_dir, invoice_data, source_filename=filename)
+        except BATCH_FILE_ERRORS as e:
+            if error is None:
+                logger.exception("Failed to save the invoice for %s", filename)
+            failures.append({'filename': filename, 'index': index, 'error': str(e)})
+            continue
+        sources[invoice_session_id] = (conversion_session_id, filename)
+        invoices.append({
+            'session_id': invoice_session_id,
+            'filename': filename,
+            'invoice_data': serialize_invoice_data(invoice_data),
+            'source_headers': source_headers,
+            'index': index,
+        })
+    session_manager.defer_source_csvs(batch_dir, sources)
+    return invoices, failures
@@ -0,0 +1,186 @@
+"""Exports: download headers, and every invoice of a batch in one ZIP with its filled summary sheet."""
+
+import asyncio
+import copy
+import dataclasses
+import io
+import logging
+import os
+import zipfile
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncIterator, Callable, Optional
+from urllib.parse import quote
+
+from fastapi import HTTPException
+
+import config
+import executors
+from services.invoice_service import invoice_images, render_invoice_html
+from services.summary_service import build_merged_summary, summary_csv_bytes
+from session_store import InvoiceState
+
+logger = logging.getLogger(__name__)
+
+ASSET_MODES = ("embedded", "linked")
+
+
+def attachment_headers(filename: str) -> dict:
+    """``Content-Disposition`` header offering a response for download as *filename*.
+
+    Names that need escaping are sent UTF-8 encoded (``filename*``), as
+    ``FileResponse`` does.
+    """
+    quoted = quote(filename)
+    if quoted != filename:
+        return {"Content-Disposition": f"attachment; filename*=utf-8''{quoted}"}
+    return {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+
+def invoices_zip_name(batch_session_id: str) -> str:
+    """File name of the download-all ZIP of a batch."""
+    return f"invoices_{batch_session_id}.zip"
+
+
+def linked_assets(asset_mode: Optional[str]) -> bool:
+    """Whether a download-all ZIP links its images; *asset_mode* defaults to ``EXPORT_ASSET_MODE``."""
+    mode = asset_mode or config.EXPORT_ASSET_MODE
+    if mode not in ASSET_MODES:
+        raise HTTPException(status_code=400, detail=f"asset_mode must be one of: {', '.join(ASSET_MODES)}")
+    return mode == "linked"
+
+
+class _ZipChunks(io.RawIOBase):
+    """Unseekable sink for a streamed ZIP: :meth:`take` returns what was written since the last call."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        chunk = bytes(data)
+        self._chunks.append(chunk)
+        return len(chunk)
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _summary_csv(batch_dir: str, state: InvoiceState) -> Optional[bytes]:
+    """The invoice's filled summary sheet as CSV; *None* when it has none."""
+    if state.summary_template is None or state.summary_mapping is None:
+        return None
+    # The summary fills empty line-item charges in place, while the render
+    # may still be pickling the same invoice data for the CPU executor.
+    state = dataclasses.replace(state, invoice_data=copy.deepcopy(state.invoice_data))
+    result = build_merged_summary(batch_dir, state)
+    if result is None:
+        return None
+    summary_columns, merged_rows, _ = result
+    return summary_csv_bytes(summary_columns, merged_rows) if merged_rows else None
+
+
+async def _render_member(batch_dir: str, state: InvoiceState, asset_dir: Optional[str]) -> tuple[str, Optional[bytes]]:
+    return await asyncio.gather(
+        executors.run_cpu(render_invoice_html, state.invoice_data, asset_dir=asset_dir),
+        executors.run_io(_summary_csv, batch_dir, state),
+    )
+
+
+async def _rendered_members(
+    batch_dir: str, states: list[InvoiceState], asset_dir: Optional[str],
+) -> AsyncIterator[tuple[InvoiceState, str, Optional[bytes]]]:
+    """Yield ``(state, html, summary_csv)`` for each invoice, in batch order.
+
+    Invoices render in the CPU executor and summaries build in the I/O
+    executor, up to two per CPU worker ahead of the one being yielded, so
+    the renders overlap without holding the whole batch in memory.
+    """
+    window = 2 * executors.cpu_workers()
+    pending: deque = deque()
+    try:
+        for state in states:
+            pending.append((state, asyncio.ensure_future(_render_member(batch_dir, state, asset_dir))))
+            if len(pending) >= window:
+                state, render = pending.popleft()
+                yield (state, *await render)
+        while pending:
+            state, render = pending.popleft()
+            yield (state, *await render)
+    finally:
+        for _state, render in pending:
+            render.cancel()
+
+
+def _write_assets(zipf: zipfile.ZipFile, states: list[InvoiceState]) -> None:
+    """Store each invoice image once under ``EXPORT_ASSETS_DIR`` (the PAID stamp only if needed)."""
+    any_paid = any(state.invoice_data.get('paid', False) for state in states)
+    for name, path in invoice_images().items():
+        if name != config.PAID_STAMP_FILENAME or any_paid:
+            zipf.write(path, f"{config.EXPORT_ASSETS_DIR}/{name}")
+
+
+def _write_members(zipf: zipfile.ZipFile, state: InvoiceState, html: str, summary_csv: Optional[bytes]) -> None:
+    zipf.writestr(f"{state.stem}_invoice.html", html.encode('utf-8'))
+    if summary_csv is not None:
+        zipf.writestr(f"{state.stem}_backing_data.csv", summary_csv)
+
+
+async def stream_invoices_zip(
+    batch_dir: str,
+    states: list[InvoiceState],
+    on_invoice: Optional[Callable[[int], None]] = None,
+    linked: bool = False,
+) -> AsyncIterator[bytes]:
+    """Render every invoice of a batch and yield the ZIP of them as it is written.
+
+    Invoices with a summary template and mapping also get their
+    ``<stem>_backing_data.csv``.  Members are written in batch order as soon
+    as each invoice is rendered, so the first bytes go out after the first
+    invoice rather than the whole batch.  *on_invoice* is called with the
+    number of line items after each invoice is written.
+
+    With *linked*, the images are stored once under ``EXPORT_ASSETS_DIR`` and
+    the invoices reference them by relative path instead of each embedding
+    its own base64 copy.
+    """
+    asset_dir = config.EXPORT_ASSETS_DIR if linked else None
+    sink = _ZipChunks()
+    zipf = zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED)
+    if linked:
+        await executors.run_io(_write_assets, zipf, states)
+        yield sink.take()
+
+    async with aclosing(_rendered_members(batch_dir, states, asset_dir)) as members:
+        async for state, html, summary_csv in members:
+            await executors.run_io(_write_members, zipf, state, html, summary_csv)
+            if on_invoice is not None:
+                on_invoice(len(state.invoice_data.get('invoice', {}).get('items', [])))
+            yield sink.take()
+
+    await executors.run_io(zipf.close)
+    yield sink.take()
+
+
+async def build_invoices_zip(
+    batch_dir: str,
+    batch_session_id: str,
+    states: list[InvoiceState],
+    on_invoice: Optional[Callable[[int], None]] = None,
+    linked: bool = False,
+) -> str:
+    """Write the ZIP of :func:`stream_invoices_zip` to *batch_dir*; return its path."""
+    zip_path = os.path.join(batch_dir, invoices_zip_name(batch_session_id))
+    f = await executors.run_io(open, zip_path, 'wb')
+    try:
+        async with aclosing(stream_invoices_zip(batch_dir, states, on_invoice, linked)) as chunks:
+            async for chunk in chunks:
+                await executors.run_io(f.write, chunk)
+    finally:
+        await executors.run_io(f.close)
+    return zip_path
@@ -1,18 +1,21 @@
 """Invoice generation, HTML parsing, and serialisation helpers."""
 
 import base64
-import pickle
+import hashlib
+import mimetypes
+import os
 import re
 from datetime import datetime, date
-from pathlib import Path
 from typing import Optional
+from urllib.parse import quote
 
 import numpy as np
 import pandas as pd
 from bs4 import BeautifulSoup
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, pass_context
 
 import config
+import render_cache
 
 # ---------------------------------------------------------------------------
 # Date helpers
@@ -145,27 +148,217 @@ def _normalize_financial_totals(invoice_data: dict) -> None:
             fin["total"] = _coerce_money_str(expected_total)
 
 
+# ---------------------------------------------------------------------------
+# Invoice images
+# ---------------------------------------------------------------------------
+
+_data_uris: dict[str, tuple[tuple[int, int], str]] = {}
+_template_digests: dict[str, tuple[tuple[int, int], str]] = {}
+
+
+def _file_version(path) -> tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _per_file_version(cache: dict, path, compute):
+    """Return ``compute(path)``, cached in *cache* until the file's mtime or size changes."""
+    key = str(path)
+    version = _file_version(key)
+    cached = cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    value = compute(key)
+    cache[key] = (version, value)
+    return value
+
+
+def invoice_images() -> dict:
+    """Images the invoice templates use, by file name, from static/ or else templates/."""
+    images = {}
+    for filename in (config.LOGO_FILENAME, config.PAID_STAMP_FILENAME):
+        for folder in (config.STATIC_DIR, config.TEMPLATES_DIR):
+            path = config.BASE_DIR / folder / filename
+            if path.is_file():
+                images[filename] = path
+                break
+    return images
+
+
+def image_data_uri(path) -> str:
+    """Return the file at *path* as a base64 ``data:`` URI.
+
+    Each process encodes a file once; the cache is keyed on its mtime and
+    size, so a replaced image is picked up by the next render.
+    """
+    def encode(key: str) -> str:
+        mime = mimetypes.guess_type(key)[0] or 'application/octet-stream'
+        with open(key, 'rb') as f:
+            return f"data:{mime};base64,{base64.b64encode(f.read()).decode('ascii')}"
+
+    return _per_file_version(_data_uris, path, encode)
+
+
+def invoice_asset_urls(asset_dir: Optional[str] = None) -> dict[str, str]:
+    """URLs of the invoice images: data URIs, or relative links into *asset_dir*."""
+    images = invoice_images()
+    if asset_dir is None:
+        return {name: image_data_uri(path) for name, path in images.items()}
+    return {name: f"{asset_dir}/{quote(name)}" for name in images}
+
+
+@pass_context
+def asset_url(context, filename: str) -> str:
+    """Template global: the URL this render uses for an image, else its ``/static/`` URL."""
+    return (context.get('asset_urls') or {}).get(filename, f'/static/{filename}')
+
+
+# ---------------------------------------------------------------------------
+# Line item pages
+# ---------------------------------------------------------------------------
+
+_MONEY_FIELDS = ('wait_pounds', 'miles_pounds', 'job_pounds', 'total')
+_TEXT_FIELDS = (
+    'client_ref', 'nhs_number', 'contract_hospital', 'booked_by', 'from_location',
+    'to_location', 'status', 'directions', 'mob', 'wait_notes',
+)
+
+
+def _is_blank(value) -> bool:
+    """Empty, whitespace or NaN — a cell the spreadsheet left unfilled."""
+    return not value or str(value).lower() == 'nan' or str(value).strip() == ''
+
+
+def _display_our_ref(value) -> str:
+    ref = str(value).strip()
+    if not ref or ref.lower() == 'nan':
+        return ''
+    return ref[:-2] if ref.endswith('.0') else ref
+
+
+def _line_item_row(item: dict, dates: dict) -> dict[str, str]:
+    """The text of each column of a line item, formatted for the invoice.
+
+    *dates* memoises formatted dates: an invoice repeats a few dozen days
+    across all its journeys, and parsing one can take several ``strptime`` tries.
+    """
+    row = {field: str(item.get(field, '')) for field in _TEXT_FIELDS}
+    value = item.get('date')
+    if isinstance(value, str):
+        if value not in dates:
+            dates[value] = format_date_dd_mm_yyyy(value)
+        row['date'] = dates[value]
+    else:
+        row['date'] = format_date_dd_mm_yyyy(value)
+    row['our_ref'] = _display_our_ref(item.get('our_ref', ''))
+    for field in _MONEY_FIELDS:
+        value = item.get(field)
+        row[field] = f"£{format_currency(value)}" if value else ''
+    row['miles'] = '0.0' if _is_blank(item.get('miles')) else str(item['miles'])
+    row['charged'] = '0' if _is_blank(item.get('charged')) else str(item['charged'])
+    return row
+
+
+def paginate_line_items(items: list, first_page_rows: int = None, rows_per_page: int = None) -> list[list[dict]]:
+    """Split an invoice's line items into printed pages of formatted rows.
+
+    Items with neither a date nor a reference are left out.  The first page
+    holds ``config.INVOICE_FIRST_PAGE_ROWS`` rows (it shares the sheet with
+    the invoice heading) and each later page ``config.INVOICE_ROWS_PER_PAGE``.
+    """
+    if first_page_rows is None:
+        first_page_rows = config.INVOICE_FIRST_PAGE_ROWS
+    if rows_per_page is None:
+        rows_per_page = config.INVOICE_ROWS_PER_PAGE
+    first_page_rows, rows_per_page = max(first_page_rows, 1), max(rows_per_page, 1)
+
+    dates = {}
+    rows = [
+        _line_item_row(item, dates) for item in items or []
+        if not (_is_blank(item.get('date')) and _is_blank(item.get('our_ref')))
+    ]
+    pages = [rows[:first_page_rows]]
+    for start in range(first_page_rows, len(rows), rows_per_page):
+        pages.append(rows[start:start + rows_per_page])
+    return pages
+
+
 # ---------------------------------------------------------------------------
 # Invoice HTML generation
 # ---------------------------------------------------------------------------
 
-def _build_jinja_env():
-    """Create a Jinja2 Environment with invoice-specific filters."""
+def _build_jinja_env() -> Environment:
+    """Create a Jinja2 Environment with invoice-specific filters.
+
+    Compiled templates go to ``config.JINJA_BYTECODE_DIR``, so a new process
+    (restart, CPU executor worker) loads them instead of compiling again.
+    With ``TEMPLATE_AUTO_RELOAD`` (development) an edited template is picked
+    up by its mtime.
+    """
     templates_dir = config.BASE_DIR / config.TEMPLATES_DIR
-    env = Environment(loader=FileSystemLoader(str(templates_dir)))
+    bytecode_cache = None
+    if config.JINJA_BYTECODE_DIR:
+        os.makedirs(config.JINJA_BYTECODE_DIR, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(config.JINJA_BYTECODE_DIR)
+    env = Environment(
+        loader=FileSystemLoader(str(templates_dir)),
+        bytecode_cache=bytecode_cache,
+        auto_reload=config.TEMPLATE_AUTO_RELOAD,
+    )
     env.filters['format_date'] = format_date_word_format
     env.filters['format_date_numeric'] = format_date_dd_mm_yyyy
     env.filters['format_currency'] = format_currency
+    env.globals['asset_url'] = asset_url
     return env
 
 
-def generate_invoice_html(
-    invoice_data_path: str, template_name: str = None, embed_image: bool = True,
-) -> str:
-    """Generate HTML invoice from invoice data pickle file."""
-    with open(invoice_data_path, 'rb') as f:
-        invoice_data = pickle.load(f)
+_jinja_env: Optional[Environment] = None
+
+
+def get_jinja_env() -> Environment:
+    """Return this process's invoice template environment, created on first use."""
+    global _jinja_env
+    if _jinja_env is None:
+        _jinja_env = _build_jinja_env()
+    return _jinja_env
+
+
+def _template_digest(template_name: str) -> str:
+    """SHA-256 of a template's source, recomputed when the file changes."""
+    def digest(key: str) -> str:
+        with open(key, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    return _per_file_version(_template_digests, config.BASE_DIR / config.TEMPLATES_DIR / template_name, digest)
+
 
+def _render_key(invoice_data: dict, template_name: str, embed_image: bool, asset_dir: Optional[str]) -> str:
+    """Render-cache key: the data, the template's content and where its images come from."""
+    if asset_dir is not None:
+        assets = ['linked', asset_dir, sorted(invoice_images())]
+    elif embed_image:
+        assets = ['embedded', {name: _file_version(path) for name, path in invoice_images().items()}]
+    else:
+        assets = ['static']
+    pagination = [config.INVOICE_FIRST_PAGE_ROWS, config.INVOICE_ROWS_PER_PAGE]
+    return render_cache.make_key(template_name, _template_digest(template_name), assets, pagination, invoice_data)
+
+
+def render_invoice_html(
+    invoice_data: dict, template_name: str = None, embed_image: bool = True, asset_dir: Optional[str] = None,
+) -> str:
+    """Render *invoice_data* with its invoice template and return the HTML.
+
+    Images are embedded as data URIs when *embed_image* is set, or, with
+    *asset_dir*, linked as ``<asset_dir>/<file name>`` relative to the HTML
+    (for exports that ship them alongside); otherwise they stay ``/static/`` URLs.
+    Line items reach the template already filtered, formatted and split into
+    pages (:func:`paginate_line_items`).  Renders are cached in
+    :mod:`render_cache`.  *invoice_data* is not modified.
+    """
+    invoice_data = dict(invoice_data)
+    if isinstance(invoice_data.get("financial"), dict):
+        invoice_data["financial"] = dict(invoice_data["financial"])
     _normalize_financial_totals(invoice_data)
 
     if template_name is None:
@@ -175,48 +368,28 @@ def generate_invoice_html(
             else config.INVOICE_TEMPLATE_STYLE1
         )
 
-    env = _build_jinja_env()
-    template = env.get_template(template_name)
-    rendered_html = template.render(data=invoice_data)
-
-    templates_img = config.BASE_DIR / config.TEMPLATES_DIR / config.LOGO_FILENAME
-    static_img = config.BASE_DIR / config.STATIC_DIR / config.LOGO_FILENAME
-    paid_stamp_img = config.BASE_DIR / config.STATIC_DIR / config.PAID_STAMP_FILENAME
-
-    if embed_image:
-        img_path = static_img if static_img.exists() else (templates_img if templates_img.exists() else None)
-        if img_path:
-            with open(img_path, 'rb') as img_file:
-                img_b64 = f"data:image/jpeg;base64,{base64.b64encode(img_file.read()).decode('utf-8')}"
-                rendered_html = rendered_html.replace(f'/static/{config.LOGO_FILENAME}', img_b64)
-
-        if invoice_data.get('paid', False) and paid_stamp_img.exists():
-            with open(paid_stamp_img, 'rb') as img_file:
-                stamp_b64 = f"data:image/png;base64,{base64.b64encode(img_file.read()).decode('utf-8')}"
-                rendered_html = rendered_html.replace(f'/static/{config.PAID_STAMP_FILENAME}', stamp_b64)
-
-    invoice_html_dir = config.BASE_DIR / config.INVOICE_HTML_DIR
-    invoice_html_dir.mkdir(exist_ok=True)
-
-    session_id = Path(invoice_data_path).stem.replace('_invoice_data', '')
-    batch_dir = Path(invoice_data_path).parent
-    source_fn_path = batch_dir / f"{session_id}_source_filename.txt"
-    if source_fn_path.exists():
-        try:
-            with open(source_fn_path, 'r', encoding='utf-8') as f:
-                source_filename = f.read().strip()
-            stem = Path(source_filename).stem
-            output_filename = f"{stem}_invoice.html"
-        except Exception:
-            output_filename = f"{session_id}_invoice.html"
+    cache_key = None
+    if render_cache.enabled():
+        cache_key = _render_key(invoice_data, template_name, embed_image, asset_dir)
+        cached = render_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    if asset_dir is not None:
+        asset_urls = invoice_asset_urls(asset_dir)
+    elif embed_image:
+        asset_urls = invoice_asset_urls()
     else:
-        output_filename = f"{session_id}_invoice.html"
-    output_file = invoice_html_dir / output_filename
+        asset_urls = {}
 
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(rendered_html)
+    invoice = invoice_data.get('invoice') or {}
+    item_pages = paginate_line_items(invoice.get('items'))
 
-    return str(output_file)
+    template = get_jinja_env().get_template(template_name)
+    rendered_html = template.render(data=invoice_data, asset_urls=asset_urls, item_pages=item_pages)
+    if cache_key is not None:
+        render_cache.put(cache_key, rendered_html)
+    return rendered_html
 
 
 # ---------------------------------------------------------------------------
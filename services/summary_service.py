@@ -1,5 +1,6 @@
 """Summary-sheet building, line-item charge helpers, and calculated field definitions."""
 
+import io
 import json
 import logging
 import math
@@ -10,6 +11,10 @@ from typing import Optional
 
 import pandas as pd
 
+import columnar_cache
+import session_manager
+from session_store import InvoiceState
+
 logger = logging.getLogger(__name__)
 
 # ---------------------------------------------------------------------------
@@ -33,7 +38,7 @@ def _parse_miles(miles_val) -> float:
 def ensure_line_item_charges(invoice_data: dict) -> None:
     """Fallback: fill EMPTY line-item charges from pricing config.
 
-    Only used when loading from pickle (e.g. download-all) where the UI
+    Only used when loading stored invoice data (e.g. download-all) where the UI
     may not have saved values yet.  Never overwrites non-empty values.
     """
     pricing = invoice_data.get("pricing") or {}
@@ -171,15 +176,16 @@ def try_build_summary_zip(
     the invoice HTML and a filled summary CSV.  Returns the ZIP path, or None."""
     template_path = os.path.join(temp_dir, "summary_template.csv")
     mapping_path = os.path.join(temp_dir, "summary_mapping.json")
-    source_csv_path = os.path.join(temp_dir, f"{session_id}_source.csv")
-
-    if not (os.path.isfile(template_path) and os.path.isfile(mapping_path) and os.path.isfile(source_csv_path)):
+    if not (os.path.isfile(template_path) and os.path.isfile(mapping_path)):
+        return None
+    source_csv_path = session_manager.ensure_source_csv(temp_dir, session_id)
+    if source_csv_path is None:
         return None
 
     with open(mapping_path, "r", encoding="utf-8") as f:
         mapping = json.load(f)
     summary_columns = list(pd.read_csv(template_path, nrows=0).columns)
-    source_df = pd.read_csv(source_csv_path)
+    source_df = columnar_cache.read_csv(source_csv_path)
 
     rows = build_summary_rows_from_line_items(invoice_data, source_df, summary_columns, mapping)
     if not rows:
@@ -207,49 +213,46 @@ def try_build_summary_zip(
 # Merged summary builder (preserves user edits across recalculations)
 # ---------------------------------------------------------------------------
 
+def summary_template_columns(content: bytes) -> list:
+    """Return the column headers of an uploaded summary template."""
+    return list(pd.read_csv(io.BytesIO(content), nrows=0).columns)
+
+
+def summary_csv_bytes(columns: list, rows: list) -> bytes:
+    """Serialise a summary sheet the way it is offered for download."""
+    return pd.DataFrame(rows, columns=columns).to_csv(index=False).encode("utf-8")
+
+
 def build_merged_summary(
-    temp_dir: str, session_id: str, invoice_data: dict,
+    session_dir: str, state: InvoiceState,
 ) -> Optional[tuple[list, list, list]]:
     """Build summary rows from the current invoice data, then overlay any cells
     that the user has previously manually edited and saved.
 
-    Uses per-invoice template and mapping: summary_template_{session_id}.csv,
-    summary_mapping_{session_id}.json.
+    Uses the invoice's own template and mapping from *state*; the source CSV
+    is read from *session_dir*.
 
     Returns (columns, rows, edited_cells) or None when no template/mapping.
     """
-    template_path = os.path.join(temp_dir, f"summary_template_{session_id}.csv")
-    mapping_path = os.path.join(temp_dir, f"summary_mapping_{session_id}.json")
-    source_csv_path = os.path.join(temp_dir, f"{session_id}_source.csv")
-
-    if not os.path.isfile(template_path) or not os.path.isfile(mapping_path):
+    if state.summary_template is None or state.summary_mapping is None:
         return None
 
-    with open(mapping_path, "r", encoding="utf-8") as f:
-        mapping = json.load(f)
-    template_df = pd.read_csv(template_path)
-    summary_columns = list(template_df.columns)
-    source_df = pd.read_csv(source_csv_path) if os.path.isfile(source_csv_path) else pd.DataFrame()
+    summary_columns = summary_template_columns(state.summary_template)
+    source_csv_path = session_manager.ensure_source_csv(session_dir, state.invoice_id)
+    source_df = columnar_cache.read_csv(source_csv_path) if source_csv_path else pd.DataFrame()
 
+    invoice_data = state.invoice_data
     ensure_line_item_charges(invoice_data)
     fresh_rows = build_summary_rows_from_line_items(
-        invoice_data, source_df, summary_columns, mapping
+        invoice_data, source_df, summary_columns, state.summary_mapping
     )
 
-    saved_csv_path = os.path.join(temp_dir, f"summary_single_{session_id}.csv")
-    edits_mask_path = os.path.join(temp_dir, f"summary_edits_{session_id}.json")
     edited_cells: list = []
-
-    if os.path.isfile(saved_csv_path) and os.path.isfile(edits_mask_path):
+    if state.summary_rows is not None and state.edited_cells is not None:
         try:
-            saved_df = pd.read_csv(saved_csv_path, dtype=str).fillna("")
-            saved_rows = saved_df.values.tolist()
-            with open(edits_mask_path, "r", encoding="utf-8") as f:
-                mask_data = json.load(f)
-            saved_edits = mask_data.get("edited_cells", [])
-
+            saved_rows = state.summary_rows
             surviving_edits = []
-            for rc in saved_edits:
+            for rc in state.edited_cells:
                 r, c = rc[0], rc[1]
                 if r < len(fresh_rows) and r < len(saved_rows) and c < len(summary_columns):
                     fresh_rows[r][c] = saved_rows[r][c]
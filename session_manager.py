@@ -8,103 +8,424 @@ in directories named with a prefix that encodes the session type and ID, e.g.
     temp/batch_<hex>_<suffix>/
     temp/html_<hex>_<suffix>/
 
-The lookup helpers here replace the ``os.walk`` + string-match pattern that was
-previously duplicated 12+ times across route handlers.
+Lookups go through :mod:`session_registry`, an index shared by all workers,
+and match session IDs exactly rather than by substring.
+
+Each session directory also carries a ``manifest.json`` describing the
+artefacts written into it (role, row count, size, content hash), so routes
+can list and select files without scanning the directory.
+
+Sessions built by the upload-to-invoices pipeline defer their intermediate
+CSVs: the manifest notes what would have been written, and the files are
+produced on first use (see "Deferred artefacts" below).
+
+Per-invoice state (invoice data, summary template/mapping/edits) lives in the
+backend returned by :func:`get_store` — see :mod:`session_store`.
 """
 
+import json
 import os
-import pickle
+import shutil
 import tempfile
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Optional
 
+import blob_store
+import columnar_cache
 import config
+import divider
+import session_registry
+import session_store
+from blob_store import file_sha256
+from session_store import INVOICE_DATA_SUFFIX, InvoiceState, migrate_legacy_invoices
+
+MANIFEST_FILENAME = "manifest.json"
+
+_store: Optional[session_store.SessionStore] = None
+
+
+def get_store() -> session_store.SessionStore:
+    """Return the invoice-state backend selected by ``config.SESSION_STORE_BACKEND``."""
+    global _store
+    if _store is None:
+        try:
+            backend = session_store.BACKENDS[config.SESSION_STORE_BACKEND]
+        except KeyError:
+            raise ValueError(f"Unknown SESSION_STORE_BACKEND {config.SESSION_STORE_BACKEND!r}") from None
+        _store = backend()
+    return _store
 
 
 # ---------------------------------------------------------------------------
 # Session creation
 # ---------------------------------------------------------------------------
 
-def create_session_dir(prefix: str) -> tuple[str, str]:
-    """Create a new session directory and return ``(session_id, dir_path)``."""
+def create_session_dir(prefix: str, owner: Optional[str] = None) -> tuple[str, str]:
+    """Create a new session directory and return ``(session_id, dir_path)``.
+
+    *owner* (the authenticated user) is recorded for per-user disk quotas.
+    """
     session_id = os.urandom(16).hex()
     dir_path = tempfile.mkdtemp(dir=config.TEMP_DIR, prefix=f"{prefix}{session_id}_")
+    session_registry.register_session(session_id, prefix.rstrip("_"), dir_path, owner)
     return session_id, dir_path
 
 
+def source_csv_path(session_dir: str, invoice_session_id: str) -> str:
+    """Return the path of the CSV an invoice was built from (kept on disk for every backend)."""
+    return os.path.join(session_dir, f"{invoice_session_id}_source.csv")
+
+
+def create_invoice(
+    session_dir: str, data: dict, invoice_session_id: Optional[str] = None,
+    source_filename: Optional[str] = None,
+) -> str:
+    """Persist a new invoice into *session_dir* and index it; return its ID."""
+    if invoice_session_id is None:
+        invoice_session_id = os.urandom(16).hex()
+    get_store().save_invoice(session_dir, invoice_session_id, data, source_filename)
+    parsed = session_registry.parse_session_dir(os.path.basename(os.path.normpath(session_dir)))
+    if parsed is not None:
+        session_registry.register_invoice(invoice_session_id, parsed[1])
+    return invoice_session_id
+
+
+def rebuild_registry() -> dict:
+    """Re-index every session directory on disk (run once at startup).
+
+    Invoices saved in the pre-:mod:`invoice_codec` pickle format are moved
+    into the store first.  Stored state whose session directory has gone is
+    dropped from the store.
+    """
+    store = get_store()
+    migrate_legacy_invoices(store)
+    stored = store.list_invoices()
+    stats = session_registry.rebuild(INVOICE_DATA_SUFFIX, stored)
+    live = {s["session_id"] for s in session_registry.list_sessions()}
+    for session_id in {sid for _iid, sid in stored} - live:
+        store.delete_session(session_id)
+    return stats
+
+
+class SessionLeaseMiddleware:
+    """ASGI middleware that keeps the sessions a request touches safe from the reaper.
+
+    Every lookup or creation made while serving the request takes a lease in
+    the registry; the leases are released once the response has been sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with session_registry.lease_scope():
+            await self.app(scope, receive, send)
+
+
 # ---------------------------------------------------------------------------
 # Directory lookups
 # ---------------------------------------------------------------------------
 
 def find_conversion_dir(session_id: str) -> Optional[str]:
     """Return the path of the ``convert_<session_id>*`` directory, or *None*."""
-    needle = f"convert_{session_id}"
-    for root, dirs, _files in os.walk(config.TEMP_DIR):
-        for d in dirs:
-            if needle in d:
-                return os.path.join(root, d)
-    return None
+    return session_registry.lookup_session(session_id, "convert")
 
 
 def find_batch_dir(batch_session_id: str) -> Optional[str]:
     """Return the path of the ``batch_<id>*`` directory, or *None*."""
-    needle = f"batch_{batch_session_id}"
-    for root, _dirs, _files in os.walk(config.TEMP_DIR):
-        if needle in root:
-            return root
-    return None
+    return session_registry.lookup_session(batch_session_id, "batch")
+
+
+# ---------------------------------------------------------------------------
+# Invoice lookups
+# ---------------------------------------------------------------------------
+
+def find_invoice_dir(invoice_session_id: str) -> Optional[str]:
+    """Return the session directory holding *invoice_session_id*, or *None*."""
+    found = session_registry.lookup_invoice(invoice_session_id)
+    return found[1] if found is not None else None
+
+
+def load_invoice_state(invoice_session_id: str) -> tuple[Optional[str], Optional[InvoiceState]]:
+    """Return ``(session_dir, state)`` for an invoice, or ``(None, None)``."""
+    session_dir = find_invoice_dir(invoice_session_id)
+    if session_dir is None:
+        return None, None
+    state = get_store().load_state(session_dir, invoice_session_id)
+    if state is None:
+        return None, None
+    return session_dir, state
+
+
+def load_batch_state(batch_session_id: str) -> tuple[Optional[str], list[InvoiceState]]:
+    """Return ``(batch_dir, [state, ...])`` for every invoice in a batch, in creation order."""
+    batch_dir = find_batch_dir(batch_session_id)
+    if batch_dir is None:
+        return None, []
+    return batch_dir, get_store().load_batch(batch_dir, batch_session_id)
 
 
 # ---------------------------------------------------------------------------
-# Invoice-data (pickle) lookups
+# Artefact manifest
 # ---------------------------------------------------------------------------
 
-def find_invoice_data_path(session_id: str) -> Optional[str]:
-    """Return the full path to ``<session_id>_invoice_data.pkl``, or *None*."""
-    target = f"{session_id}_invoice_data.pkl"
-    for root, _dirs, files in os.walk(config.TEMP_DIR):
-        if target in files:
-            return os.path.join(root, target)
+# Roles recorded for files in a conversion session.  ``upload`` is the file
+# the user sent; everything else is a CSV derived from it.
+ROLE_UPLOAD = "upload"
+ROLE_SHEET = "sheet"
+ROLE_SPLIT = "split"
+ROLE_MERGED = "merged"
+ROLE_COMBINED = "combined"
+DERIVED_ROLES = (ROLE_SHEET, ROLE_SPLIT, ROLE_MERGED, ROLE_COMBINED)
+
+# Sub-directory a derived CSV lives in -> its role, for legacy backfill.
+_LEGACY_SUBDIR_ROLES = {"split_csvs": ROLE_SPLIT, "merged": ROLE_MERGED, "combined": ROLE_COMBINED}
+
+
+def _manifest_path(session_dir: str) -> str:
+    return os.path.join(session_dir, MANIFEST_FILENAME)
+
+
+def _write_manifest(session_dir: str, manifest: dict) -> None:
+    """Atomically replace the manifest of *session_dir*."""
+    fd, tmp_path = tempfile.mkstemp(dir=session_dir, prefix=".manifest_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp_path, _manifest_path(session_dir))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _backfill_manifest(session_dir: str) -> dict:
+    """Describe a session written before manifests existed, by scanning it once."""
+    artifacts = {}
+    for root, _dirs, files in os.walk(session_dir):
+        rel_root = os.path.relpath(root, session_dir)
+        for name in files:
+            if name == MANIFEST_FILENAME or name.startswith("."):
+                continue
+            if rel_root == ".":
+                role = ROLE_UPLOAD
+            elif name.endswith(".csv"):
+                role = _LEGACY_SUBDIR_ROLES.get(rel_root.split(os.sep)[0], ROLE_SHEET)
+            else:
+                continue
+            path = os.path.join(root, name)
+            rel_path = Path(os.path.relpath(path, session_dir)).as_posix()
+            artifacts[rel_path] = {
+                "path": rel_path,
+                "name": name,
+                "role": role,
+                "rows": None,
+                "bytes": os.path.getsize(path),
+                "sha256": file_sha256(path),
+            }
+    return {"version": 1, "artifacts": artifacts}
+
+
+def load_manifest(session_dir: str) -> dict:
+    """Return the manifest of *session_dir*, backfilling it for legacy sessions."""
+    try:
+        with open(_manifest_path(session_dir), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        manifest = _backfill_manifest(session_dir)
+        _write_manifest(session_dir, manifest)
+        return manifest
+
+
+def _read_manifest(session_dir: str) -> dict:
+    """Return the manifest of *session_dir* as written so far (empty if none)."""
+    try:
+        with open(_manifest_path(session_dir), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"version": 1, "artifacts": {}}
+
+
+def record_artifacts(session_dir: str, entries: Iterable[tuple]) -> list[dict]:
+    """Add ``(path, role, rows)`` entries to the manifest of *session_dir*.
+
+    Size and content hash are taken from the file as just written; an entry
+    may carry a fourth element with an already-known SHA-256 to skip hashing.
+    Each file is also shared through :mod:`blob_store`, and derived CSVs are
+    queued for a :mod:`columnar_cache` sidecar.  Returns the new manifest
+    entries in the order given.
+    """
+    manifest = _read_manifest(session_dir)
+    recorded = []
+    derived = []
+    for path, role, rows, *known_sha256 in entries:
+        rel_path = Path(os.path.relpath(path, session_dir)).as_posix()
+        entry = {
+            "path": rel_path,
+            "name": os.path.basename(path),
+            "role": role,
+            "rows": rows,
+            "bytes": os.path.getsize(path),
+            "sha256": blob_store.adopt(path, known_sha256[0] if known_sha256 else None),
+        }
+        manifest["artifacts"][rel_path] = entry
+        recorded.append(entry)
+        if role in DERIVED_ROLES and path.endswith(".csv"):
+            derived.append(path)
+    _write_manifest(session_dir, manifest)
+    columnar_cache.build_later(derived)
+    return recorded
+
+
+def record_artifact(session_dir: str, path: str, role: str, rows: Optional[int] = None) -> dict:
+    """Add a single artefact to the manifest of *session_dir* and return its entry."""
+    return record_artifacts(session_dir, [(path, role, rows)])[0]
+
+
+def list_artifacts(session_dir: str, roles: Optional[Iterable[str]] = None, suffix: str = ".csv") -> list[dict]:
+    """Return manifest entries of *session_dir* (optionally filtered by role) in write order.
+
+    Deferred split CSVs are written first if derived files are asked for.
+    """
+    manifest = load_manifest(session_dir)
+    wanted = set(roles) if roles is not None else None
+    if DEFERRED_SPLIT_KEY in manifest and (wanted is None or wanted & set(DERIVED_ROLES)):
+        manifest = materialize_split(session_dir)
+    return [
+        a for a in manifest["artifacts"].values()
+        if (wanted is None or a["role"] in wanted) and a["name"].endswith(suffix)
+    ]
+
+
+def find_artifact(session_dir: str, name: str) -> Optional[dict]:
+    """Return the first manifest entry whose file name is *name*, or *None*.
+
+    Deferred split CSVs are written first if *name* is not there yet.
+    """
+    manifest = load_manifest(session_dir)
+    for attempt in range(2):
+        for artifact in manifest["artifacts"].values():
+            if artifact["name"] == name:
+                return artifact
+        if attempt or DEFERRED_SPLIT_KEY not in manifest:
+            break
+        manifest = materialize_split(session_dir)
     return None
 
 
-def find_invoice_data_with_dir(session_id: str) -> tuple[Optional[str], Optional[str]]:
-    """Return ``(invoice_data_path, containing_dir)`` or ``(None, None)``."""
-    target = f"{session_id}_invoice_data.pkl"
-    for root, _dirs, files in os.walk(config.TEMP_DIR):
-        if target in files:
-            return os.path.join(root, target), root
-    return None, None
+def artifact_path(session_dir: str, artifact: dict) -> str:
+    """Return the absolute path of a manifest entry."""
+    return os.path.join(session_dir, *artifact["path"].split("/"))
 
 
-def find_batch_invoice_files(batch_session_id: str) -> tuple[Optional[str], list[str]]:
-    """Return ``(batch_dir, [pkl_paths...])`` for every invoice pkl in the batch."""
-    needle = f"batch_{batch_session_id}"
-    for root, _dirs, files in os.walk(config.TEMP_DIR):
-        if needle in root:
-            pkls = [
-                os.path.join(root, f)
-                for f in files
-                if f.endswith("_invoice_data.pkl")
-            ]
-            return root, pkls
-    return None, []
+# ---------------------------------------------------------------------------
+# Deferred artefacts
+# ---------------------------------------------------------------------------
+#
+# The upload-to-invoices pipeline builds every invoice from the upload in
+# memory.  Instead of the split CSVs (conversion session) and per-invoice
+# source CSVs (batch session) the three-step flow writes, it records in each
+# manifest what they would be; they are written the first time something
+# lists, downloads or reads them, byte-for-byte as the three steps would have.
+
+# Manifest keys: upload still to be split / invoice ID -> split CSV it came from
+DEFERRED_SPLIT_KEY = "deferred_split"
+DEFERRED_SOURCES_KEY = "deferred_sources"
+
+SPLIT_DIRNAME = "split_csvs"
+
+
+def defer_split(session_dir: str, upload_path: str) -> None:
+    """Note that *upload_path* is to be split by budget code on first use."""
+    manifest = _read_manifest(session_dir)
+    manifest[DEFERRED_SPLIT_KEY] = Path(os.path.relpath(upload_path, session_dir)).as_posix()
+    _write_manifest(session_dir, manifest)
+
+
+def materialize_split(session_dir: str) -> dict:
+    """Write and record the deferred split CSVs of *session_dir*; return its manifest.
+
+    Concurrent callers each split into a private directory and the first to
+    rename it into place wins; the files are the same either way.
+    """
+    manifest = load_manifest(session_dir)
+    upload = manifest.get(DEFERRED_SPLIT_KEY)
+    if upload is None:
+        return manifest
+
+    output_dir = os.path.join(session_dir, SPLIT_DIRNAME)
+    work_dir = tempfile.mkdtemp(dir=session_dir, prefix=".split_")
+    try:
+        written = divider.split_csv_by_budget_code(os.path.join(session_dir, *upload.split("/")), work_dir)
+        try:
+            os.rename(work_dir, output_dir)
+        except OSError:
+            if not os.path.isdir(output_dir):
+                raise
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    record_artifacts(session_dir, [
+        (os.path.join(output_dir, os.path.basename(path)), ROLE_SPLIT, rows) for path, rows in written
+    ])
+    manifest = _read_manifest(session_dir)
+    if manifest.pop(DEFERRED_SPLIT_KEY, None) is not None:
+        _write_manifest(session_dir, manifest)
+    return manifest
+
+
+def defer_source_csvs(session_dir: str, sources: dict) -> None:
+    """Record where the source CSVs of invoices in *session_dir* will come from.
+
+    *sources* maps invoice ID -> ``(conversion_session_id, split_filename)``.
+    """
+    manifest = _read_manifest(session_dir)
+    deferred = manifest.setdefault(DEFERRED_SOURCES_KEY, {})
+    for invoice_session_id, (conversion_session_id, name) in sources.items():
+        deferred[invoice_session_id] = {"session_id": conversion_session_id, "name": name}
+    _write_manifest(session_dir, manifest)
+
+
+def ensure_source_csv(session_dir: str, invoice_session_id: str) -> Optional[str]:
+    """Return the path of an invoice's source CSV, writing it if it was deferred.
+
+    *None* if the invoice has none (or its conversion session has gone).
+    """
+    path = source_csv_path(session_dir, invoice_session_id)
+    if os.path.isfile(path):
+        return path
+    deferred = _read_manifest(session_dir).get(DEFERRED_SOURCES_KEY, {}).get(invoice_session_id)
+    if deferred is None:
+        return None
+    conversion_dir = find_conversion_dir(deferred["session_id"])
+    artifact = find_artifact(conversion_dir, deferred["name"]) if conversion_dir else None
+    if artifact is None:
+        return None
+    split_path = artifact_path(conversion_dir, artifact)
+    blob_store.ingest_file(split_path, path, artifact["sha256"])
+    columnar_cache.copy_sidecar(split_path, path)
+    return path
 
 
 # ---------------------------------------------------------------------------
-# Pickle convenience wrappers
+# Invoice-data convenience wrappers
 # ---------------------------------------------------------------------------
 
 def load_invoice_data(session_id: str) -> dict:
     """Load and return the invoice-data dict for *session_id*."""
-    path = find_invoice_data_path(session_id)
-    if path is None:
+    session_dir = find_invoice_dir(session_id)
+    data = get_store().load_invoice(session_dir, session_id) if session_dir else None
+    if data is None:
         raise FileNotFoundError(f"No invoice data found for session {session_id}")
-    with open(path, "rb") as f:
-        return pickle.load(f)
+    return data
 
 
-def save_invoice_data(path: str, data: dict) -> None:
-    """Persist *data* to the given pickle *path*."""
-    with open(path, "wb") as f:
-        pickle.dump(data, f)
+def save_invoice_data(session_id: str, data: dict) -> None:
+    """Replace the invoice-data dict of an existing invoice."""
+    session_dir = find_invoice_dir(session_id)
+    if session_dir is None:
+        raise FileNotFoundError(f"No invoice data found for session {session_id}")
+    get_store().save_invoice(session_dir, session_id, data)
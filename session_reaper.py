@@ -0,0 +1,344 @@
+"""
+Background reaper for ``config.TEMP_DIR`` and the ``invoice html`` output directory.
+
+Sessions are removed when any of these hold, oldest access first:
+
+* nobody has touched them for ``config.SESSION_TTL`` seconds;
+* their owner uses more than ``config.USER_QUOTA_BYTES``;
+* everything together — sessions, ``blob_store`` and ``render_cache`` — uses
+  more than ``config.GLOBAL_QUOTA_BYTES`` (the render cache gives way first).
+
+A session's size counts only the bytes no other session links to, which is
+what removing it frees; bytes it shares through ``blob_store`` are reported
+separately.  A session holding a lease (see ``session_registry``) is never
+removed — each removal is claimed atomically against the lease table before
+anything is deleted.  Blobs that no session links to any more are collected
+on the same pass, and ``render_cache`` is trimmed to its size limit.  The
+sweep runs in a worker thread every ``config.REAPER_INTERVAL`` seconds,
+started from the app lifespan; only one worker sweeps at a time.
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import time
+from typing import Optional
+
+import blob_store
+import config
+import render_cache
+import session_manager
+import session_registry
+
+logger = logging.getLogger(__name__)
+
+_LOCK_KEY = "reaper.lock"
+_TOTALS_PREFIX = "reaper.total."
+_LAST_PREFIX = "reaper.last."
+_USAGE_PREFIX = "reaper.usage."
+
+_REASONS = ("expired", "user_quota", "global_quota", "stray", "invoice_html", "blobs", "render_cache")
+
+
+# ---------------------------------------------------------------------------
+# Disk helpers
+# ---------------------------------------------------------------------------
+
+def _dir_usage(path: str, blobs: dict, inodes: Optional[dict] = None) -> tuple[int, int, list]:
+    """Return ``(own, shared, files)`` for the files under *path*.
+
+    A file is the directory's own when nothing but its blob (see
+    :func:`blob_store.blob_inodes`) links to it besides the directory:
+    removing the directory frees it, the blob on a later collection.
+    Shared files stay on disk for the other holders.  *files* lists each
+    file's ``(st_dev, st_ino)``, and *inodes* collects
+    ``{(st_dev, st_ino): [size, holders]}`` across calls.
+    """
+    own = shared = 0
+    files_seen = []
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                st = os.lstat(os.path.join(root, name))
+            except OSError:
+                continue
+            inode = (st.st_dev, st.st_ino)
+            holders = st.st_nlink - (inode in blobs)
+            if holders <= 1:
+                own += st.st_size
+            else:
+                shared += st.st_size
+            files_seen.append(inode)
+            if inodes is not None:
+                inodes[inode] = [st.st_size, holders]
+    return own, shared, files_seen
+
+
+def _remove(path: str) -> None:
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+# ---------------------------------------------------------------------------
+# Sweep
+# ---------------------------------------------------------------------------
+
+def sweep(now: Optional[float] = None) -> dict:
+    """Run one reaper pass and return what it reclaimed.
+
+    Returns ``{"skipped": True}`` when another worker is already sweeping.
+    """
+    now = now or time.time()
+    if not session_registry.try_claim_stat_lock(_LOCK_KEY, max(config.REAPER_INTERVAL, 60), now):
+        return {"skipped": True}
+    try:
+        return _sweep(now)
+    finally:
+        session_registry.set_stats({_LOCK_KEY: 0})
+
+
+def _sweep(now: float) -> dict:
+    started = time.perf_counter()
+    removed = {reason: 0 for reason in _REASONS}
+    reclaimed = {reason: 0 for reason in _REASONS}
+    skipped_in_use: set[str] = set()
+
+    session_registry.purge_expired_leases(now)
+    sessions = session_registry.list_sessions()
+
+    # Measured on every pass: whether a file is shared changes when another
+    # session links to or drops the same blob, not only when this one is used.
+    blobs = blob_store.blob_inodes()
+    inodes: dict[tuple[int, int], list[int]] = {}
+    for s in sessions:
+        s["bytes"], _shared, s["files"] = _dir_usage(s["path"], blobs, inodes)
+        session_registry.set_session_size(s["session_id"], s["bytes"], now)
+    in_use = session_registry.leased_sessions(now)
+    cache_bytes = render_cache.size()
+    disk_bytes = sum(blobs.values()) + sum(size for inode, (size, _h) in inodes.items() if inode not in blobs)
+    usage = {
+        "disk_bytes": disk_bytes + cache_bytes,
+        "shared_bytes": sum(size for size, holders in inodes.values() if holders > 1),
+        "blob_bytes": sum(blobs.values()),
+        "render_cache_bytes": cache_bytes,
+    }
+
+    def evict(s: dict, reason: str) -> int:
+        """Remove session *s*; return the bytes that frees, or -1 if it is in use.
+
+        A file shared with other sessions is only freed with its last holder.
+        """
+        if s["session_id"] in in_use:
+            skipped_in_use.add(s["session_id"])
+            return -1
+        path = session_registry.claim_for_removal(s["session_id"], now)
+        if path is None:
+            skipped_in_use.add(s["session_id"])
+            return -1
+        _remove(path)
+        session_manager.get_store().delete_session(s["session_id"])
+        freed = 0
+        for inode in s["files"]:
+            entry = inodes[inode]
+            entry[1] -= 1
+            if entry[1] == 0:
+                freed += entry[0]
+        removed[reason] += 1
+        reclaimed[reason] += freed
+        return freed
+
+    live = []
+    for s in sessions:
+        expired = config.SESSION_TTL and now - s["last_access"] > config.SESSION_TTL
+        if not (expired and evict(s, "expired") >= 0):
+            live.append(s)
+
+    if config.USER_QUOTA_BYTES:
+        by_owner: dict[str, list[dict]] = {}
+        for s in live:
+            if s["owner"]:
+                by_owner.setdefault(s["owner"], []).append(s)
+        for owned in by_owner.values():
+            used = sum(s["bytes"] or 0 for s in owned)
+            for s in owned:
+                if used <= config.USER_QUOTA_BYTES:
+                    break
+                freed = evict(s, "user_quota")
+                if freed >= 0:
+                    used -= freed
+                    s["removed"] = True
+        live = [s for s in live if not s.get("removed")]
+
+    if config.GLOBAL_QUOTA_BYTES:
+        used = usage["disk_bytes"] - sum(reclaimed.values())
+        if used > config.GLOBAL_QUOTA_BYTES and cache_bytes:
+            count, size = render_cache.trim(max(cache_bytes - (used - config.GLOBAL_QUOTA_BYTES), 0))
+            removed["render_cache"] += count
+            reclaimed["render_cache"] += size
+            used -= size
+        for s in live:
+            if used <= config.GLOBAL_QUOTA_BYTES:
+                break
+            used -= max(evict(s, "global_quota"), 0)
+
+    _sweep_strays(now, {s["path"] for s in sessions}, blobs, removed, reclaimed)
+    _sweep_incoming(now, removed, reclaimed)
+    _sweep_invoice_html(now, removed, reclaimed)
+    removed["blobs"], reclaimed["blobs"] = blob_store.collect_garbage(now)
+    count, size = render_cache.trim()
+    removed["render_cache"] += count
+    reclaimed["render_cache"] += size
+
+    result = {
+        "removed": removed,
+        "bytes_reclaimed": reclaimed,
+        "skipped_in_use": len(skipped_in_use),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    totals = {f"{_TOTALS_PREFIX}runs": 1, f"{_TOTALS_PREFIX}skipped_in_use": len(skipped_in_use)}
+    for reason in _REASONS:
+        totals[f"{_TOTALS_PREFIX}removed.{reason}"] = removed[reason]
+        totals[f"{_TOTALS_PREFIX}bytes.{reason}"] = reclaimed[reason]
+    session_registry.increment_stats(totals)
+    session_registry.set_stats({
+        f"{_LAST_PREFIX}finished_at": time.time(),
+        f"{_LAST_PREFIX}seconds": result["seconds"],
+        f"{_LAST_PREFIX}removed": sum(removed.values()),
+        f"{_LAST_PREFIX}bytes_reclaimed": sum(reclaimed.values()),
+        **{f"{_USAGE_PREFIX}{key}": value for key, value in usage.items()},
+    })
+
+    if any(removed.values()):
+        logger.info(
+            "Reaper removed %d item(s), reclaimed %d bytes in %ss (%d in use skipped)",
+            sum(removed.values()), sum(reclaimed.values()), result["seconds"], len(skipped_in_use),
+        )
+    return result
+
+
+def _sweep_strays(now: float, registered_paths: set[str], blobs: dict, removed: dict, reclaimed: dict) -> None:
+    """Remove old unregistered session dirs and ``mkdtemp`` leftovers (e.g. ZIP staging)."""
+    if not config.SESSION_TTL or not os.path.isdir(config.TEMP_DIR):
+        return
+    with os.scandir(config.TEMP_DIR) as entries:
+        for entry in entries:
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            is_session = session_registry.parse_session_dir(entry.name) is not None
+            if not (entry.name.startswith("tmp") or is_session):
+                continue
+            path = os.path.abspath(entry.path)
+            if path in registered_paths:
+                continue
+            try:
+                if now - entry.stat().st_mtime <= config.SESSION_TTL:
+                    continue
+            except OSError:
+                continue
+            session_id = session_registry.parse_session_dir(entry.name)[1] if is_session else None
+            if session_id and session_registry.lookup_session(session_id):
+                continue  # registered by another worker since we listed
+            size = _dir_usage(path, blobs)[0]
+            _remove(path)
+            if session_id:
+                session_manager.get_store().delete_session(session_id)
+            removed["stray"] += 1
+            reclaimed["stray"] += size
+
+
+def _sweep_incoming(now: float, removed: dict, reclaimed: dict) -> None:
+    """Remove staged uploads a crashed request left in ``config.UPLOAD_STAGING_DIR``."""
+    if not config.SESSION_TTL or not os.path.isdir(config.UPLOAD_STAGING_DIR):
+        return
+    with os.scandir(config.UPLOAD_STAGING_DIR) as entries:
+        for entry in entries:
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if not entry.is_file(follow_symlinks=False) or now - st.st_mtime <= config.SESSION_TTL:
+                continue
+            _remove(entry.path)
+            removed["stray"] += 1
+            reclaimed["stray"] += st.st_size
+
+
+def _sweep_invoice_html(now: float, removed: dict, reclaimed: dict) -> None:
+    """Expire rendered files from the shared ``invoice html`` directory by age."""
+    html_dir = config.BASE_DIR / config.INVOICE_HTML_DIR
+    if not config.INVOICE_HTML_TTL or not html_dir.is_dir():
+        return
+    with os.scandir(html_dir) as entries:
+        for entry in entries:
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if not entry.is_file(follow_symlinks=False) or now - st.st_mtime <= config.INVOICE_HTML_TTL:
+                continue
+            _remove(entry.path)
+            removed["invoice_html"] += 1
+            reclaimed["invoice_html"] += st.st_size
+
+
+# ---------------------------------------------------------------------------
+# Statistics
+# ---------------------------------------------------------------------------
+
+def get_stats(owner: Optional[str] = None) -> dict:
+    """Return cumulative reclaim counters, the last run and current usage.
+
+    Session bytes are each session's own; shared, blob and render-cache
+    bytes are as measured by the last sweep.  Per-user usage is only given
+    for *owner* (the caller), never for other users.
+    """
+    totals = session_registry.get_stats(_TOTALS_PREFIX)
+    sessions = session_registry.list_sessions()
+    owned = [s for s in sessions if owner is not None and s["owner"] == owner]
+    return {
+        "totals": {
+            "runs": int(totals.get("runs", 0)),
+            "skipped_in_use": int(totals.get("skipped_in_use", 0)),
+            "removed": {r: int(totals.get(f"removed.{r}", 0)) for r in _REASONS},
+            "bytes_reclaimed": {r: int(totals.get(f"bytes.{r}", 0)) for r in _REASONS},
+        },
+        "last_run": session_registry.get_stats(_LAST_PREFIX),
+        "usage": {
+            "sessions": len(sessions),
+            "bytes": sum(s["bytes"] or 0 for s in sessions),
+            "own_sessions": len(owned),
+            "own_bytes": sum(s["bytes"] or 0 for s in owned),
+            **{k: int(v) for k, v in session_registry.get_stats(_USAGE_PREFIX).items()},
+        },
+        "limits": {
+            "session_ttl": config.SESSION_TTL,
+            "user_quota_bytes": config.USER_QUOTA_BYTES,
+            "global_quota_bytes": config.GLOBAL_QUOTA_BYTES,
+        },
+    }
+
+
+# ---------------------------------------------------------------------------
+# Background task
+# ---------------------------------------------------------------------------
+
+async def _run_forever() -> None:
+    while True:
+        await asyncio.sleep(config.REAPER_INTERVAL)
+        try:
+            await asyncio.to_thread(sweep)
+        except Exception:
+            logger.exception("Reaper sweep failed")
+
+
+def start() -> Optional[asyncio.Task]:
+    """Start the periodic sweep on the running event loop (no-op when disabled)."""
+    if not config.REAPER_ENABLED:
+        return None
+    return asyncio.create_task(_run_forever(), name="session-reaper")
@@ -0,0 +1,445 @@
+"""
+SQLite-backed index of temp-directory sessions and the invoices they hold.
+
+``session_manager`` used to answer every lookup by walking ``config.TEMP_DIR``
+and substring-matching directory names.  This module keeps an on-disk index
+instead, so lookups are a primary-key query:
+
+    sessions  — session_id -> (kind, directory path, owner, last access, size)
+    invoices  — invoice_id -> owning session_id, creation sequence
+    leases    — sessions an in-flight request or job is using right now
+    stats     — cumulative counters (e.g. what the reaper has reclaimed)
+
+The database lives next to the sessions it describes and runs in WAL mode, so
+every uvicorn worker process shares one index.  Apart from owners and
+counters it only holds derived data: :func:`rebuild` reconstructs it from the
+directory layout, which is what the app lifespan does at startup.
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterable, Iterator, Optional
+
+import config
+import db
+from db import transaction as _transaction
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 3  # 3: invoices ordered by an explicit creation sequence
+
+# Session directory names look like ``<kind>_<32 hex id>_<mkdtemp suffix>``.
+SESSION_DIR_RE = re.compile(r"^(convert|batch|html)_([0-9a-f]{32})_")
+
+# Invoice files are named ``<32 hex invoice id>_…``.
+_INVOICE_FILE_RE = re.compile(r"^([0-9a-f]{32})_")
+
+# Lookups refresh ``last_access`` at most this often, to keep reads cheap.
+_TOUCH_INTERVAL = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id   TEXT PRIMARY KEY,
+    kind         TEXT NOT NULL,
+    path         TEXT NOT NULL,
+    owner        TEXT,
+    created_at   REAL NOT NULL,
+    last_access  REAL NOT NULL,
+    bytes        INTEGER,
+    measured_at  REAL
+);
+CREATE INDEX IF NOT EXISTS sessions_by_access ON sessions (last_access);
+CREATE TABLE IF NOT EXISTS invoices (
+    invoice_id  TEXT PRIMARY KEY,
+    session_id  TEXT NOT NULL,
+    seq         INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS invoices_by_session ON invoices (session_id, seq);
+CREATE TABLE IF NOT EXISTS leases (
+    lease_id    INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id  TEXT NOT NULL,
+    pid         INTEGER NOT NULL,
+    expires_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS leases_by_session ON leases (session_id);
+CREATE TABLE IF NOT EXISTS stats (
+    key    TEXT PRIMARY KEY,
+    value  REAL NOT NULL
+);
+"""
+
+# Upgrades from each older schema version to the next, applied in place so
+# owners, sizes and reaper totals survive (see db.connect).
+_MIGRATIONS = {
+    1: """
+ALTER TABLE sessions ADD COLUMN owner TEXT;
+ALTER TABLE sessions ADD COLUMN last_access REAL NOT NULL DEFAULT 0;
+UPDATE sessions SET last_access = created_at;
+ALTER TABLE sessions ADD COLUMN bytes INTEGER;
+ALTER TABLE sessions ADD COLUMN measured_at REAL
+""",
+    # rowid is the order invoices were registered in, which version 2 listed them by
+    2: """
+ALTER TABLE invoices ADD COLUMN seq INTEGER NOT NULL DEFAULT 0;
+UPDATE invoices SET seq = rowid;
+DROP INDEX IF EXISTS invoices_by_session
+""",
+}
+
+# Lease IDs taken while serving the current request; see :func:`lease_scope`.
+_request_leases: ContextVar[Optional[list]] = ContextVar("session_request_leases", default=None)
+
+
+# ---------------------------------------------------------------------------
+# Connection handling
+# ---------------------------------------------------------------------------
+
+def registry_path() -> str:
+    """Return the path of the registry database file."""
+    return config.SESSION_REGISTRY_PATH or os.path.join(config.TEMP_DIR, "session_registry.sqlite3")
+
+
+def _connect() -> sqlite3.Connection:
+    return db.connect(registry_path(), _SCHEMA, SCHEMA_VERSION, reset_on_mismatch=True, migrations=_MIGRATIONS)
+
+
+def parse_session_dir(name: str) -> Optional[tuple[str, str]]:
+    """Return ``(kind, session_id)`` for a session directory name, or *None*."""
+    match = SESSION_DIR_RE.match(name)
+    if not match:
+        return None
+    return match.group(1), match.group(2)
+
+
+# ---------------------------------------------------------------------------
+# Leases — protect sessions that are in use from the reaper
+# ---------------------------------------------------------------------------
+
+@contextmanager
+def lease_scope() -> Iterator[None]:
+    """Collect the leases taken by lookups inside the block and release them on exit.
+
+    Wrapped around every HTTP request by ``session_manager.SessionLeaseMiddleware``.
+    """
+    token = _request_leases.set([])
+    try:
+        yield
+    finally:
+        lease_ids = _request_leases.get()
+        _request_leases.reset(token)
+        if lease_ids:
+            release_leases(lease_ids)
+
+
+def _acquire_in_transaction(conn: sqlite3.Connection, session_id: str, now: float) -> Optional[int]:
+    """Take a lease for the current request scope, if there is one."""
+    scope = _request_leases.get()
+    if scope is None:
+        return None
+    cur = conn.execute(
+        "INSERT INTO leases (session_id, pid, expires_at) VALUES (?, ?, ?)",
+        (session_id, os.getpid(), now + config.SESSION_LEASE_TTL),
+    )
+    scope.append(cur.lastrowid)
+    return cur.lastrowid
+
+
+def current_leases() -> list[int]:
+    """Return the IDs of the leases taken so far in the current scope."""
+    return list(_request_leases.get() or [])
+
+
+def acquire_lease(session_id: str, ttl: Optional[float] = None) -> int:
+    """Take an explicit lease on *session_id* and return its ID (see :func:`release_leases`)."""
+    conn = _connect()
+    expires = time.time() + (ttl if ttl is not None else config.SESSION_LEASE_TTL)
+    cur = conn.execute(
+        "INSERT INTO leases (session_id, pid, expires_at) VALUES (?, ?, ?)",
+        (session_id, os.getpid(), expires),
+    )
+    return cur.lastrowid
+
+
+def renew_lease(lease_id: int, ttl: Optional[float] = None) -> None:
+    """Push back the expiry of a long-held lease."""
+    expires = time.time() + (ttl if ttl is not None else config.SESSION_LEASE_TTL)
+    _connect().execute("UPDATE leases SET expires_at = ? WHERE lease_id = ?", (expires, lease_id))
+
+
+def release_leases(lease_ids: list[int]) -> None:
+    """Release leases taken by :func:`acquire_lease` or a request scope."""
+    _connect().executemany("DELETE FROM leases WHERE lease_id = ?", [(i,) for i in lease_ids])
+
+
+# ---------------------------------------------------------------------------
+# Writes
+# ---------------------------------------------------------------------------
+
+def register_session(session_id: str, kind: str, path: str, owner: Optional[str] = None) -> None:
+    """Record that *session_id* of *kind* lives at *path* (leased to the current request)."""
+    now = time.time()
+    conn = _connect()
+    with _transaction(conn):
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (session_id, kind, path, owner, created_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (session_id, kind, os.path.abspath(path), owner, now, now),
+        )
+        _acquire_in_transaction(conn, session_id, now)
+
+
+# Appends an invoice to the creation sequence; one already indexed keeps its place.
+_REGISTER_INVOICE = (
+    "INSERT INTO invoices (invoice_id, session_id, seq) "
+    "SELECT ?, ?, COALESCE(MAX(seq), 0) + 1 FROM invoices WHERE true "
+    "ON CONFLICT(invoice_id) DO UPDATE SET session_id = excluded.session_id"
+)
+
+
+def register_invoice(invoice_id: str, session_id: str) -> None:
+    """Record that *invoice_id* belongs to *session_id*."""
+    _connect().execute(_REGISTER_INVOICE, (invoice_id, session_id))
+
+
+def forget_session(session_id: str) -> None:
+    """Drop *session_id* and its invoices from the index."""
+    conn = _connect()
+    with _transaction(conn):
+        conn.execute("DELETE FROM invoices WHERE session_id = ?", (session_id,))
+        conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+
+def claim_for_removal(session_id: str, now: Optional[float] = None) -> Optional[str]:
+    """Atomically unregister *session_id* unless it holds a live lease.
+
+    Returns the session directory for the caller to delete, or *None* if the
+    session is in use (or already gone).  Once this returns a path, lookups
+    can no longer hand the session out.
+    """
+    now = now or time.time()
+    conn = _connect()
+    with _transaction(conn):
+        leased = conn.execute(
+            "SELECT 1 FROM leases WHERE session_id = ? AND expires_at > ? LIMIT 1", (session_id, now),
+        ).fetchone()
+        if leased:
+            return None
+        row = conn.execute("SELECT path FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        conn.execute("DELETE FROM invoices WHERE session_id = ?", (session_id,))
+        conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        return row[0]
+
+
+# ---------------------------------------------------------------------------
+# Lookups
+# ---------------------------------------------------------------------------
+
+def _resolve(session_id: str, kind: Optional[str] = None) -> Optional[str]:
+    """Look *session_id* up, refreshing its access time and leasing it to the request."""
+    now = time.time()
+    conn = _connect()
+    with _transaction(conn):
+        row = conn.execute(
+            "SELECT kind, path, last_access FROM sessions WHERE session_id = ?", (session_id,),
+        ).fetchone()
+        if row is None or (kind is not None and row[0] != kind):
+            return None
+        if now - row[2] > _TOUCH_INTERVAL:
+            conn.execute("UPDATE sessions SET last_access = ? WHERE session_id = ?", (now, session_id))
+        _acquire_in_transaction(conn, session_id, now)
+    if not os.path.isdir(row[1]):
+        forget_session(session_id)
+        return None
+    return row[1]
+
+
+def lookup_session(session_id: str, kind: Optional[str] = None) -> Optional[str]:
+    """Return the directory of *session_id* (optionally restricted to *kind*), or *None*.
+
+    Entries whose directory has disappeared from disk are dropped on sight.
+    """
+    return _resolve(session_id, kind)
+
+
+def lookup_invoice(invoice_id: str) -> Optional[tuple[str, str]]:
+    """Return ``(session_id, session_dir)`` for *invoice_id*, or *None*."""
+    row = _connect().execute(
+        "SELECT session_id FROM invoices WHERE invoice_id = ?", (invoice_id,),
+    ).fetchone()
+    if row is None:
+        return None
+    session_dir = _resolve(row[0])
+    if session_dir is None:
+        return None
+    return row[0], session_dir
+
+
+def list_invoices(session_id: str) -> list[str]:
+    """Return the invoice IDs of *session_id* in the order they were created."""
+    rows = _connect().execute(
+        "SELECT invoice_id FROM invoices WHERE session_id = ? ORDER BY seq", (session_id,),
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+def list_sessions() -> list[dict]:
+    """Return every indexed session as a dict (used by the reaper)."""
+    conn = _connect()
+    cols = ("session_id", "kind", "path", "owner", "created_at", "last_access", "bytes", "measured_at")
+    rows = conn.execute(f"SELECT {', '.join(cols)} FROM sessions ORDER BY last_access").fetchall()
+    return [dict(zip(cols, r)) for r in rows]
+
+
+def set_session_size(session_id: str, size: int, measured_at: float) -> None:
+    """Store the measured on-disk size of *session_id*."""
+    _connect().execute(
+        "UPDATE sessions SET bytes = ?, measured_at = ? WHERE session_id = ?", (size, measured_at, session_id),
+    )
+
+
+def leased_sessions(now: Optional[float] = None) -> set[str]:
+    """Return the IDs of sessions holding an unexpired lease."""
+    rows = _connect().execute(
+        "SELECT DISTINCT session_id FROM leases WHERE expires_at > ?", (now or time.time(),),
+    ).fetchall()
+    return {r[0] for r in rows}
+
+
+def purge_expired_leases(now: Optional[float] = None) -> int:
+    """Delete leases left behind by crashed workers; return how many."""
+    cur = _connect().execute("DELETE FROM leases WHERE expires_at <= ?", (now or time.time(),))
+    return cur.rowcount
+
+
+# ---------------------------------------------------------------------------
+# Counters
+# ---------------------------------------------------------------------------
+
+def increment_stats(values: dict[str, float]) -> None:
+    """Add *values* to the named counters."""
+    conn = _connect()
+    with _transaction(conn):
+        conn.executemany(
+            "INSERT INTO stats (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+            list(values.items()),
+        )
+
+
+def set_stats(values: dict[str, float]) -> None:
+    """Overwrite the named counters."""
+    _connect().executemany(
+        "INSERT OR REPLACE INTO stats (key, value) VALUES (?, ?)", list(values.items()),
+    )
+
+
+def get_stats(prefix: str = "") -> dict[str, float]:
+    """Return all counters whose key starts with *prefix* (prefix stripped)."""
+    rows = _connect().execute(
+        "SELECT key, value FROM stats WHERE key LIKE ? ESCAPE '\\'",
+        (prefix.replace("_", "\\_") + "%",),
+    ).fetchall()
+    return {k[len(prefix):]: v for k, v in rows}
+
+
+def try_claim_stat_lock(key: str, hold_seconds: float, now: Optional[float] = None) -> bool:
+    """Claim a cross-worker lock stored as an expiry time in ``stats``.
+
+    Returns True if this caller now holds it (it expires by itself).
+    """
+    now = now or time.time()
+    conn = _connect()
+    with _transaction(conn):
+        row = conn.execute("SELECT value FROM stats WHERE key = ?", (key,)).fetchone()
+        if row is not None and row[0] > now:
+            return False
+        conn.execute("INSERT OR REPLACE INTO stats (key, value) VALUES (?, ?)", (key, now + hold_seconds))
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Rebuild from disk
+# ---------------------------------------------------------------------------
+
+def rebuild(invoice_suffix: str, stored_invoices: Iterable[tuple[str, str]] = ()) -> dict:
+    """Re-index every session directory directly under ``config.TEMP_DIR``.
+
+    Invoices are discovered by files ending in *invoice_suffix*, plus the
+    ``(invoice_id, session_id)`` pairs in *stored_invoices* (invoices kept
+    outside the directory by a database store, in creation order) whose
+    session exists.  Rows for sessions that no longer exist on disk are
+    removed; owners, access times and the order of invoices already on record
+    are kept.  Returns counts.
+    """
+    started = time.perf_counter()
+    found_sessions: list[tuple] = []
+    found_invoices: list[tuple] = []
+
+    if os.path.isdir(config.TEMP_DIR):
+        with os.scandir(config.TEMP_DIR) as entries:
+            for entry in entries:
+                parsed = parse_session_dir(entry.name)
+                if parsed is None or not entry.is_dir(follow_symlinks=False):
+                    continue
+                kind, session_id = parsed
+                path = os.path.abspath(entry.path)
+                mtime = entry.stat().st_mtime
+                found_sessions.append((session_id, kind, path, mtime, mtime))
+                if kind == "convert":
+                    continue
+                # An invoice's files are all written when it is created and
+                # edits rewrite only some of them, so the oldest dates it.
+                created: dict[str, float] = {}
+                invoice_ids = []
+                with os.scandir(entry.path) as files:
+                    for f in files:
+                        match = _INVOICE_FILE_RE.match(f.name)
+                        if match is None:
+                            continue
+                        invoice_id = match.group(1)
+                        mtime = f.stat().st_mtime
+                        created[invoice_id] = min(mtime, created.get(invoice_id, mtime))
+                        if f.name == invoice_id + invoice_suffix:
+                            invoice_ids.append(invoice_id)
+                for invoice_id in sorted(invoice_ids, key=created.__getitem__):
+                    found_invoices.append((invoice_id, session_id))
+
+    found_ids = {s[0] for s in found_sessions}
+    found_invoices.extend(pair for pair in stored_invoices if pair[1] in found_ids)
+
+    conn = _connect()
+    with _transaction(conn):
+        conn.executemany(
+            "INSERT INTO sessions (session_id, kind, path, created_at, last_access) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET kind = excluded.kind, path = excluded.path",
+            found_sessions,
+        )
+        conn.executemany(_REGISTER_INVOICE, found_invoices)
+        # Rows registered by another worker after the scan above still point
+        # at live directories, so prune by existence rather than wiping.
+        stale = [
+            (session_id,)
+            for session_id, path in conn.execute("SELECT session_id, path FROM sessions").fetchall()
+            if not os.path.isdir(path)
+        ]
+        conn.executemany("DELETE FROM invoices WHERE session_id = ?", stale)
+        conn.executemany("DELETE FROM sessions WHERE session_id = ?", stale)
+
+    stats = {
+        "sessions": len(found_sessions),
+        "pruned": len(stale),
+        "invoices": len(found_invoices),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    logger.info(
+        "Session registry rebuilt: %(sessions)d sessions, %(invoices)d invoices, %(pruned)d pruned in %(seconds)ss",
+        stats,
+    )
+    return stats
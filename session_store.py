@@ -0,0 +1,426 @@
+"""
+Storage backends for per-invoice state.
+
+An invoice carries more than its data document: the name of the CSV it came
+from, an optional summary-sheet template and column mapping, and the saved
+summary sheet with the mask of cells the user edited by hand.  This module
+keeps all of that behind one interface, :class:`SessionStore`, with two
+implementations:
+
+    FilesystemStore — the original layout, loose files in the session directory
+                      (``<id>_invoice_data.bin``, ``summary_mapping_<id>.json``, …)
+    SqliteStore     — indexed tables in one WAL database shared by all workers;
+                      a batch's state loads in a single query
+
+``config.SESSION_STORE_BACKEND`` picks one (see ``session_manager.get_store``).
+Source CSVs stay on disk next to the session in both cases — they are read
+with pandas and are not state the user edits.
+
+Invoices saved before :mod:`invoice_codec` (``<id>_invoice_data.pkl``) are
+moved into the configured store at startup by
+:func:`migrate_legacy_invoices`.
+"""
+
+import json
+import logging
+import os
+import pickle
+import re
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+import config
+import db
+import invoice_codec
+import session_registry
+from db import transaction as _transaction
+
+logger = logging.getLogger(__name__)
+
+INVOICE_DATA_SUFFIX = "_invoice_data.bin"
+LEGACY_INVOICE_DATA_SUFFIX = "_invoice_data.pkl"  # pickles, before invoice_codec
+
+_LEGACY_INVOICE_RE = re.compile(r"^([0-9a-f]{32})" + re.escape(LEGACY_INVOICE_DATA_SUFFIX) + "$")
+
+
+@dataclass
+class InvoiceState:
+    """Everything stored for one invoice; fields are *None* when not set."""
+
+    invoice_id: str
+    invoice_data: Optional[dict] = None
+    source_filename: Optional[str] = None
+    summary_template: Optional[bytes] = None
+    summary_template_filename: Optional[str] = None
+    summary_mapping: Optional[dict] = None
+    summary_columns: Optional[list] = None
+    summary_rows: Optional[list] = None
+    edited_cells: Optional[list] = None
+
+    @property
+    def stem(self) -> str:
+        """Base name for files exported from this invoice."""
+        return Path(self.source_filename).stem if self.source_filename else self.invoice_id
+
+
+def encode_invoice(data: dict) -> bytes:
+    """Serialise an invoice-data document for storage (see :mod:`invoice_codec`)."""
+    return invoice_codec.encode(data)
+
+
+def decode_invoice(blob: bytes) -> dict:
+    """Inverse of :func:`encode_invoice`."""
+    return invoice_codec.decode(blob)
+
+
+def _session_id(session_dir: str) -> str:
+    parsed = session_registry.parse_session_dir(os.path.basename(os.path.normpath(session_dir)))
+    return parsed[1] if parsed else os.path.basename(os.path.normpath(session_dir))
+
+
+class SessionStore:
+    """Interface implemented by the storage backends.
+
+    Every method takes the session directory that owns the invoice, as
+    returned by the registry lookups in ``session_manager``.
+    """
+
+    name = ""
+
+    def load_invoice(self, session_dir: str, invoice_id: str) -> Optional[dict]:
+        """Return the invoice-data document, or *None* if there is none."""
+        raise NotImplementedError
+
+    def save_invoice(
+        self, session_dir: str, invoice_id: str, data: dict, source_filename: Optional[str] = None,
+    ) -> None:
+        """Create or replace the invoice-data document (and record its source file name)."""
+        raise NotImplementedError
+
+    def load_state(self, session_dir: str, invoice_id: str) -> Optional[InvoiceState]:
+        """Return the full state of one invoice, or *None* if it does not exist."""
+        raise NotImplementedError
+
+    def load_batch(self, session_dir: str, session_id: str) -> list[InvoiceState]:
+        """Return the state of every invoice in a session, in creation order."""
+        raise NotImplementedError
+
+    def set_summary_template(self, session_dir: str, invoice_id: str, filename: str, content: bytes) -> None:
+        raise NotImplementedError
+
+    def set_summary_mapping(self, session_dir: str, invoice_id: str, mapping: dict) -> None:
+        raise NotImplementedError
+
+    def set_summary_sheet(
+        self, session_dir: str, invoice_id: str, columns: list, rows: list, edited_cells: Optional[list] = None,
+    ) -> None:
+        """Save the summary sheet; the edit mask is only replaced when *edited_cells* is given."""
+        raise NotImplementedError
+
+    def list_invoices(self) -> list[tuple[str, str]]:
+        """Return ``(invoice_id, session_id)`` for invoices not discoverable on disk."""
+        return []
+
+    def delete_session(self, session_id: str) -> None:
+        """Forget everything stored for *session_id* outside its directory."""
+
+
+# ---------------------------------------------------------------------------
+# Filesystem backend (default)
+# ---------------------------------------------------------------------------
+
+class FilesystemStore(SessionStore):
+    """Loose files in the session directory — the layout the app always used."""
+
+    name = "filesystem"
+
+    @staticmethod
+    def _path(session_dir: str, pattern: str, invoice_id: str) -> str:
+        return os.path.join(session_dir, pattern.format(id=invoice_id))
+
+    @staticmethod
+    def _read_text(path: str) -> Optional[str]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _read_json(path: str):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError:
+            logger.warning("Ignoring unreadable %s", path)
+            return None
+
+    def load_invoice(self, session_dir, invoice_id):
+        try:
+            with open(self._path(session_dir, "{id}" + INVOICE_DATA_SUFFIX, invoice_id), "rb") as f:
+                return decode_invoice(f.read())
+        except FileNotFoundError:
+            return None
+
+    def save_invoice(self, session_dir, invoice_id, data, source_filename=None):
+        # Written aside and renamed into place: readers never see a partial document.
+        blob = encode_invoice(data)
+        fd, tmp_path = tempfile.mkstemp(dir=session_dir, prefix=".invoice_", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(blob)
+            os.replace(tmp_path, self._path(session_dir, "{id}" + INVOICE_DATA_SUFFIX, invoice_id))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if source_filename is not None:
+            with open(self._path(session_dir, "{id}_source_filename.txt", invoice_id), "w", encoding="utf-8") as f:
+                f.write(source_filename)
+
+    def load_state(self, session_dir, invoice_id):
+        data = self.load_invoice(session_dir, invoice_id)
+        if data is None:
+            return None
+        state = InvoiceState(
+            invoice_id=invoice_id,
+            invoice_data=data,
+            source_filename=self._read_text(self._path(session_dir, "{id}_source_filename.txt", invoice_id)),
+            summary_template_filename=self._read_text(
+                self._path(session_dir, "summary_template_filename_{id}.txt", invoice_id)
+            ),
+            summary_mapping=self._read_json(self._path(session_dir, "summary_mapping_{id}.json", invoice_id)),
+        )
+        try:
+            with open(self._path(session_dir, "summary_template_{id}.csv", invoice_id), "rb") as f:
+                state.summary_template = f.read()
+        except FileNotFoundError:
+            pass
+        sheet_path = self._path(session_dir, "summary_single_{id}.csv", invoice_id)
+        if os.path.isfile(sheet_path):
+            try:
+                sheet = pd.read_csv(sheet_path, dtype=str).fillna("")
+                state.summary_columns = list(sheet.columns)
+                state.summary_rows = sheet.values.tolist()
+            except (pd.errors.ParserError, pd.errors.EmptyDataError) as e:
+                logger.warning("Could not read saved summary sheet %s: %s", sheet_path, e)
+        mask = self._read_json(self._path(session_dir, "summary_edits_{id}.json", invoice_id))
+        if mask is not None:
+            state.edited_cells = mask.get("edited_cells", [])
+        return state
+
+    def load_batch(self, session_dir, session_id):
+        states = (self.load_state(session_dir, i) for i in session_registry.list_invoices(session_id))
+        return [s for s in states if s is not None]
+
+    def set_summary_template(self, session_dir, invoice_id, filename, content):
+        with open(self._path(session_dir, "summary_template_{id}.csv", invoice_id), "wb") as f:
+            f.write(content)
+        with open(self._path(session_dir, "summary_template_filename_{id}.txt", invoice_id), "w", encoding="utf-8") as f:
+            f.write(filename)
+
+    def set_summary_mapping(self, session_dir, invoice_id, mapping):
+        with open(self._path(session_dir, "summary_mapping_{id}.json", invoice_id), "w", encoding="utf-8") as f:
+            json.dump(mapping, f, indent=2)
+
+    def set_summary_sheet(self, session_dir, invoice_id, columns, rows, edited_cells=None):
+        pd.DataFrame(rows, columns=columns).to_csv(
+            self._path(session_dir, "summary_single_{id}.csv", invoice_id), index=False, encoding="utf-8",
+        )
+        if edited_cells is not None:
+            with open(self._path(session_dir, "summary_edits_{id}.json", invoice_id), "w", encoding="utf-8") as f:
+                json.dump({"edited_cells": edited_cells}, f)
+
+
+# ---------------------------------------------------------------------------
+# SQLite backend
+# ---------------------------------------------------------------------------
+
+SQLITE_SCHEMA_VERSION = 2  # 2: invoice data in invoice_codec format
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    invoice_id       TEXT PRIMARY KEY,
+    session_id       TEXT NOT NULL,
+    data             BLOB NOT NULL,
+    source_filename  TEXT,
+    updated_at       REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS invoices_by_session ON invoices (session_id);
+CREATE TABLE IF NOT EXISTS summaries (
+    invoice_id         TEXT PRIMARY KEY,
+    session_id         TEXT NOT NULL,
+    template           BLOB,
+    template_filename  TEXT,
+    mapping            TEXT,
+    columns            TEXT,
+    rows               TEXT,
+    edited_cells       TEXT
+);
+CREATE INDEX IF NOT EXISTS summaries_by_session ON summaries (session_id)
+"""
+
+_STATE_QUERY = (
+    "SELECT i.invoice_id, i.data, i.source_filename, s.template, s.template_filename, "
+    "s.mapping, s.columns, s.rows, s.edited_cells "
+    "FROM invoices i LEFT JOIN summaries s ON s.invoice_id = i.invoice_id "
+)
+
+
+def _loads(text: Optional[str]):
+    return json.loads(text) if text is not None else None
+
+
+class SqliteStore(SessionStore):
+    """Invoice state in ``config.SESSION_STORE_PATH`` (WAL mode, safe across workers)."""
+
+    name = "sqlite"
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or config.SESSION_STORE_PATH or os.path.join(config.TEMP_DIR, "session_store.sqlite3")
+
+    def _connect(self):
+        # Like the session directories it describes, the store only holds
+        # temporary working state, so a format change starts it afresh.
+        return db.connect(self.path, _SQLITE_SCHEMA, SQLITE_SCHEMA_VERSION, reset_on_mismatch=True)
+
+    def load_invoice(self, session_dir, invoice_id):
+        row = self._connect().execute("SELECT data FROM invoices WHERE invoice_id = ?", (invoice_id,)).fetchone()
+        return decode_invoice(row[0]) if row else None
+
+    def save_invoice(self, session_dir, invoice_id, data, source_filename=None):
+        self._connect().execute(
+            "INSERT INTO invoices (invoice_id, session_id, data, source_filename, updated_at) "
+            "VALUES (?, ?, ?, ?, ?) ON CONFLICT(invoice_id) DO UPDATE SET data = excluded.data, "
+            "source_filename = COALESCE(excluded.source_filename, invoices.source_filename), "
+            "updated_at = excluded.updated_at",
+            (invoice_id, _session_id(session_dir), encode_invoice(data), source_filename, time.time()),
+        )
+
+    @staticmethod
+    def _state(row) -> InvoiceState:
+        invoice_id, data, source_filename, template, template_filename, mapping, columns, rows, edited = row
+        return InvoiceState(
+            invoice_id=invoice_id,
+            invoice_data=decode_invoice(data),
+            source_filename=source_filename,
+            summary_template=template,
+            summary_template_filename=template_filename,
+            summary_mapping=_loads(mapping),
+            summary_columns=_loads(columns),
+            summary_rows=_loads(rows),
+            edited_cells=_loads(edited),
+        )
+
+    def load_state(self, session_dir, invoice_id):
+        row = self._connect().execute(_STATE_QUERY + "WHERE i.invoice_id = ?", (invoice_id,)).fetchone()
+        return self._state(row) if row else None
+
+    def load_batch(self, session_dir, session_id):
+        rows = self._connect().execute(
+            _STATE_QUERY + "WHERE i.session_id = ? ORDER BY i.rowid", (session_id,),
+        ).fetchall()
+        return [self._state(row) for row in rows]
+
+    def _set_summary(self, session_dir: str, invoice_id: str, **fields) -> None:
+        names = list(fields)
+        self._connect().execute(
+            f"INSERT INTO summaries (invoice_id, session_id, {', '.join(names)}) "
+            f"VALUES (?, ?, {', '.join('?' for _ in names)}) ON CONFLICT(invoice_id) DO UPDATE SET "
+            + ", ".join(f"{n} = excluded.{n}" for n in names),
+            (invoice_id, _session_id(session_dir), *fields.values()),
+        )
+
+    def set_summary_template(self, session_dir, invoice_id, filename, content):
+        self._set_summary(session_dir, invoice_id, template=content, template_filename=filename)
+
+    def set_summary_mapping(self, session_dir, invoice_id, mapping):
+        self._set_summary(session_dir, invoice_id, mapping=json.dumps(mapping))
+
+    def set_summary_sheet(self, session_dir, invoice_id, columns, rows, edited_cells=None):
+        # Stored as the strings a CSV round trip would give back, like the filesystem backend.
+        rows = [["" if v is None else str(v) for v in row] for row in rows]
+        fields = {"columns": json.dumps(columns), "rows": json.dumps(rows)}
+        if edited_cells is not None:
+            fields["edited_cells"] = json.dumps(edited_cells)
+        self._set_summary(session_dir, invoice_id, **fields)
+
+    def list_invoices(self):
+        return self._connect().execute("SELECT invoice_id, session_id FROM invoices ORDER BY rowid").fetchall()
+
+    def delete_session(self, session_id):
+        conn = self._connect()
+        with _transaction(conn):
+            conn.execute("DELETE FROM summaries WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM invoices WHERE session_id = ?", (session_id,))
+
+
+BACKENDS = {FilesystemStore.name: FilesystemStore, SqliteStore.name: SqliteStore}
+
+
+# ---------------------------------------------------------------------------
+# Legacy invoices
+# ---------------------------------------------------------------------------
+
+def migrate_legacy_invoices(store: SessionStore) -> dict:
+    """Move invoices pickled before :mod:`invoice_codec` into *store*; return counts.
+
+    Run once at startup, before the registry is rebuilt.  Every
+    ``<id>_invoice_data.pkl`` in a session directory — written by this app
+    into its own ``TEMP_DIR`` — is loaded, saved through *store* with the
+    rest of its state, and deleted, oldest first so batches keep their
+    order.  One that cannot be read or re-encoded is deleted too, so its
+    invoice is simply not found rather than failing on every request.
+    """
+    counts = {"migrated": 0, "dropped": 0}
+    if not os.path.isdir(config.TEMP_DIR):
+        return counts
+    files_store = FilesystemStore()
+    with os.scandir(config.TEMP_DIR) as entries:
+        session_dirs = [
+            e.path for e in entries
+            if session_registry.parse_session_dir(e.name) is not None and e.is_dir(follow_symlinks=False)
+        ]
+    for session_dir in session_dirs:
+        with os.scandir(session_dir) as files:
+            legacy = sorted(
+                (f.stat().st_mtime, match.group(1), f.path)
+                for f in files if (match := _LEGACY_INVOICE_RE.match(f.name))
+            )
+        for _mtime, invoice_id, path in legacy:
+            try:
+                with open(path, "rb") as f:
+                    data = pickle.load(f)
+                files_store.save_invoice(session_dir, invoice_id, data)
+                if store.name != files_store.name:
+                    _copy_state(files_store.load_state(session_dir, invoice_id), session_dir, store)
+                    os.remove(files_store._path(session_dir, "{id}" + INVOICE_DATA_SUFFIX, invoice_id))
+                counts["migrated"] += 1
+            except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, TypeError, ValueError) as e:
+                logger.warning("Dropping unreadable legacy invoice %s: %s", path, e)
+                counts["dropped"] += 1
+            os.remove(path)
+    if counts["migrated"] or counts["dropped"]:
+        logger.info("Legacy invoices: %(migrated)d migrated, %(dropped)d dropped", counts)
+    return counts
+
+
+def _copy_state(state: InvoiceState, session_dir: str, store: SessionStore) -> None:
+    store.save_invoice(session_dir, state.invoice_id, state.invoice_data, state.source_filename)
+    if state.summary_template is not None:
+        store.set_summary_template(
+            session_dir, state.invoice_id, state.summary_template_filename or "", state.summary_template,
+        )
+    if state.summary_mapping is not None:
+        store.set_summary_mapping(session_dir, state.invoice_id, state.summary_mapping)
+    if state.summary_columns is not None:
+        store.set_summary_sheet(
+            session_dir, state.invoice_id, state.summary_columns, state.summary_rows, state.edited_cells,
+        )
@@ -396,14 +396,20 @@ document.getElementById('upload-form-xlsx').addEventListener('submit', async (e)
 
     const formData = new FormData();
     const fileInput = document.getElementById('xlsx_file');
-    const file = fileInput.files[0];
+    const selected = Array.from(fileInput.files);
 
-    if (!file) {
+    if (selected.length === 0) {
         showError('Please select a file');
         return;
     }
 
-    formData.append('file', file);
+    // Several workbooks go to the batch endpoint, which converts their sheets in parallel
+    const endpoint = selected.length > 1 ? '/api/convert-xlsx-batch' : '/api/convert-xlsx';
+    if (selected.length > 1) {
+        selected.forEach(f => formData.append('files', f));
+    } else {
+        formData.append('file', selected[0]);
+    }
 
     document.getElementById('upload-section-xlsx').classList.add('hidden');
     document.getElementById('loading').classList.remove('hidden');
@@ -411,7 +417,7 @@ document.getElementById('upload-form-xlsx').addEventListener('submit', async (e)
     document.getElementById('success').classList.add('hidden');
 
     try {
-        const response = await fetch('/api/convert-xlsx', {
+        const response = await fetch(endpoint, {
             method: 'POST',
             body: formData
         });
@@ -47,12 +47,17 @@ function updateGrandTotal() {
         document.getElementById('error').classList.add('hidden');
 
         try {
-            let apiUrl = `/api/get-conversion-files/${conversionSessionId}`;
+            const jobForm = new FormData();
+            jobForm.append('session_id', conversionSessionId);
             if (selectedFilesParam) {
-                apiUrl += `?files=${encodeURIComponent(selectedFilesParam)}`;
+                jobForm.append('files', selectedFilesParam);
             }
+            const loadingMessage = document.querySelector('#loading p');
+            const job = await runJob('/api/jobs/conversion-invoices', jobForm, (status) => {
+                loadingMessage.textContent = describeJobProgress(status, 'files');
+            });
 
-            const response = await fetch(apiUrl);
+            const response = await fetch(`/api/jobs/${job.job_id}/result`);
 
             if (!response.ok) {
                 const errorData = await response.json().catch(() => ({ detail: 'Failed to load files' }));
@@ -78,6 +83,7 @@ function updateGrandTotal() {
             document.getElementById('loading').classList.add('hidden');
             document.getElementById('invoice-list-section').classList.remove('hidden');
             document.getElementById('editing-section').classList.remove('hidden');
+            reportBatchFailures(data.failures);
             refreshSummaryTemplateStatus();
 
         } catch (error) {
@@ -133,6 +139,7 @@ document.getElementById('upload-form').addEventListener('submit', async (e) => {
         document.getElementById('loading').classList.add('hidden');
         document.getElementById('invoice-list-section').classList.remove('hidden');
         document.getElementById('editing-section').classList.remove('hidden');
+        reportBatchFailures(data.failures);
         refreshSummaryTemplateStatus();
 
     } catch (error) {
@@ -292,6 +299,50 @@ document.getElementById('column-mapping-modal-backdrop').addEventListener('click
     document.getElementById('column-mapping-modal').classList.add('hidden');
 });
 
+// Queue a background job and follow its progress events; resolves with the
+// final job status once it has succeeded, rejects if it failed or was cancelled.
+async function runJob(submitUrl, formData, onProgress) {
+    const response = await fetch(submitUrl, { method: 'POST', body: formData });
+    if (!response.ok) {
+        const errorData = await response.json().catch(() => ({}));
+        throw new Error(errorData.detail || `Request failed: ${response.status}`);
+    }
+    const job = await response.json();
+    onProgress(job);
+
+    return new Promise((resolve, reject) => {
+        const events = new EventSource(`/api/jobs/${job.job_id}/events`);
+        events.addEventListener('progress', (e) => onProgress(JSON.parse(e.data)));
+        events.addEventListener('done', (e) => {
+            events.close();
+            const status = JSON.parse(e.data);
+            if (status.status === 'succeeded') {
+                resolve(status);
+            } else {
+                reject(new Error(status.error || `Job ${status.status}`));
+            }
+        });
+    });
+}
+
+function describeJobProgress(status, unit) {
+    const progress = status.progress;
+    if (status.status === 'queued') return 'Waiting to start...';
+    if (!progress.files_total) return 'Processing...';
+    let text = `${progress.files_done} of ${progress.files_total} ${unit}`;
+    if (progress.rows_done) text += `, ${progress.rows_done.toLocaleString()} rows`;
+    if (progress.eta_seconds !== null && progress.files_done < progress.files_total) {
+        text += ` (about ${Math.ceil(progress.eta_seconds)}s left)`;
+    }
+    return text;
+}
+
+function reportBatchFailures(failures) {
+    if (!failures || failures.length === 0) return;
+    const details = failures.map(f => `${f.filename} (${f.error})`).join('; ');
+    showError(`${failures.length} file(s) could not be turned into invoices: ${details}`);
+}
+
 function populateInvoiceList(invoices) {
     const invoiceList = document.getElementById('invoice-list');
     invoiceList.innerHTML = '';
@@ -405,28 +456,28 @@ document.getElementById('download-all-btn').addEventListener('click', async () =
         return;
     }
 
+    const button = document.getElementById('download-all-btn');
+    const label = button.textContent;
+    button.disabled = true;
     try {
         const formData = new FormData();
         formData.append('batch_session_id', batchSessionId);
 
-        const response = await fetch('/api/download-all-invoices', {
-            method: 'POST',
-            body: formData
+        const job = await runJob('/api/jobs/download-all-invoices', formData, (status) => {
+            button.textContent = describeJobProgress(status, 'invoices');
         });
 
-        if (!response.ok) throw new Error('Download failed');
-
-        const blob = await response.blob();
-        const url = window.URL.createObjectURL(blob);
         const a = document.createElement('a');
-        a.href = url;
+        a.href = `/api/jobs/${job.job_id}/result`;
         a.download = `invoices_${batchSessionId}.zip`;
         document.body.appendChild(a);
         a.click();
-        window.URL.revokeObjectURL(url);
         document.body.removeChild(a);
     } catch (error) {
-        showError('Failed to download all invoices');
+        showError(`Failed to download all invoices: ${error.message}`);
+    } finally {
+        button.textContent = label;
+        button.disabled = false;
     }
 });
 
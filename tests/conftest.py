@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Sessions, caches and registries go under a scratch TEMP_DIR, not the repository's temp/.
+os.environ.setdefault("TEMP_DIR", tempfile.mkdtemp(prefix="batchinvoicer_tests_"))
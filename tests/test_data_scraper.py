@@ -0,0 +1,86 @@
+"""Invoice items built with column operations match the original ``iterrows`` loop."""
+
+import io
+
+import pandas as pd
+import pytest
+
+import csv_cleaner
+import DataScraper
+from DataScraper import clean_miles_value, clean_value, get_column_value
+
+EXPORT = """Start Date,Record ID,Pas Number,Passenger UPC,Caller,Actual Mileage,Mobility Abbreviation,From Postcode,To Postcode
+01/07/2025,5000001,000123,4000000001,Ward 1,12.0,WC,AB1 2CD,EF3 4GH
+02/07/2025,1005.0, 42 ,nan,  ,,2,,
+,,,,,,,,
+04/07/2025, nan ,x.0,4000000003.0,Ward 3,3.5,AMB,ZZ1 1ZZ,
+03/07/2025,,None,N/A,Ward 4,nan,,,
+"""
+
+
+def baseline_items(df):
+    """The row-by-row loop ``transform_dataframe_to_invoice_data`` used before it built columns."""
+    invoice_items = []
+    for row_idx, (_, row) in enumerate(df.iterrows()):
+        date_value = str(row.get('Start Date', '')).strip()
+        our_ref_value = clean_value(row.get('Record ID', ''))
+        date_is_nan = (date_value.lower() == 'nan' or date_value == '' or pd.isna(row.get('Start Date', '')))
+        ref_is_nan = (our_ref_value.lower() == 'nan' or our_ref_value == '' or pd.isna(row.get('Record ID', '')))
+        if date_is_nan and ref_is_nan:
+            continue
+        invoice_items.append({
+            '_source_row_index': row_idx,
+            'date': date_value,
+            'our_ref': our_ref_value,
+            'client_ref': clean_value(row.get('Pas Number', '')),
+            'nhs_number': clean_value(get_column_value(row, ['Passenger UPC', 'PassengerUPC', 'Passenger UPC Code'])),
+            'contract_hospital': str(row.get('Contract Hospital Text', '')),
+            'booked_by': clean_value(row.get('Caller', '')),
+            'from_location': str(row.get('From Postcode', '')),
+            'to_location': str(row.get('To Postcode', '')),
+            'status': str(row.get('Jrny Status Text', '')),
+            'directions': str(row.get('Direction Text', '')),
+            'mob': clean_value(row.get('Mobility Abbreviation', '')),
+            'wait_pounds': '',
+            'wait_notes': str(row.get('Waiting Time Reason', '')),
+            'miles': clean_miles_value(row.get('Actual Mileage', '')),
+            'charged': '',
+            'miles_pounds': '',
+            'job_pounds': '',
+            'total': ''
+        })
+    return invoice_items
+
+
+def _frames(tmp_path):
+    path = tmp_path / "export.csv"
+    path.write_text(EXPORT, encoding="utf-8")
+    inferred = pd.read_csv(io.StringIO(EXPORT))
+    return {
+        "csv_to_dataframe": csv_cleaner.csv_to_dataframe(str(path)),
+        "inferred types": inferred,
+        "PassengerUPC alias": inferred.rename(columns={"Passenger UPC": "PassengerUPC"}),
+        "no Start Date": inferred.drop(columns=["Start Date"]),
+        "no Record ID": inferred.drop(columns=["Record ID"]),
+        "all numeric": pd.DataFrame({"Record ID": [1, 2, 3], "Actual Mileage": [1.0, None, 2.5]}),
+        "one row": inferred.head(1),
+    }
+
+
+@pytest.mark.parametrize("label", ["csv_to_dataframe", "inferred types", "PassengerUPC alias",
+                                   "no Start Date", "no Record ID", "all numeric", "one row"])
+def test_items_match_iterrows(tmp_path, label):
+    df = _frames(tmp_path)[label]
+    expected = baseline_items(df)
+    actual = DataScraper.transform_dataframe_to_invoice_data(df)["invoice"]["items"]
+    assert actual == expected
+    assert [[type(v) for v in item.values()] for item in actual] == [[type(v) for v in item.values()] for item in expected]
+
+
+def test_float_identifiers_lose_their_suffix(tmp_path):
+    items = DataScraper.transform_dataframe_to_invoice_data(_frames(tmp_path)["inferred types"])["invoice"]["items"]
+    by_row = {item["_source_row_index"]: item for item in items}
+    assert by_row[1]["our_ref"] == "1005"
+    assert by_row[3]["client_ref"] == "x" and by_row[3]["nhs_number"] == "4000000003"
+    assert by_row[0]["miles"] == "12.0"
+    assert 2 not in by_row
@@ -0,0 +1,91 @@
+"""Splitting by budget code: single-pass and streaming splits match the original per-code masks."""
+
+import filecmp
+import os
+
+import pandas as pd
+import pytest
+
+import config
+import divider
+from divider import sanitize_filename, split_csv_by_budget_code
+
+CODES = ["BARTS HDU", "BARTS BHOC HDU", "Ward 1 / Trust 1", "Ward 2", "Ward 3: Night"]
+
+
+def _write_export(path, n_rows, blank_codes):
+    """An export whose column types only settle late in the file."""
+    lines = ["Record ID,Pas Number,Actual Mileage,Wait Time,Notes,Ref,Flag,BudgetCodeText"]
+    for i in range(n_rows):
+        late = i > n_rows * 3 // 4
+        code = "" if blank_codes and i % 9 == 0 else CODES[(i * 7) % len(CODES)]
+        lines.append(",".join([
+            str(1000 + i),
+            f"{i % 1000:06d}",
+            f"{i % 30}.5" if late and i % 3 else str(i % 30),
+            "" if late and i % 7 == 0 else str(i % 45),
+            "" if i < n_rows // 2 else '"Return, late"',
+            f"R{i}" if late else f"{i % 100:05d}",
+            "True" if i % 2 else "False",
+            code,
+        ]))
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def baseline_split(input_file, output_dir):
+    """The per-code boolean-mask split ``split_csv_by_budget_code`` used to do."""
+    df = pd.read_csv(input_file)
+    os.makedirs(output_dir, exist_ok=True)
+    code_to_group = {code: group for group, codes in divider.COMBINED_GROUPS.items() for code in codes}
+    processed_groups = set()
+    for budget_code in df['BudgetCodeText'].unique():
+        if budget_code in code_to_group:
+            group_name = code_to_group[budget_code]
+            if group_name in processed_groups:
+                continue
+            processed_groups.add(group_name)
+            filtered_df = df[df['BudgetCodeText'].isin(divider.COMBINED_GROUPS[group_name])]
+            filename = f"{sanitize_filename(group_name)}.csv"
+        else:
+            filtered_df = df[df['BudgetCodeText'] == budget_code]
+            filename = f"{sanitize_filename(str(budget_code))}.csv"
+        filtered_df.to_csv(os.path.join(output_dir, filename), index=False)
+
+
+def _assert_same_files(actual_dir, expected_dir):
+    assert sorted(os.listdir(actual_dir)) == sorted(os.listdir(expected_dir))
+    for name in os.listdir(expected_dir):
+        assert filecmp.cmp(os.path.join(actual_dir, name), os.path.join(expected_dir, name), shallow=False), name
+
+
+@pytest.mark.parametrize("mode", divider.SPLIT_MODES)
+def test_split_matches_baseline(tmp_path, monkeypatch, mode):
+    monkeypatch.setattr(config, "SPLIT_CHUNK_ROWS", 50)
+    export = _write_export(tmp_path / "export.csv", 400, blank_codes=False)
+    baseline_split(export, str(tmp_path / "baseline"))
+    written = split_csv_by_budget_code(export, str(tmp_path / mode), mode=mode)
+    _assert_same_files(tmp_path / mode, tmp_path / "baseline")
+    assert sum(rows for _path, rows in written) == 400
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 7, 50, 10_000])
+def test_streaming_matches_memory(tmp_path, monkeypatch, chunk_rows):
+    # Two open files at a time, so outputs are closed and reopened for appending
+    monkeypatch.setattr(config, "SPLIT_CHUNK_ROWS", chunk_rows)
+    monkeypatch.setattr(config, "SPLIT_MAX_OPEN_FILES", 2)
+    export = _write_export(tmp_path / "export.csv", 400, blank_codes=True)
+    memory = split_csv_by_budget_code(export, str(tmp_path / "memory"), mode="memory")
+    streaming = split_csv_by_budget_code(export, str(tmp_path / "streaming"), mode="streaming")
+    _assert_same_files(tmp_path / "streaming", tmp_path / "memory")
+    assert [(os.path.basename(p), n) for p, n in streaming] == [(os.path.basename(p), n) for p, n in memory]
+    assert divider.NO_BUDGET_CODE_FILENAME in os.listdir(tmp_path / "memory")
+
+
+def test_budget_code_frames_match_split_files(tmp_path):
+    export = _write_export(tmp_path / "export.csv", 200, blank_codes=True)
+    split_csv_by_budget_code(export, str(tmp_path / "out"), mode="memory")
+    frames = dict(divider.budget_code_frames(export))
+    assert sorted(frames) == sorted(os.listdir(tmp_path / "out"))
+    for filename, frame in frames.items():
+        assert frame.to_csv(index=False) == (tmp_path / "out" / filename).read_text(encoding="utf-8"), filename
@@ -0,0 +1,104 @@
+"""Line items paginated in Python show what the template used to, split into fixed-size pages."""
+
+import pandas as pd
+import pytest
+from bs4 import BeautifulSoup
+
+import config
+import DataScraper
+from services.invoice_service import get_jinja_env, paginate_line_items, parse_html_invoice, render_invoice_html
+
+# The columns of one line item as the template formatted each raw item before.
+PREVIOUS_ITEMS = """\
+{% for item in data.invoice['items'] %}
+{% set date_is_nan = (not item.date or item.date|lower == 'nan' or item.date|string|trim == '') %}
+{% set ref_is_nan = (not item.our_ref or item.our_ref|lower == 'nan' or item.our_ref|string|trim == '') %}
+{% if not (date_is_nan and ref_is_nan) %}
+<div class="invoice-line-item">
+<span>{{ item.date | format_date_numeric }}</span>
+<span>{% if item.our_ref|string|trim|length > 0 and item.our_ref|string|trim|lower != 'nan' %}
+{% set our_ref_str = item.our_ref|string|trim %}
+{% if our_ref_str|length >= 2 and our_ref_str[-2:] == '.0' %}{{ our_ref_str[:-2] }}{% else %}{{ our_ref_str }}{% endif %}
+{% endif %}</span>
+<span>{{ item.client_ref }}</span>
+<span>{{ item.nhs_number }}</span>
+<span>{{ item.contract_hospital }}</span>
+<span></span>
+<span>{{ item.booked_by }}</span>
+<span>{{ item.from_location }}</span>
+<span>{{ item.to_location }}</span>
+<span>{{ item.status }}</span>
+<span>{{ item.directions }}</span>
+<span>{{ item.mob }}</span>
+<span>{% if item.wait_pounds %}£{{ item.wait_pounds | format_currency }}{% endif %}</span>
+<span>{{ item.wait_notes }}</span>
+<span>{% if item.miles and item.miles|lower != 'nan' and item.miles|string|trim != '' %}{{ item.miles }}{% else %}0.0{% endif %}</span>
+<span>{% if item.charged and item.charged|string|trim != '' and item.charged|lower != 'nan' %}{{ item.charged }}{% else %}0{% endif %}</span>
+<span>{% if item.miles_pounds %}£{{ item.miles_pounds | format_currency }}{% endif %}</span>
+<span>{% if item.job_pounds %}£{{ item.job_pounds | format_currency }}{% endif %}</span>
+<span>{% if item.total %}£{{ item.total | format_currency }}{% endif %}</span>
+</div>
+{% endif %}
+{% endfor %}
+"""
+
+
+def _invoice(n_items):
+    df = pd.DataFrame({
+        "Start Date": [f"{1 + i % 28:02d}/07/2025" for i in range(n_items)],
+        "Record ID": [f"{5000000 + i}.0" if i % 4 == 0 else str(5000000 + i) for i in range(n_items)],
+        "Pas Number": [f"{i:06d}" for i in range(n_items)],
+        "From Postcode": ["E1 1AA"] * n_items,
+        "To Postcode": ["SE3 9BY"] * n_items,
+        "Actual Mileage": ["" if i % 5 == 0 else f"{i % 30}.5" for i in range(n_items)],
+        "Forename": ["Ann"] * n_items,
+        "Surname": ["Smith"] * n_items,
+    })
+    invoice_data = DataScraper.transform_dataframe_to_invoice_data(df)
+    items = invoice_data["invoice"]["items"]
+    for i, item in enumerate(items):
+        item.update(charged="" if i % 3 else "10", wait_pounds="2.5" if i % 6 == 0 else "", total=f"{i * 1.5:.2f}")
+    # Rows the export left empty are skipped
+    items[10:10] = [{"date": "", "our_ref": "nan"}, {"date": "nan", "our_ref": " "}]
+    return invoice_data
+
+
+def _line_item_texts(html):
+    soup = BeautifulSoup(html, "html.parser")
+    return [[" ".join(span.get_text().split()) for span in item.find_all("span")]
+            for item in soup.select(".invoice-line-item")]
+
+
+@pytest.fixture(autouse=True)
+def no_render_cache(monkeypatch):
+    monkeypatch.setattr(config, "RENDER_CACHE_MAX_BYTES", 0)
+
+
+@pytest.mark.parametrize("n_items", [1, 13, 14, 27, 28, 60])
+def test_line_items_match_previous_template(n_items):
+    invoice_data = _invoice(n_items)
+    html = render_invoice_html(invoice_data, embed_image=False)
+    previous = get_jinja_env().from_string(PREVIOUS_ITEMS).render(data=invoice_data)
+
+    rows = _line_item_texts(html)
+    assert len(rows) == n_items
+    assert rows == _line_item_texts(previous)
+    assert parse_html_invoice(html)["invoice"]["items"]
+
+
+@pytest.mark.parametrize("n_items, sizes", [
+    (0, [0]), (1, [1]), (13, [13]), (14, [13, 1]), (27, [13, 14]), (28, [13, 14, 1]), (60, [13, 14, 14, 14, 5]),
+])
+def test_page_sizes_and_repeated_headings(n_items, sizes):
+    invoice_data = _invoice(n_items) if n_items else {"invoice": {"items": []}}
+    pages = paginate_line_items(invoice_data["invoice"]["items"], 13, 14)
+    assert [len(page) for page in pages] == sizes
+    if n_items:
+        html = render_invoice_html(invoice_data, embed_image=False)
+        assert len(BeautifulSoup(html, "html.parser").select(".repeating-header-grid")) == len(sizes) - 1
+
+
+def test_page_sizes_follow_config(monkeypatch):
+    monkeypatch.setattr(config, "INVOICE_FIRST_PAGE_ROWS", 5)
+    monkeypatch.setattr(config, "INVOICE_ROWS_PER_PAGE", 10)
+    assert [len(page) for page in paginate_line_items(_invoice(26)["invoice"]["items"])] == [5, 10, 10, 1]
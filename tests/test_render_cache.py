@@ -0,0 +1,98 @@
+"""Cached invoice renders equal fresh ones, and the key follows everything a render depends on."""
+
+import shutil
+
+import pandas as pd
+import pytest
+
+import config
+import DataScraper
+import render_cache
+from services import invoice_service
+from services.invoice_service import render_invoice_html
+
+
+def _invoice(n_items=30, number="INV-1"):
+    df = pd.DataFrame({
+        "Start Date": ["01/07/2025"] * n_items,
+        "Record ID": [str(5000000 + i) for i in range(n_items)],
+        "From Postcode": ["E1 1AA"] * n_items,
+        "To Postcode": ["SE3 9BY"] * n_items,
+        "Actual Mileage": ["12.5"] * n_items,
+        "Forename": ["Ann"] * n_items,
+        "Surname": ["Smith"] * n_items,
+    })
+    invoice_data = DataScraper.transform_dataframe_to_invoice_data(df)
+    invoice_data["invoice"].update(number=number, date="2025-07-31")
+    for item in invoice_data["invoice"]["items"]:
+        item.update(charged="10.00", total="20.00")
+    return invoice_data
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "RENDER_CACHE_DIR", str(tmp_path / "render_cache"))
+    monkeypatch.setattr(config, "RENDER_CACHE_MAX_BYTES", 64 * 1024 ** 2)
+    monkeypatch.setattr(render_cache, "_estimated_bytes", None)
+    return tmp_path / "render_cache"
+
+
+def _key(invoice, template_name=config.INVOICE_TEMPLATE_STYLE1, embed_image=True, asset_dir=None):
+    return invoice_service._render_key(invoice, template_name, embed_image, asset_dir)
+
+
+@pytest.mark.parametrize("template_name", [config.INVOICE_TEMPLATE_STYLE1, config.INVOICE_TEMPLATE_STYLE2])
+@pytest.mark.parametrize("embed_image, asset_dir", [(True, None), (False, None), (False, "assets")])
+def test_cached_render_equals_uncached(cache_dir, monkeypatch, template_name, embed_image, asset_dir):
+    invoice = _invoice()
+    first = render_invoice_html(invoice, template_name, embed_image, asset_dir)
+    assert render_cache.get(_key(invoice, template_name, embed_image, asset_dir)) == first
+    assert render_invoice_html(invoice, template_name, embed_image, asset_dir) == first
+
+    monkeypatch.setattr(config, "RENDER_CACHE_MAX_BYTES", 0)
+    assert not render_cache.enabled()
+    assert render_invoice_html(invoice, template_name, embed_image, asset_dir) == first
+
+
+def test_key_changes_with_data_and_options(cache_dir):
+    invoice = _invoice()
+    keys = {
+        _key(invoice),
+        _key(_invoice(number="INV-2")),
+        _key(_invoice(n_items=29)),
+        _key(invoice, config.INVOICE_TEMPLATE_STYLE2),
+        _key(invoice, embed_image=False),
+        _key(invoice, embed_image=False, asset_dir="assets"),
+        _key(invoice, embed_image=False, asset_dir="other"),
+    }
+    assert len(keys) == 7
+    assert _key(_invoice()) == _key(invoice)
+
+
+def test_key_changes_with_pagination_and_code_version(cache_dir, monkeypatch):
+    key = _key(_invoice())
+    monkeypatch.setattr(config, "INVOICE_ROWS_PER_PAGE", config.INVOICE_ROWS_PER_PAGE + 1)
+    paginated = _key(_invoice())
+    monkeypatch.setattr(render_cache, "KEY_VERSION", "0" * 16)
+    assert len({key, paginated, _key(_invoice())}) == 3
+
+    monkeypatch.setattr(render_cache, "KEY_EPOCH", render_cache.KEY_EPOCH + 1)
+    assert render_cache._code_version() != render_cache.KEY_VERSION
+
+
+def test_key_changes_with_template_content(cache_dir, tmp_path, monkeypatch):
+    templates = tmp_path / "templates"
+    shutil.copytree(config.BASE_DIR / config.TEMPLATES_DIR, templates)
+    monkeypatch.setattr(config, "TEMPLATES_DIR", str(templates))
+    monkeypatch.setattr(invoice_service, "_jinja_env", None)
+    invoice = _invoice()
+    key = _key(invoice)
+    before = render_invoice_html(invoice)
+
+    template = templates / config.INVOICE_TEMPLATE_STYLE1
+    template.write_text(template.read_text(encoding="utf-8").replace("</body>", "<!-- edited --></body>"),
+                        encoding="utf-8")
+    monkeypatch.setattr(invoice_service, "_jinja_env", None)
+    assert _key(invoice) != key
+    after = render_invoice_html(invoice)
+    assert after != before and "<!-- edited -->" in after
@@ -0,0 +1,28 @@
+"""Reaper stats report the caller's own usage and totals, never other users'."""
+
+import pytest
+
+import config
+import session_reaper
+import session_registry
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "SESSION_REGISTRY_PATH", str(tmp_path / "registry.sqlite3"))
+    for n, (owner, size) in enumerate([("alice", 100), ("alice", 50), ("bob", 4000)]):
+        session_id = str(n) * 32
+        session_registry.register_session(session_id, "batch", str(tmp_path / session_id), owner)
+        session_registry.set_session_size(session_id, size, 0.0)
+
+
+def test_usage_is_scoped_to_caller(registry):
+    usage = session_reaper.get_stats("alice")["usage"]
+    assert (usage["sessions"], usage["bytes"]) == (3, 4150)
+    assert (usage["own_sessions"], usage["own_bytes"]) == (2, 150)
+    assert "bob" not in repr(session_reaper.get_stats("alice"))
+
+
+def test_usage_without_caller_has_totals_only(registry):
+    usage = session_reaper.get_stats()["usage"]
+    assert (usage["sessions"], usage["own_sessions"], usage["own_bytes"]) == (3, 0, 0)
@@ -0,0 +1,70 @@
+"""The session registry upgrades older databases in place."""
+
+import sqlite3
+
+import pytest
+
+import config
+import session_registry
+
+V1 = """
+CREATE TABLE sessions (session_id TEXT PRIMARY KEY, kind TEXT NOT NULL, path TEXT NOT NULL, created_at REAL NOT NULL);
+CREATE TABLE invoices (invoice_id TEXT PRIMARY KEY, session_id TEXT NOT NULL);
+CREATE INDEX invoices_by_session ON invoices (session_id);
+"""
+
+V2 = """
+CREATE TABLE sessions (
+    session_id TEXT PRIMARY KEY, kind TEXT NOT NULL, path TEXT NOT NULL, owner TEXT,
+    created_at REAL NOT NULL, last_access REAL NOT NULL, bytes INTEGER, measured_at REAL
+);
+CREATE TABLE invoices (invoice_id TEXT PRIMARY KEY, session_id TEXT NOT NULL);
+CREATE INDEX invoices_by_session ON invoices (session_id);
+CREATE TABLE leases (
+    lease_id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, pid INTEGER NOT NULL, expires_at REAL NOT NULL
+);
+CREATE TABLE stats (key TEXT PRIMARY KEY, value REAL NOT NULL);
+"""
+
+SESSION = "a" * 32
+INVOICES = ["c" * 32, "b" * 32, "d" * 32]  # registration order, not sorted
+
+
+@pytest.fixture
+def registry_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "registry.sqlite3")
+    monkeypatch.setattr(config, "SESSION_REGISTRY_PATH", path)
+    return path
+
+
+def _write(path, schema, version, session_row, extra=()):
+    conn = sqlite3.connect(path)
+    conn.executescript(schema)
+    conn.execute(f"INSERT INTO sessions VALUES ({', '.join('?' * len(session_row))})", session_row)
+    conn.executemany("INSERT INTO invoices VALUES (?, ?)", [(i, SESSION) for i in INVOICES])
+    for statement, args in extra:
+        conn.execute(statement, args)
+    conn.execute(f"PRAGMA user_version = {version}")
+    conn.commit()
+    conn.close()
+
+
+def test_upgrade_from_v1_keeps_sessions_and_invoice_order(registry_file):
+    _write(registry_file, V1, 1, (SESSION, "batch", "/tmp/batch", 100.0))
+    assert session_registry.list_invoices(SESSION) == INVOICES
+    (session,) = session_registry.list_sessions()
+    assert session["last_access"] == 100.0 and session["owner"] is None
+
+
+def test_upgrade_from_v2_keeps_owners_and_stats(registry_file):
+    _write(
+        registry_file, V2, 2, (SESSION, "batch", "/tmp/batch", "alice", 100.0, 200.0, 4096, 150.0),
+        [("INSERT INTO stats VALUES (?, ?)", ("reaper.removed.expired", 7.0))],
+    )
+    assert session_registry.list_invoices(SESSION) == INVOICES
+    (session,) = session_registry.list_sessions()
+    assert (session["owner"], session["bytes"]) == ("alice", 4096)
+    assert session_registry.get_stats("reaper.") == {"removed.expired": 7.0}
+
+    session_registry.register_invoice("e" * 32, SESSION)
+    assert session_registry.list_invoices(SESSION) == INVOICES + ["e" * 32]
@@ -0,0 +1,64 @@
+"""Invoice state stores: legacy pickles are migrated, documents are replaced atomically."""
+
+import os
+import pickle
+from datetime import date
+
+import pytest
+
+import config
+import session_store
+from session_store import FilesystemStore, SqliteStore, migrate_legacy_invoices
+
+INVOICE = {
+    "invoice": {"number": "INV-1", "date": date(2025, 7, 1), "items": [{"ref": "A1", "miles": 12.5}]},
+    "financial": {"total": 42.0},
+}
+
+
+@pytest.fixture(params=["filesystem", "sqlite"])
+def store(request, tmp_path):
+    return FilesystemStore() if request.param == "filesystem" else SqliteStore(str(tmp_path / "store.sqlite3"))
+
+
+@pytest.fixture
+def temp_dir(tmp_path, monkeypatch):
+    temp_dir = tmp_path / "temp"
+    temp_dir.mkdir()
+    monkeypatch.setattr(config, "TEMP_DIR", str(temp_dir))
+    return temp_dir
+
+
+def test_legacy_pickles_are_migrated(store, temp_dir):
+    session_dir = temp_dir / f"batch_{'a' * 32}_x1"
+    session_dir.mkdir()
+    invoice_id = "b" * 32
+    with open(session_dir / f"{invoice_id}_invoice_data.pkl", "wb") as f:
+        pickle.dump(INVOICE, f)
+    (session_dir / f"{invoice_id}_source_filename.txt").write_text("Ward_7.csv", encoding="utf-8")
+    (session_dir / f"summary_mapping_{invoice_id}.json").write_text('{"Ref": "Record ID"}', encoding="utf-8")
+    (session_dir / f"{'c' * 32}_invoice_data.pkl").write_bytes(b"not a pickle")
+
+    assert migrate_legacy_invoices(store) == {"migrated": 1, "dropped": 1}
+
+    state = store.load_state(str(session_dir), invoice_id)
+    assert state.invoice_data == INVOICE
+    assert state.source_filename == "Ward_7.csv"
+    assert state.summary_mapping == {"Ref": "Record ID"}
+    assert not [name for name in os.listdir(session_dir) if name.endswith(".pkl")]
+    assert migrate_legacy_invoices(store) == {"migrated": 0, "dropped": 0}
+
+
+def test_filesystem_save_replaces_atomically(tmp_path, monkeypatch):
+    store = FilesystemStore()
+    invoice_id = "d" * 32
+    store.save_invoice(str(tmp_path), invoice_id, INVOICE)
+
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(session_store.os, "replace", fail)
+    with pytest.raises(OSError):
+        store.save_invoice(str(tmp_path), invoice_id, {**INVOICE, "financial": {"total": 0.0}})
+    assert store.load_invoice(str(tmp_path), invoice_id) == INVOICE
+    assert sorted(os.listdir(tmp_path)) == [f"{invoice_id}_invoice_data.bin"]
@@ -0,0 +1,103 @@
+"""Streaming XLSX conversion writes the same bytes as ``read_excel`` + ``to_csv``."""
+
+import filecmp
+import os
+from datetime import datetime, time, timedelta
+
+import pandas as pd
+import pytest
+
+import xslx_to_csv
+from xslx_to_csv import ENGINES, engine_available, xlsx_to_csv
+
+openpyxl = pytest.importorskip("openpyxl")
+
+ENGINES_INSTALLED = [engine for engine in ENGINES if engine_available(engine)]
+
+
+def _mixed_rows(n_rows):
+    """Rows whose column types only settle late in the sheet."""
+    base = datetime(2025, 7, 1)
+    yield ["Int", "IntThenBlank", "Float", "Code", "TextThenNumber", "Date", "DateThenTime",
+           "Flag", "FlagText", "IntThenNA", "IntThenText", "Error", None, "Code", "Time", "Ragged"]
+    for i in range(n_rows):
+        late = i > n_rows * 3 // 4
+        row = [
+            i,
+            None if late and i % 7 == 0 else i * 3,
+            i / 8 + 0.01,
+            f"{i % 1000:05d}",
+            "A12" if not late else str(i),
+            base + timedelta(days=i % 400),
+            base + timedelta(days=i % 30, hours=(i % 5) if late else 0),
+            i % 3 == 0,
+            "TRUE" if i % 2 else "False",
+            "NA" if late and i % 11 == 0 else i,
+            i if not late else f"x{i}",
+            "#N/A" if i % 13 == 0 else i,
+            None,
+            f"B{i % 40}",
+            time(i % 24, i % 60),
+        ]
+        if i % 5:
+            row.append("tail")
+        yield row
+    yield []
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    path = tmp_path / "export.xlsx"
+    book = openpyxl.Workbook()
+    book.active.title = "Mixed"
+    for row in _mixed_rows(120):
+        book.active.append(row)
+    small = book.create_sheet("Small")
+    small.append(["Ref", "Miles", "When"])
+    small.append([1, 2.5, datetime(2025, 1, 2)])
+    small.append(["x", None, datetime(2025, 1, 3, 9, 30)])
+    book.save(path)
+    return str(path)
+
+
+def _convert(workbook, out_dir, mode, engine):
+    return {os.path.basename(path): path for path, _rows in
+            xlsx_to_csv(workbook, str(out_dir), mode=mode, engine=engine)}
+
+
+@pytest.mark.parametrize("engine", ENGINES_INSTALLED)
+@pytest.mark.parametrize("chunk_cells", [100_000, 64])
+def test_streaming_matches_pandas(workbook, tmp_path, monkeypatch, engine, chunk_cells):
+    # 64 cells: four-row blocks, so the mixed sheet streams through many of them
+    monkeypatch.setattr(xslx_to_csv, "_CSV_CHUNK_CELLS", chunk_cells)
+    expected = _convert(workbook, tmp_path / "pandas", "pandas", engine)
+    streamed = _convert(workbook, tmp_path / "streaming", "streaming", engine)
+    assert sorted(streamed) == sorted(expected) == ["export_Mixed.csv", "export_Small.csv"]
+    for name, path in expected.items():
+        assert filecmp.cmp(streamed[name], path, shallow=False), name
+
+
+@pytest.mark.parametrize("engine", ENGINES_INSTALLED)
+def test_streaming_matches_read_excel_to_csv(workbook, tmp_path, engine):
+    streamed = _convert(workbook, tmp_path, "streaming", engine)
+    for sheet in ("Mixed", "Small"):
+        expected = pd.read_excel(workbook, sheet_name=sheet, engine=engine).to_csv(index=False)
+        with open(streamed[f"export_{sheet}.csv"], encoding="utf-8", newline="") as f:
+            assert f.read() == expected, sheet
+
+
+@pytest.mark.parametrize("mode", ["streaming", "pandas"])
+def test_colliding_sheet_names_get_suffixes(tmp_path, mode):
+    path = tmp_path / "export.xlsx"
+    book = openpyxl.Workbook()
+    for n, title in enumerate(["Q1.Q2", "Q1Q2", "Q1+Q2"]):
+        sheet = book.active if n == 0 else book.create_sheet(title)
+        sheet.title = title
+        sheet.append(["Sheet"])
+        sheet.append([n])
+    book.save(path)
+
+    written = _convert(str(path), tmp_path, mode, "openpyxl")
+    assert sorted(written) == ["export_Q1Q2.csv", "export_Q1Q2_2.csv", "export_Q1Q2_3.csv"]
+    for n, name in enumerate(["export_Q1Q2.csv", "export_Q1Q2_2.csv", "export_Q1Q2_3.csv"]):
+        assert pd.read_csv(written[name])["Sheet"].tolist() == [n]
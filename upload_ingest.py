@@ -0,0 +1,257 @@
+"""
+Streaming ingest of multipart uploads.
+
+Upload routes take their form through the :func:`upload_form` dependency
+instead of ``UploadFile``/``Form`` parameters.  The request body is parsed
+as it arrives: every file part is written to ``config.UPLOAD_STAGING_DIR``
+(``temp/.incoming``) with aiofiles and hashed on the way, so the event loop
+never blocks on a large upload, and ``UPLOAD_MAX_FILE_MB`` /
+``UPLOAD_MAX_REQUEST_MB`` are enforced while streaming (413) rather than
+after the whole body has been spooled.
+
+Routes then :meth:`StagedFile.move_to` each file into their session
+directory: the staged file is renamed into place and shared through
+:mod:`blob_store` with the hash already taken — no second copy or read.
+Whatever a route does not move is deleted once the response has been sent.
+"""
+
+import hashlib
+import logging
+import os
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+import aiofiles
+import aiofiles.os
+from fastapi import Depends, HTTPException, Request
+
+import blob_store
+import config
+from dependencies import require_auth
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+    from python_multipart.exceptions import FormParserError
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+    from multipart.exceptions import FormParserError
+
+logger = logging.getLogger(__name__)
+
+MAX_FIELD_BYTES = 1024 * 1024
+
+
+@dataclass
+class StagedFile:
+    """An uploaded file, written and hashed; in the staging directory until moved."""
+
+    field_name: str
+    filename: str
+    content_type: str
+    path: str
+    size: int = 0
+    sha256: str = ""
+    moved: bool = False
+
+    def move_to(self, dest: str) -> str:
+        """Move the file to *dest* (through the blob store); return its SHA-256."""
+        blob_store.place(self.path, dest, self.sha256)
+        self.path = dest
+        self.moved = True
+        return self.sha256
+
+    async def read(self) -> bytes:
+        """Return the whole file (for small uploads kept in memory, e.g. templates)."""
+        async with aiofiles.open(self.path, "rb") as f:
+            return await f.read()
+
+
+class UploadForm:
+    """The fields and files of a multipart request, as :func:`read_form` streamed them."""
+
+    def __init__(self):
+        self.fields: dict[str, list[str]] = {}
+        self.uploads: dict[str, list[StagedFile]] = {}
+
+    def field(self, name: str, default: Optional[str] = ...) -> Optional[str]:
+        """Return form field *name*; 422 if it is missing and has no default."""
+        values = self.fields.get(name)
+        if values:
+            return values[0]
+        if default is not ...:
+            return default
+        raise HTTPException(status_code=422, detail=f"Missing form field '{name}'")
+
+    def file(self, name: str = "file") -> StagedFile:
+        """Return the file uploaded as *name*; 422 if there is none."""
+        return self.files(name)[0]
+
+    def files(self, name: str = "files") -> list[StagedFile]:
+        """Return every file uploaded as *name*, in request order; 422 if there are none."""
+        files = self.uploads.get(name)
+        if not files:
+            raise HTTPException(status_code=422, detail=f"Missing file field '{name}'")
+        return files
+
+    async def discard(self) -> None:
+        """Delete the staged files no route moved into a session."""
+        for files in self.uploads.values():
+            for staged in files:
+                if not staged.moved:
+                    try:
+                        await aiofiles.os.remove(staged.path)
+                    except FileNotFoundError:
+                        pass
+
+
+def _limit(megabytes: int) -> Optional[int]:
+    return megabytes * 1024 * 1024 if megabytes else None
+
+
+class _TooLarge(Exception):
+    pass
+
+
+async def read_form(request: Request) -> UploadForm:
+    """Stream the multipart body of *request* to the staging directory.
+
+    Raises 400 for a malformed body and 413 once a file or the request goes
+    over its limit; files written so far are removed in both cases.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type == b"application/x-www-form-urlencoded":
+        # No files to stream; Starlette's parser caps the fields
+        form = UploadForm()
+        for name, value in (await request.form()).multi_items():
+            form.fields.setdefault(name, []).append(value)
+        return form
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+    charset = params.get(b"charset", b"utf-8").decode("latin-1")
+
+    max_file = _limit(config.UPLOAD_MAX_FILE_MB)
+    max_request = _limit(config.UPLOAD_MAX_REQUEST_MB)
+    declared = request.headers.get("content-length")
+    if max_request and declared and declared.isdigit() and int(declared) > max_request:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {config.UPLOAD_MAX_REQUEST_MB} MB")
+
+    os.makedirs(config.UPLOAD_STAGING_DIR, exist_ok=True)
+    form = UploadForm()
+    # Parser callbacks are synchronous: they queue work the loop below awaits
+    part: dict = {}
+    pending: list = []
+    header = {"name": b"", "value": b""}
+
+    def on_part_begin():
+        part.clear()
+        part.update(headers={}, data=bytearray(), staged=None)
+
+    def on_header_field(data, start, end):
+        header["name"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        header["value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"][header["name"].lower()] = header["value"]
+        header["name"] = header["value"] = b""
+
+    def on_headers_finished():
+        _disposition, options = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        if b"name" not in options:
+            raise FormParserError('The Content-Disposition header field "name" must be provided')
+        part["name"] = options[b"name"].decode(charset, errors="replace")
+        if b"filename" in options:
+            staged = StagedFile(
+                field_name=part["name"],
+                filename=options[b"filename"].decode(charset, errors="replace"),
+                content_type=part["headers"].get(b"content-type", b"").decode("latin-1"),
+                path=os.path.join(config.UPLOAD_STAGING_DIR, f"{os.urandom(16).hex()}.part"),
+            )
+            part["staged"] = staged
+            form.uploads.setdefault(staged.field_name, []).append(staged)
+            pending.append(("open", staged, None))
+
+    def on_part_data(data, start, end):
+        chunk = data[start:end]
+        if part["staged"] is None:
+            if len(part["data"]) + len(chunk) > MAX_FIELD_BYTES:
+                raise _TooLarge(f"Form field '{part['name']}' exceeds {MAX_FIELD_BYTES // 1024} KB")
+            part["data"] += chunk
+        else:
+            pending.append(("write", part["staged"], chunk))
+
+    def on_part_end():
+        if part["staged"] is None:
+            form.fields.setdefault(part["name"], []).append(part["data"].decode(charset, errors="replace"))
+        else:
+            pending.append(("close", part["staged"], None))
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    out = None
+    digest = None
+    received = 0
+    try:
+        async for body in request.stream():
+            received += len(body)
+            if max_request and received > max_request:
+                raise _TooLarge(f"Upload exceeds {config.UPLOAD_MAX_REQUEST_MB} MB")
+            parser.write(body)
+            for action, staged, chunk in pending:
+                if action == "open":
+                    out = await aiofiles.open(staged.path, "wb")
+                    digest = hashlib.sha256()
+                elif action == "write":
+                    staged.size += len(chunk)
+                    if max_file and staged.size > max_file:
+                        raise _TooLarge(f"File {staged.filename} exceeds {config.UPLOAD_MAX_FILE_MB} MB")
+                    digest.update(chunk)
+                    await out.write(chunk)
+                else:
+                    await out.close()
+                    out = None
+                    staged.sha256 = digest.hexdigest()
+            pending.clear()
+        parser.finalize()
+    except _TooLarge as e:
+        await _abandon(form, out)
+        raise HTTPException(status_code=413, detail=str(e))
+    except FormParserError as e:
+        await _abandon(form, out)
+        raise HTTPException(status_code=400, detail=f"Invalid multipart upload: {e}")
+    except BaseException:
+        await _abandon(form, out)
+        raise
+
+    if out is not None or any(not s.sha256 for files in form.uploads.values() for s in files):
+        await _abandon(form, out)
+        raise HTTPException(status_code=400, detail="Invalid multipart upload: body ended inside a file")
+    return form
+
+
+async def _abandon(form: UploadForm, out) -> None:
+    if out is not None:
+        await out.close()
+    await form.discard()
+
+
+async def upload_form(request: Request, current_user: str = Depends(require_auth)) -> AsyncIterator[UploadForm]:
+    """FastAPI dependency: the streamed form of an (authenticated) upload request.
+
+    Authentication runs first, so anonymous bodies are never read.  Staged
+    files still unmoved after the response are deleted.
+    """
+    form = await read_form(request)
+    try:
+        yield form
+    finally:
+        await form.discard()
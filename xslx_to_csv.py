@@ -1,14 +1,496 @@
+"""
+XLSX -> CSV conversion, one CSV per worksheet.
+
+Two modes (``config.XLSX_CONVERT_MODE``):
+
+* ``"pandas"`` reads each sheet into a DataFrame with ``pd.read_excel`` and
+  writes it with ``to_csv``.  Memory grows with the sheet — a 400k-row
+  export needs several GB.
+* ``"streaming"`` (default) reads rows one at a time and writes the CSV a
+  block at a time, so memory stays bounded by the block size whatever the
+  sheet size.
+
+and two reader engines (``config.XLSX_READER_ENGINE``):
+
+* ``"calamine"`` — the Rust reader from ``python-calamine``, several times
+  faster than openpyxl and also reads .xls.  It loads a sheet's cells into
+  compact native memory before rows are handed out.
+* ``"openpyxl"`` — read-only openpyxl, always available for .xlsx/.xlsm.
+  Old .xls files without calamine go through pandas' default reader (xlrd).
+
+``"auto"`` keeps streaming bounded: it reads .xlsx/.xlsm with openpyxl in
+streaming mode and prefers calamine in pandas mode (which holds the whole
+sheet anyway) and for .xls.
+
+Streaming produces byte-identical files.  It makes two passes over a sheet:
+the first reads the worksheet, spools the rows to a temporary file and
+records, per column, one example value of every kind it holds (int, float,
+numeric string, NA marker, text, date, ...); the second feeds
+blocks of rows through the same pandas parser ``read_excel`` uses, with the
+sheet's first row and those examples appended so that each block is given
+the dtype the whole column would get.  Both modes write with an explicit
+``to_csv`` ``chunksize`` (:func:`_write_csv`), and streaming blocks are
+those chunks, so per-chunk formatting (dates-only columns) comes out the same.
+
+The type inference is pandas' own (``TextParser``, which ``read_excel`` runs
+on the cells), not a public API: requirements.txt pins pandas to the
+versions ``tests/test_xslx_to_csv.py`` checks byte for byte.
+"""
+
+import importlib.util
 import logging
 import os
+import pickle
+import re
 import sys
+import tempfile
+import zipfile
+from datetime import date, datetime
+from itertools import zip_longest
 from pathlib import Path
 
 import pandas as pd
+from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+from pandas.errors import EmptyDataError
+from pandas.io.parsers import TextParser
+
+import blob_store
+import config
 
 logger = logging.getLogger(__name__)
 
+ENGINES = ("calamine", "openpyxl")
+
+# Formats openpyxl can read; anything else (.xls) needs calamine or xlrd.
+OPENPYXL_EXTENSIONS = (".xlsx", ".xlsm")
+
+# Both modes write CSVs in to_csv chunks of about this many cells; dates-only
+# columns are detected per chunk, and streamed blocks are these chunks.
+_CSV_CHUNK_CELLS = 100_000
+
+# Rows per pickled batch in the spool file between the two passes.
+_SPOOL_ROWS = 2_000
+
+# Strings pandas treats as NA / booleans by default.
+_NA_STRINGS = frozenset({
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND",
+    "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+})
+_BOOL_STRINGS = frozenset({"True", "TRUE", "true", "False", "FALSE", "false"})
+
+# Strings pandas parses as numbers (it skips ASCII whitespace around them).
+_WS = r"[ \t\n\r\f\v]*"
+_INT_STRING = re.compile(_WS + r"[+-]?[0-9]+" + _WS)
+_FLOAT_STRING = re.compile(
+    _WS + r"[+-]?(?:(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?|(?i:inf(?:inity)?))" + _WS
+)
+
+_INT64_MIN, _INT64_MAX, _UINT64_MAX = -2 ** 63, 2 ** 63 - 1, 2 ** 64 - 1
+
+_MISSING = object()  # cell beyond the end of a short row (padding is handled separately)
+
+
+def _convert_cell(cell):
+    """Cell value as pandas' openpyxl reader returns it."""
+    if cell.value is None:
+        return ""
+    if cell.data_type == TYPE_ERROR:
+        return float("nan")
+    if cell.data_type == TYPE_NUMERIC:
+        value = int(cell.value)
+        if value == cell.value:
+            return value
+        return float(cell.value)
+    return cell.value
+
+
+def _int_kind(value: int) -> tuple:
+    # int64 vs uint64 vs overflow, and the sign, change what dtype a column gets.
+    size = 0 if _INT64_MIN <= value <= _INT64_MAX else 1 if 0 <= value <= _UINT64_MAX else 2
+    return value < 0, size
+
+
+def _value_kind(value) -> tuple:
+    """Group values that pandas' type inference treats alike."""
+    if isinstance(value, str):
+        if value in _NA_STRINGS:
+            return ("na",)
+        if value in _BOOL_STRINGS:
+            return ("bool-str",)
+        if _INT_STRING.fullmatch(value):
+            return ("int-str",) + _int_kind(int(value))
+        if _FLOAT_STRING.fullmatch(value):
+            return ("float-str",)
+        return ("str",)
+    if isinstance(value, bool):
+        return ("bool",)
+    if isinstance(value, int):
+        return ("int",) + _int_kind(value)
+    if isinstance(value, float):
+        return ("nan",) if value != value else ("float",)
+    return (type(value).__name__,)
+
+
+def _openpyxl_rows(sheet):
+    """Yield each row's converted values with trailing empty cells removed."""
+    sheet.reset_dimensions()
+    for row in sheet.rows:
+        values = [_convert_cell(cell) for cell in row]
+        while values and values[-1] == "":
+            values.pop()
+        yield values
+
+
+def _openpyxl_sheets(xlsx_file_path: str, only=None):
+    """Yield ``(sheet_name, rows)`` for each worksheet (or just *only*), read with openpyxl."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(xlsx_file_path, read_only=True, data_only=True, keep_links=False)
+    try:
+        for sheet in workbook.worksheets:
+            if only is None or sheet.title == only:
+                yield sheet.title, _openpyxl_rows(sheet)
+    finally:
+        workbook.close()
+
+
+def _convert_calamine_value(value):
+    """Cell value as pandas' calamine reader returns it."""
+    if isinstance(value, float):
+        as_int = int(value)
+        return as_int if as_int == value else value
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime(value.year, value.month, value.day)
+    return value
 
-def xlsx_to_csv(xlsx_file_path, output_dir=None):
+
+def _calamine_rows(sheet):
+    # iter_rows() starts at the first used column; pandas reads from column A.
+    lead = [""] * sheet.start[1] if sheet.start else []
+    for row in sheet.iter_rows():
+        values = lead + [_convert_calamine_value(value) for value in row]
+        while values and values[-1] == "":
+            values.pop()
+        yield values
+
+
+def _calamine_sheets(xlsx_file_path: str, only=None):
+    """Yield ``(sheet_name, rows)`` for each worksheet (or just *only*), read with calamine."""
+    from python_calamine import CalamineError, CalamineWorkbook, SheetTypeEnum
+
+    try:
+        workbook = CalamineWorkbook.from_path(xlsx_file_path)
+    except CalamineError as e:
+        raise ValueError(str(e)) from e
+    try:
+        for sheet in workbook.sheets_metadata:
+            if sheet.typ == SheetTypeEnum.WorkSheet and (only is None or sheet.name == only):
+                try:
+                    rows = _calamine_rows(workbook.get_sheet_by_name(sheet.name))
+                except CalamineError as e:
+                    raise ValueError(f"{e} (sheet: {sheet.name})") from e
+                yield sheet.name, rows
+    finally:
+        workbook.close()
+
+
+_SHEET_READERS = {"calamine": _calamine_sheets, "openpyxl": _openpyxl_sheets}
+
+
+def engine_available(engine: str) -> bool:
+    """Return whether the reader package behind *engine* is installed."""
+    module = {"calamine": "python_calamine", "openpyxl": "openpyxl"}[engine]
+    return importlib.util.find_spec(module) is not None
+
+
+def resolve_engine(xlsx_file_path: str, engine=None, mode=None) -> str:
+    """Return the reader engine that will convert *xlsx_file_path* in *mode*.
+
+    *engine* defaults to ``config.XLSX_READER_ENGINE`` and *mode* to
+    ``config.XLSX_CONVERT_MODE``.  ``"auto"`` — and a requested engine that is
+    not installed — picks openpyxl for .xlsx/.xlsm in streaming mode, whose
+    memory calamine would no longer bound, and otherwise the first available
+    of :data:`ENGINES`.  .xls files without calamine get ``"xlrd"``.
+    """
+    engine = (engine or config.XLSX_READER_ENGINE).lower()
+    if engine != "auto" and engine not in ENGINES:
+        raise ValueError(f"Unknown Excel reader engine {engine!r}")
+    if engine != "auto" and not engine_available(engine):
+        logger.warning("Excel reader engine %r is not installed, falling back", engine)
+        engine = "auto"
+    if engine == "auto":
+        streaming = (mode or config.XLSX_CONVERT_MODE).lower() == "streaming"
+        if streaming and xlsx_file_path.lower().endswith(OPENPYXL_EXTENSIONS):
+            engine = "openpyxl"
+        else:
+            engine = next(name for name in ENGINES if engine_available(name))
+    if engine == "openpyxl" and not xlsx_file_path.lower().endswith(OPENPYXL_EXTENSIONS):
+        engine = "xlrd"
+    return engine
+
+
+def _collect_examples(examples: list[dict], rows: list) -> None:
+    """Record in *examples* one value of each kind not seen yet, per column of *rows*."""
+    width = max(map(len, rows))
+    examples.extend({} for _ in range(width - len(examples)))
+    for column, values in zip(examples, zip_longest(*rows, fillvalue=_MISSING)):
+        by_type: dict = {}
+        # Keyed by (type, value): 1, 1.0 and True are equal but not alike.
+        for value_type, value in dict.fromkeys(zip(map(type, values), values)):
+            by_type.setdefault(value_type, []).append(value)
+        by_type.pop(object, None)
+        for value_type, group in by_type.items():
+            if value_type is int and _INT64_MIN <= min(group) and max(group) <= _INT64_MAX:
+                group = [min(group), max(group)]
+            elif value_type not in (str, int, float):
+                group = group[:1]  # kind depends on the type alone
+            for value in group:
+                column.setdefault(_value_kind(value), value)
+
+
+def _scan_sheet(rows, spool) -> dict:
+    """Read the sheet once, spooling its rows; return its shape and value examples.
+
+    Rows are pickled to *spool* in batches so the second pass does not have
+    to parse the worksheet XML again.
+    """
+    width = 0
+    n_rows = 0
+    shortest = None       # fewest cells in a data row
+    pending_blank = False  # blank rows only count once data follows them
+    examples: list[dict] = []
+    batch = []
+    data = []
+    for index, values in enumerate(rows):
+        batch.append(values)
+        if len(batch) == _SPOOL_ROWS:
+            pickle.dump(batch, spool, pickle.HIGHEST_PROTOCOL)
+            batch = []
+        if not values:
+            pending_blank = pending_blank or index > 0
+            continue
+        if pending_blank:
+            shortest, pending_blank = 0, False
+        n_rows = index + 1
+        width = max(width, len(values))
+        if index == 0:
+            continue
+        shortest = len(values) if shortest is None else min(shortest, len(values))
+        data.append(values)
+        if len(data) == _SPOOL_ROWS:
+            _collect_examples(examples, data)
+            data = []
+    if batch:
+        pickle.dump(batch, spool, pickle.HIGHEST_PROTOCOL)
+    if data:
+        _collect_examples(examples, data)
+
+    examples.extend({} for _ in range(width - len(examples)))
+    # Short rows are padded with "" up to the sheet width.
+    for column in examples[shortest if shortest is not None else width:]:
+        column.setdefault(_value_kind(""), "")
+    return {"width": width, "n_rows": n_rows, "examples": examples}
+
+
+def _spooled_rows(spool, width: int, n_rows: int):
+    """Second pass: the spooled rows, padded to *width*, without trailing blank rows."""
+    spool.seek(0)
+    remaining = n_rows
+    while remaining > 0:
+        for values in pickle.load(spool)[:remaining]:
+            yield values + [""] * (width - len(values))
+        remaining -= _SPOOL_ROWS
+
+
+def _parse(rows: list) -> pd.DataFrame:
+    """Parse sheet rows exactly as ``pd.read_excel`` does after reading the cells."""
+    try:
+        return TextParser(rows, header=0, skip_blank_lines=False).read()
+    except EmptyDataError:
+        return pd.DataFrame()
+
+
+def _sheet_to_csv_streaming(sheet_rows, csv_path: str) -> int:
+    """Write one worksheet's rows to *csv_path* in bounded memory; return the row count."""
+    with tempfile.TemporaryFile(dir=os.path.dirname(csv_path)) as spool:
+        scan = _scan_sheet(sheet_rows, spool)
+        width, n_rows = scan["width"], scan["n_rows"]
+        block_rows = _csv_chunk_rows(width)
+        rows = _spooled_rows(spool, width, n_rows)
+
+        if n_rows - 1 <= block_rows:
+            # Fits in one to_csv chunk: exactly the pandas path.
+            df = _parse(list(rows))
+            _write_csv(df, csv_path)
+            return len(df)
+
+        example_columns = [list(column.values()) for column in scan["examples"]]
+        example_rows = [
+            [column[i] if i < len(column) else column[0] for column in example_columns]
+            for i in range(max(map(len, example_columns)))
+        ]
+
+        header = next(rows)
+        first_row = None
+        written = 0
+        with open(csv_path, "w", encoding="utf-8", newline="") as out:
+            block = []
+            for row in rows:
+                if first_row is None:
+                    first_row = row
+                block.append(row)
+                if len(block) == block_rows:
+                    written += _write_block(out, header, first_row, block, example_rows)
+                    block = []
+            if block:
+                written += _write_block(out, header, first_row, block, example_rows)
+        return written
+
+
+def _write_block(out, header: list, first_row: list, block: list, example_rows: list) -> int:
+    # A column's first value decides whether pandas tries booleans, so later
+    # blocks lead with it; the examples carry every other kind of value.
+    first = block[0] is first_row
+    lead = [] if first else [first_row]
+    df = _parse([header] + lead + block + example_rows)
+    df = df.iloc[len(lead):len(lead) + len(block)]
+    _write_csv(df, out, header=first)
+    return len(df)
+
+
+def _csv_chunk_rows(width: int) -> int:
+    return (_CSV_CHUNK_CELLS // (width or 1)) or 1
+
+
+def _write_csv(df: pd.DataFrame, target, header: bool = True) -> None:
+    """Write *df* as CSV in chunks of :func:`_csv_chunk_rows` rows, the blocks streaming writes."""
+    df.to_csv(target, header=header, index=False, encoding="utf-8", chunksize=_csv_chunk_rows(len(df.columns)))
+
+
+def _convert_with_pandas(xlsx_file_path: str, output_dir: str, base_name: str, engine: str) -> list[tuple[str, int]]:
+    excel_file = pd.ExcelFile(xlsx_file_path, engine=None if engine == "xlrd" else engine)
+    sheet_names = excel_file.sheet_names
+    logger.info("Found %d sheet(s) in %s", len(sheet_names), xlsx_file_path)
+
+    written = []
+    taken = set()
+    for sheet_name in sheet_names:
+        df = pd.read_excel(excel_file, sheet_name=sheet_name)
+        csv_path = _unique_csv_path(output_dir, base_name, sheet_name, taken)
+        _write_csv(df, csv_path)
+        logger.info("Created: %s (%d rows)", csv_path, len(df))
+        written.append((csv_path, len(df)))
+    return written
+
+
+def _convert_streaming(xlsx_file_path: str, output_dir: str, base_name: str, engine: str) -> list[tuple[str, int]]:
+    written = []
+    taken = set()
+    for sheet_name, sheet_rows in _SHEET_READERS[engine](xlsx_file_path):
+        csv_path = _unique_csv_path(output_dir, base_name, sheet_name, taken)
+        rows = _sheet_to_csv_streaming(sheet_rows, csv_path)
+        logger.info("Created: %s (%d rows)", csv_path, rows)
+        written.append((csv_path, rows))
+    return written
+
+
+def _csv_filename(base_name: str, sheet_name: str) -> str:
+    safe_sheet_name = "".join(c for c in sheet_name if c.isalnum() or c in (' ', '-', '_')).strip()
+    return f"{base_name}_{safe_sheet_name}.csv"
+
+
+def _unique_csv_path(output_dir: str, base_name: str, sheet_name: str, taken: set) -> str:
+    csv_path = os.path.join(output_dir, _csv_filename(base_name, sheet_name))
+    # Sheet names that differ only in dropped characters must not share a file.
+    stem, n = csv_path[:-len(".csv")], 1
+    while csv_path in taken:
+        n += 1
+        csv_path = f"{stem}_{n}.csv"
+    taken.add(csv_path)
+    return csv_path
+
+
+def sheet_names(xlsx_file_path: str, engine: str) -> list[str]:
+    """Return the worksheet names of a workbook, in order, as *engine* reads them."""
+    try:
+        if engine == "calamine":
+            from python_calamine import CalamineError, CalamineWorkbook, SheetTypeEnum
+
+            try:
+                workbook = CalamineWorkbook.from_path(xlsx_file_path)
+            except CalamineError as e:
+                raise ValueError(str(e)) from e
+            try:
+                return [s.name for s in workbook.sheets_metadata if s.typ == SheetTypeEnum.WorkSheet]
+            finally:
+                workbook.close()
+        if engine == "openpyxl":
+            from openpyxl import load_workbook
+
+            workbook = load_workbook(xlsx_file_path, read_only=True, data_only=True, keep_links=False)
+            try:
+                return [sheet.title for sheet in workbook.worksheets]
+            finally:
+                workbook.close()
+        return pd.ExcelFile(xlsx_file_path).sheet_names
+    except (FileNotFoundError, ValueError, OSError, zipfile.BadZipFile) as e:
+        raise ValueError(f"Error processing xlsx file: {str(e)}") from e
+
+
+def convert_sheet(xlsx_file_path: str, sheet_name: str, csv_path: str, mode: str, engine: str) -> tuple[str, int, str]:
+    """Convert a single worksheet to *csv_path*; return ``(csv_path, row_count, sha256)``.
+
+    The unit of work for converting many sheets in a process pool: it takes
+    and returns only plain values, and hashes the CSV while the worker still
+    has it in the page cache.  *mode* and *engine* must already be resolved.
+    """
+    try:
+        if mode == "streaming":
+            rows = None
+            for _name, sheet_rows in _SHEET_READERS[engine](xlsx_file_path, only=sheet_name):
+                rows = _sheet_to_csv_streaming(sheet_rows, csv_path)
+            if rows is None:
+                raise ValueError(f"Worksheet named '{sheet_name}' not found")
+        else:
+            df = pd.read_excel(xlsx_file_path, sheet_name=sheet_name, engine=None if engine == "xlrd" else engine)
+            _write_csv(df, csv_path)
+            rows = len(df)
+    except (FileNotFoundError, ValueError, OSError, zipfile.BadZipFile) as e:
+        raise ValueError(f"Error processing xlsx file: {str(e)}") from e
+    logger.info("Created: %s (%d rows)", csv_path, rows)
+    return csv_path, rows, blob_store.file_sha256(csv_path)
+
+
+def resolve_mode(engine: str, mode=None) -> str:
+    """Return the conversion mode to use with *engine* (default ``config.XLSX_CONVERT_MODE``)."""
+    mode = (mode or config.XLSX_CONVERT_MODE).lower()
+    if mode not in ("streaming", "pandas"):
+        raise ValueError(f"Unknown XLSX conversion mode {mode!r}")
+    return mode if engine in _SHEET_READERS else "pandas"
+
+
+def output_dir_for(xlsx_file_path: str, output_dir=None) -> str:
+    """Return (and create) the folder named after the workbook that its CSVs go in."""
+    base_name = Path(xlsx_file_path).stem
+    if output_dir is None:
+        # Create a folder with the xlsx file name in the same directory as the xlsx file
+        output_dir = os.path.dirname(os.path.abspath(xlsx_file_path))
+    # If custom output directory is provided, still create a subfolder with the xlsx file name
+    output_dir = os.path.join(output_dir, base_name)
+    os.makedirs(output_dir, exist_ok=True)
+    return output_dir
+
+
+def csv_path_for(output_dir: str, xlsx_file_path: str, sheet_name: str, taken: set) -> str:
+    """Return the CSV path a worksheet is written to inside *output_dir*.
+
+    Paths already in *taken* get a ``_2``, ``_3``... suffix; the result is
+    added to *taken*, so pass the same set for every sheet of a workbook.
+    """
+    return _unique_csv_path(output_dir, Path(xlsx_file_path).stem, sheet_name, taken)
+
+
+def xlsx_to_csv(xlsx_file_path, output_dir=None, mode=None, engine=None):
     """
     Convert each sheet in an xlsx file to a separate CSV file.
     
@@ -16,45 +498,36 @@ def xlsx_to_csv(xlsx_file_path, output_dir=None):
         xlsx_file_path (str): Path to the input xlsx file
         output_dir (str, optional): Directory to save CSV files. 
                                    If None, saves in the same directory as the xlsx file.
+        mode (str, optional): "streaming" or "pandas"; defaults to
+                              ``config.XLSX_CONVERT_MODE``.
+        engine (str, optional): Reader engine, see :func:`resolve_engine`.
+
+    Returns:
+        list[tuple[str, int]]: ``(csv_path, row_count)`` for each sheet written.
     """
     # Validate input file exists
     if not os.path.exists(xlsx_file_path):
         raise FileNotFoundError(f"File not found: {xlsx_file_path}")
-    
-    # Get the base name of the xlsx file (without extension)
-    base_name = Path(xlsx_file_path).stem
-    
-    # Set output directory - create a folder named after the xlsx file
-    if output_dir is None:
-        # Create a folder with the xlsx file name in the same directory as the xlsx file
-        xlsx_dir = os.path.dirname(os.path.abspath(xlsx_file_path))
-        output_dir = os.path.join(xlsx_dir, base_name)
-    else:
-        # If custom output directory is provided, still create a subfolder with the xlsx file name
-        output_dir = os.path.join(output_dir, base_name)
-    
-    # Create the output directory if it doesn't exist
-    os.makedirs(output_dir, exist_ok=True)
-    
-    try:
-        excel_file = pd.ExcelFile(xlsx_file_path)
-        sheet_names = excel_file.sheet_names
 
-        logger.info("Found %d sheet(s) in %s", len(sheet_names), xlsx_file_path)
+    engine = resolve_engine(xlsx_file_path, engine, mode)
+    mode = resolve_mode(engine, mode)
 
-        for sheet_name in sheet_names:
-            df = pd.read_excel(excel_file, sheet_name=sheet_name)
+    # Get the base name of the xlsx file (without extension)
+    base_name = Path(xlsx_file_path).stem
 
-            safe_sheet_name = "".join(c for c in sheet_name if c.isalnum() or c in (' ', '-', '_')).strip()
-            csv_filename = f"{base_name}_{safe_sheet_name}.csv"
-            csv_path = os.path.join(output_dir, csv_filename)
+    # Set output directory - a folder named after the xlsx file, created if needed
+    output_dir = output_dir_for(xlsx_file_path, output_dir)
 
-            df.to_csv(csv_path, index=False, encoding='utf-8')
-            logger.info("Created: %s (%d rows)", csv_path, len(df))
+    try:
+        if mode == "streaming":
+            written = _convert_streaming(xlsx_file_path, output_dir, base_name, engine)
+        else:
+            written = _convert_with_pandas(xlsx_file_path, output_dir, base_name, engine)
 
-        logger.info("Conversion complete — %d CSV(s) in %s", len(sheet_names), output_dir)
+        logger.info("Conversion complete — %d CSV(s) in %s (%s, %s)", len(written), output_dir, mode, engine)
+        return written
 
-    except (FileNotFoundError, ValueError, OSError) as e:
+    except (FileNotFoundError, ValueError, OSError, zipfile.BadZipFile) as e:
         raise ValueError(f"Error processing xlsx file: {str(e)}") from e
 
 